@@ -1,276 +1,272 @@
 ﻿# app_playwright_update_fixed.py
-from flask import Flask, request, jsonify
+"""
+Async API server. Every request is a coroutine on one event loop that shares
+engine.Engine (warm browser pool, aiohttp session, adaptive limits) with the
+background jobs, so one process serves many concurrent extractions.
+
+Development:  python app_playwright_update.py
+Production:   gunicorn app_playwright_update:app --worker-class aiohttp.GunicornWebWorker --workers N
+              (each worker process runs its own engine, browser pool and metrics;
+              jobs live in the shared XHS_JOBS_QUEUE, so any worker answers /jobs)
+
+  XHS_HOST / XHS_PORT   bind address for `python app_playwright_update.py` (default 0.0.0.0:6000)
+"""
+import asyncio
 import os
+import time
 import uuid
-import re
-import requests
-import json
-from pathlib import Path
-from playwright.sync_api import sync_playwright, TimeoutError as PWTimeout
-
-app = Flask(__name__)
+from urllib.parse import quote
+
+from aiohttp import web
+
+import hls
+from engine import CDN_HEADERS, LIMITS, Engine, attach_debug, media_ext, new_result, sanitize_filename
+from extract_cache import get_default_cache, note_id_from_url
+from hls import is_hls_url
+from jobs import JobManager, JOB_MAX_ITEMS
+from link_source import iter_items
+from media_store import StreamHash, get_media_store
+from metrics import REGISTRY, Timings, limits_gauge, observe_result, pool_gauge, profile_if_slow
+from probe import choose_candidate, get_probe_cache
+from seekin_api import get_default_store
+from streaming import get_sink, iter_body, iter_hls, open_upstream, passthrough_headers
 
 # --- Configuration ---
-DEBUG_OUT = Path("./debug")
-DOWNLOAD_OUT = Path("./downloads")
-SEEKIN_URL = "https://www.seekin.ai/xiaohongshu-video-downloader/"
-USER_AGENT_MOBILE = "Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/604.1"
-USER_AGENT_DESKTOP = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115 Safari/537.36"
-TIMEOUT_SEC = 40
+HOST = os.environ.get("XHS_HOST", "0.0.0.0")
+PORT = int(os.environ.get("XHS_PORT", "6000"))
+LEASE_TIMEOUT = -1  # requests wait at most XHS_POOL_ACQUIRE_TIMEOUT for a browser, then get 503
+
+ENGINE = web.AppKey("engine", Engine)
+JOBS = web.AppKey("jobs", JobManager)
 
-DEBUG_OUT.mkdir(parents=True, exist_ok=True)
-DOWNLOAD_OUT.mkdir(parents=True, exist_ok=True)
 
-VIDEO_EXT_RE = re.compile(r"\.(mp4|webm|m3u8|ts)(?:\?|$)", flags=re.I)
-SANITIZE_FILENAME_RE = re.compile(r'[^A-Za-z0-9 \-_\.\(\)\[\]]+')
-JS_TITLE_RE = re.compile(r"""title\s*:\s*(['"])(.*?)\1""", flags=re.IGNORECASE | re.DOTALL)
+# --- Lifecycle ---
+async def engine_ctx(app: web.Application):
+    engine = await Engine().start()
+    app[ENGINE], app[JOBS] = engine, JobManager(engine).start()
+    yield
+    await app[JOBS].close()
+    await engine.close()
 
 
 # --- Helpers ---
-def sanitize_filename(s: str, fallback: str = "video"):
-    if not s:
-        return fallback
-    s = s.strip()
-    s = SANITIZE_FILENAME_RE.sub("_", s)
-    s = re.sub(r"_+", "_", s)
-    return s[:180].rstrip("_")
-
-
-def unique_path_for(path: Path) -> Path:
-    base, ext, parent = path.stem, path.suffix, path.parent
-    candidate, i = path, 1
-    while candidate.exists():
-        candidate = parent / f"{base}-{i}{ext}"
-        i += 1
-    return candidate
-
-
-def extract_title_from_text(text: str):
-    if not text:
+async def read_json(request: web.Request):
+    try:
+        return await request.json()
+    except ValueError:
         return None
-    m = JS_TITLE_RE.search(text)
-    if m:
-        return m.group(2).strip()
-    return None
-
 
-def try_head_size(url: str, timeout: int = 6):
-    headers = {"User-Agent": USER_AGENT_DESKTOP, "Referer": "https://www.xiaohongshu.com/"}
-    try:
-        r = requests.head(url, headers=headers, timeout=timeout, allow_redirects=True)
-        cl = r.headers.get("Content-Length")
-        if cl and cl.isdigit():
-            return int(cl)
-    except Exception:
-        pass
-    try:
-        headers_range = headers.copy()
-        headers_range["Range"] = "bytes=0-0"
-        r = requests.get(url, headers=headers_range, timeout=timeout, stream=True, allow_redirects=True)
-        cr = r.headers.get("Content-Range")
-        if cr and "/" in cr:
-            total = cr.split("/")[-1]
-            if total.isdigit():
-                return int(total)
-        cl2 = r.headers.get("Content-Length")
-        if cl2 and cl2.isdigit() and int(cl2) > 1:
-            return int(cl2)
-    except Exception:
-        pass
-    return None
-
-
-def download_stream(url: str, out_path: Path):
-    headers = {"User-Agent": USER_AGENT_DESKTOP, "Referer": "https://www.xiaohongshu.com/"}
-    try:
-        with requests.get(url, headers=headers, stream=True, timeout=0, allow_redirects=True) as r:
-            r.raise_for_status()
-            with out_path.open("wb") as fh:
-                for chunk in r.iter_content(chunk_size=1 << 14):
-                    if chunk:
-                        fh.write(chunk)
-        return True, None
-    except Exception as e:
-        return False, str(e)
 
+def error(message: str, status: int, **extra) -> web.Response:
+    return web.json_response(dict({"success": False, "error": message}, **extra), status=status)
 
-# --- Seekin extraction logic ---
-def extract_from_seekin(playwright, post_url: str, timeout: int = TIMEOUT_SEC):
-    out = {"success": False, "title": None, "candidates": [], "debug_html": None, "debug_png": None, "error": None}
-    try:
-        browser = playwright.chromium.launch(headless=True, args=['--no-sandbox', '--disable-setuid-sandbox'])
-        for ua in (USER_AGENT_MOBILE, USER_AGENT_DESKTOP):
-            context = browser.new_context(user_agent=ua, viewport={'width': 390, 'height': 844} if ua == USER_AGENT_MOBILE else {'width': 1280, 'height': 800})
-            page = context.new_page()
-            page.set_default_timeout(timeout * 1000)
 
-            def on_response(resp):
-                try:
-                    u = resp.url
-                    if u and VIDEO_EXT_RE.search(u) and u not in out["candidates"]:
-                        out["candidates"].append(u)
-
-                    ct = resp.headers.get("content-type", "") or ""
-                    if "application/json" in ct.lower():
-                        try:
-                            j = json.loads(resp.text())
-                            data = j.get("data") or j.get("result") or j.get("payload")
-                            if isinstance(data, dict):
-                                title = data.get("title") or data.get("name") or data.get("desc")
-                                if title and not out["title"]:
-                                    out["title"] = title
-                                medias = data.get("medias") or data.get("media") or data.get("urls")
-                                if isinstance(medias, list):
-                                    for m in medias:
-                                        candidate_url = None
-                                        if isinstance(m, dict):
-                                            candidate_url = m.get("url") or m.get("uri") or m.get("src") or m.get("playUrl")
-                                            if not candidate_url:
-                                                for v in m.values():
-                                                    if isinstance(v, str) and VIDEO_EXT_RE.search(v):
-                                                        candidate_url = v
-                                                        break
-                                        elif isinstance(m, str):
-                                            if VIDEO_EXT_RE.search(m):
-                                                candidate_url = m
-                                        if candidate_url and candidate_url not in out["candidates"]:
-                                            out["candidates"].append(candidate_url)
-                        except Exception:
-                            tf = extract_title_from_text(resp.text())
-                            if tf and not out["title"]:
-                                out["title"] = tf
-                    else:
-                        tf = extract_title_from_text(resp.text())
-                        if tf and not out["title"]:
-                            out["title"] = tf
-                except Exception:
-                    pass
-
-            page.on("response", on_response)
+async def _finish(resp: dict, started: float):
+    await attach_debug(resp, resp.pop("debug_future", None))
+    resp["timings"]["total"] = round(time.monotonic() - started, 3)
+    observe_result(resp)
 
-            try:
-                page.goto(SEEKIN_URL, wait_until="networkidle")
-            except PWTimeout:
-                page.goto(SEEKIN_URL)
 
-            try:
-                inp = page.query_selector('input[type="text"], input[placeholder], textarea')
-                if inp:
-                    inp.fill(post_url)
-                    btn = page.query_selector('button[type="submit"], button:has-text("解析"), button:has-text("Download"), button[class*="btn"]')
-                    if btn:
-                        try:
-                            btn.click()
-                        except Exception:
-                            page.keyboard.press("Enter")
-                    else:
-                        page.keyboard.press("Enter")
-                else:
-                    page.goto(SEEKIN_URL + "?q=" + post_url)
-            except Exception:
-                pass
-
-            waited, poll = 0.0, 0.5
-            while waited < timeout:
-                if out["candidates"] or out["title"]:
-                    break
-                page.wait_for_timeout(int(poll * 1000))
-                waited += poll
+# --- Extraction endpoints ---
+async def extract(request: web.Request) -> web.StreamResponse:
+    payload = await read_json(request)
+    if not isinstance(payload, dict) or "url" not in payload:
+        return error("missing url", 400)
 
-            try:
-                uid = uuid.uuid4().hex
-                html_path = DEBUG_OUT / f"{uid}.html"
-                png_path = DEBUG_OUT / f"{uid}.png"
-                html_path.write_text(page.content(), encoding="utf-8")
-                page.screenshot(path=str(png_path), full_page=True)
-                out["debug_html"] = str(html_path.resolve())
-                out["debug_png"] = str(png_path.resolve())
-            except Exception:
-                pass
-
-            if out["candidates"] or out["title"]:
-                out["success"] = True
-                context.close()
-                break
-
-            context.close()
-        browser.close()
-    except Exception as e:
-        out["error"] = str(e)
-    return out
+    if payload.get("mode") in ("stream", "sink"):
+        return await _stream(request, payload)
 
-
-# --- Flask endpoint ---
-@app.route("/extract", methods=["POST"])
-def extract():
-    payload = request.get_json(force=True, silent=True)
-    if not payload or "url" not in payload:
-        return jsonify({"success": False, "error": "missing url"}), 400
-
-    url = payload["url"]
     index = payload.get("index", int(uuid.uuid4().int % 1000000))
-
     try:
-        with sync_playwright() as p:
-            res = extract_from_seekin(p, url, timeout=TIMEOUT_SEC)
+        with profile_if_slow("extract"):
+            resp = await request.app[ENGINE].process(payload["url"], index, lease_timeout=LEASE_TIMEOUT)
     except Exception as e:
-        return jsonify({"success": False, "error": "playwright_failed", "detail": str(e)}), 500
-
-    resp = {
-        "success": False,
-        "postUrl": url,
-        "index": index,
-        "caption": res.get("title"),
-        "candidates": res.get("candidates", []),
-        "video_url": None,
-        "saved_to": None,
-        "error": res.get("error"),
-        "debug_html": res.get("debug_html"),
-        "debug_png": res.get("debug_png"),
-    }
-
-    candidates = res.get("candidates") or []
-    if not candidates:
-        return jsonify(resp), 200
-
-    seen, normalized = set(), []
-    for c in candidates:
-        if c and c not in seen:
-            normalized.append(c)
-            seen.add(c)
-
-    sizes = {}
-    for u in normalized:
-        if u.lower().endswith(".m3u8"):
-            sizes[u] = None
-        else:
-            sizes[u] = try_head_size(u, timeout=6)
-
-    cand_info = [{"url": u, "size_bytes": sizes.get(u)} for u in normalized]
-    resp["candidates"] = cand_info
-
-    sized_downloadables = [c for c in cand_info if c["size_bytes"] and re.search(r"\.(mp4|webm)$", c["url"], flags=re.I)]
-    chosen = min(sized_downloadables, key=lambda x: x["size_bytes"]) if sized_downloadables else (cand_info[0] if cand_info else None)
-    if not chosen:
-        resp["error"] = "no_candidate_chosen"
-        return jsonify(resp), 200
-
+        return error("extract_failed", 500, postUrl=payload["url"], detail=str(e))
+    resp["success"] = bool(resp.get("saved_to"))
+    return web.json_response(resp, status=503 if resp.get("error") == "browser_pool_busy" else 200)
+
+
+async def stream(request: web.Request) -> web.StreamResponse:
+    url = request.query.get("url")
+    if not url:
+        return error("missing url", 400)
+    index = request.query.get("index", "")
+    sink = request.query.get("sink")
+    return await _stream(request, {"url": url, "index": int(index) if index.isdigit() else 0, "sink": sink,
+                                   "mode": "sink" if sink else "stream"})
+
+
+async def _stream(request: web.Request, payload: dict) -> web.StreamResponse:
+    """Pipe the chosen candidate from the CDN to the client (mode=stream) or to a sink (mode=sink); no local disk."""
+    engine = request.app[ENGINE]
+    started = time.monotonic()
+    resp = new_result(payload["url"], payload.get("index") or 0)
+    timings = resp["timings"] = Timings()
+    resp["success"] = False
+    sink = None
+    if payload.get("mode") == "sink":
+        resp["sink"] = payload.get("sink") or "s3"
+        try:
+            sink = get_sink(resp["sink"])
+        except KeyError:
+            return error("unknown_sink", 400, sink=payload.get("sink"))
+        except Exception as e:
+            return error("sink_unavailable", 503, detail=str(e))
+
+    # neither the media store nor ./debug: this mode writes no local files
+    found = await engine.resolve(resp, lease_timeout=LEASE_TIMEOUT, use_store=False, capture_debug=False)
+    chosen = None
+    if found:
+        resp["candidates"], resp["caption"] = found
+        chosen = choose_candidate(found[0])
+        if chosen is None:
+            resp["error"] = "no_candidate_chosen"
+    if chosen is None:
+        await _finish(resp, started)
+        return web.json_response(resp, status=503 if resp["error"] == "browser_pool_busy" else 404)
     chosen_url = chosen["url"]
-    resp["video_url"] = chosen_url
+    resp.update(video_url=chosen_url, found=True)
 
-    base_name = sanitize_filename(resp["caption"] or f"xhs_{index}")
-    ext = Path(chosen_url.split("?")[0]).suffix or ".mp4"
-    out_path = unique_path_for(DOWNLOAD_OUT / f"{index} - {base_name}{ext}")
+    upstream = None
+    try:
+        if is_hls_url(chosen_url):
+            media, _ = await hls.resolve_media_playlist(engine.session, chosen_url, CDN_HEADERS)
+            if media["encrypted"]:
+                resp["error"] = "hls_encrypted_unsupported"
+                await _finish(resp, started)
+                return web.json_response(resp, status=422)
+            status, headers = 200, {"Content-Type": "video/mp4" if media["init"] else "video/mp2t"}
+            chunks = iter_hls(engine.session, media, CDN_HEADERS)
+        else:
+            upstream = await open_upstream(engine.session, chosen_url, CDN_HEADERS, None if sink else request.headers.get("Range"))
+            if upstream.status >= 400:
+                upstream.release()
+                resp["error"] = f"upstream_status: {upstream.status}"
+                await _finish(resp, started)
+                return web.json_response(resp, status=416 if upstream.status == 416 else 502)
+            status, headers = upstream.status, passthrough_headers(upstream)
+            chunks = iter_body(upstream)
+    except Exception as e:
+        resp["error"] = f"download_failed: {e}"
+        await _finish(resp, started)
+        return web.json_response(resp, status=502)
 
-    ok, err = download_stream(chosen_url, out_path)
-    if not ok:
-        resp["error"] = f"download_failed: {err}"
-        return jsonify(resp), 200
+    ext = media_ext(chosen_url)
+    hasher = StreamHash()
 
-    resp["saved_to"] = str(out_path.resolve())
-    resp["success"] = True
-    return jsonify(resp), 200
+    async def counted():
+        async with engine.limits.download(chosen_url).slot() as slot:
+            with timings.stage("download"):
+                try:
+                    async for chunk in chunks:
+                        hasher.update(chunk)
+                        yield chunk
+                except Exception as e:
+                    slot.report(False, error=str(e) or type(e).__name__, timeout=isinstance(e, asyncio.TimeoutError))
+                    resp["error"] = f"download_failed: {e}"
+                    raise
+                finally:
+                    resp["streamed_bytes"] = hasher.bytes
+
+    body = counted()
+    try:
+        if sink is not None:
+            try:
+                location = await sink.upload(f"{note_id_from_url(resp['postUrl'])}{ext}", body, headers.get("Content-Type"))
+                resp.update(success=True, streamed_to=location, digest=hasher.hexdigest())
+            except Exception as e:
+                resp["error"] = resp.get("error") or f"sink_failed: {e}"
+            return web.json_response(resp, status=200 if resp["success"] else 502)
+
+        filename = f"{sanitize_filename(resp['caption'] or note_id_from_url(resp['postUrl']))}{ext}"
+        headers["Content-Disposition"] = f"inline; filename*=UTF-8''{quote(filename)}"
+        headers["X-Video-Url"] = chosen_url
+        out = web.StreamResponse(status=status, headers=headers)
+        try:
+            await out.prepare(request)
+            async for chunk in body:
+                await out.write(chunk)
+            await out.write_eof()
+            resp.update(success=True, streamed_to="client")
+        except (ConnectionResetError, asyncio.CancelledError):
+            resp["error"] = resp.get("error") or "client_disconnected"
+            raise
+        return out
+    finally:
+        await body.aclose()
+        await chunks.aclose()
+        if upstream is not None:
+            upstream.release()
+        await _finish(resp, started)
+
+
+# --- Stats ---
+async def cache_stats(request: web.Request) -> web.Response:
+    media = await asyncio.to_thread(get_media_store().stats)  # SQLite query
+    return web.json_response(dict(get_default_cache().stats(), api=get_default_store().stats(), media=media,
+                                  probe=get_probe_cache().stats()))
+
+
+async def metrics(request: web.Request) -> web.Response:
+    return web.Response(text=REGISTRY.render(), headers={"Content-Type": "text/plain; version=0.0.4"})
+
+
+async def concurrency_limits(request: web.Request) -> web.Response:
+    return web.json_response(request.app[ENGINE].limits.snapshot())
+
+
+# --- Batch jobs ---
+async def create_job(request: web.Request) -> web.Response:
+    payload = await read_json(request)
+    if isinstance(payload, dict):
+        if "urls" in payload:
+            payload = payload["urls"]
+        elif "url" in payload:
+            payload = [{"index": payload["index"], "postUrl": payload["url"]} if "index" in payload else payload["url"]]
+    if isinstance(payload, str):
+        payload = [payload]
+    if not isinstance(payload, list) or not payload:
+        return error("missing url", 400)
+    if len(payload) > JOB_MAX_ITEMS:
+        return error("too_many_urls", 413, max=JOB_MAX_ITEMS)
+
+    job = await request.app[JOBS].submit(list(iter_items(payload)))
+    return web.json_response({"success": True, "job_id": job["id"], "status": job["status"], "total": job["total"]},
+                             status=202, headers={"Location": f"/jobs/{job['id']}"})
+
+
+async def get_job(request: web.Request) -> web.Response:
+    job = await request.app[JOBS].get(request.match_info["job_id"])
+    if job is None:
+        return error("job_not_found", 404)
+    return web.json_response(job)
+
+
+async def cancel_job(request: web.Request) -> web.Response:
+    job = await request.app[JOBS].cancel(request.match_info["job_id"])
+    if job is None:
+        return error("job_not_found", 404)
+    return web.json_response(job)
+
+
+def create_app() -> web.Application:
+    app = web.Application()
+    app.cleanup_ctx.append(engine_ctx)
+    app.router.add_post("/extract", extract)
+    app.router.add_get("/stream", stream)
+    app.router.add_get("/cache/stats", cache_stats)
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/limits", concurrency_limits)
+    app.router.add_post("/jobs", create_job)
+    app.router.add_get("/jobs/{job_id}", get_job)
+    app.router.add_delete("/jobs/{job_id}", cancel_job)
+    return app
+
+
+app = create_app()
+pool_gauge(lambda: {"engine": app[ENGINE].pool} if ENGINE in app else {})
+limits_gauge({"engine": LIMITS})
 
 
 if __name__ == "__main__":
-    app.run(host="0.0.0.0", port=6000)
+    web.run_app(app, host=HOST, port=PORT)
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+bench.py
+Offline benchmarks of the batch CLI and the API server against the local
+Seekin / CDN stand-in (bench_servers.py), at several concurrency levels.
+
+Every scenario level runs in a fresh process and working directory (no
+extraction cache, media store or API template carried over) on its own note
+IDs, with XHS_SEEKIN_URL pointing at the stand-in:
+
+  batch   xhs_batch_download.main() over --urls links; level = links in flight
+          (WORKERS), browsers = min(level, --browsers). Wall time includes
+          browser start-up, as a CLI run does.
+  api     app_playwright_update.py on a local port, --urls POST /extract
+          requests with `level` in flight (XHS_POOL_SIZE = min(level, --browsers));
+          timed from the first request, latency measured by the client.
+
+--api-mode picks the extraction path: auto (the first browser run records the
+Seekin API template, later links replay it), off (browser only) or replay
+(the stand-in's template is seeded, so browsers are launched but not used).
+
+Reported per level: URLs/s, p50/p95/p99 latency, peak RSS of the measured
+process tree (needs psutil; the stand-in is not counted), bytes/s downloaded,
+successes and errors. Results are written as JSON (bench_results/<time>.json)
+so runs can be compared:
+
+  python bench.py [--scenarios batch,api] [--levels 1,4,16] [--urls 40] [--browsers 4]
+                  [--api-mode auto|off|replay] [--extract-timeout 30] [--out FILE] [--keep]
+                  [stand-in options: python bench_servers.py --help]
+  python bench.py --compare old.json new.json [--tolerance 0.1]
+
+--compare prints every metric's change and exits 1 when one of them got worse
+by more than the tolerance.
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import platform
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import Counter
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import bench_servers
+
+try:
+    import psutil
+except ImportError:  # peak RSS is reported as null
+    psutil = None
+
+# --- Configuration ---
+ROOT = Path(__file__).resolve().parent
+RESULTS_DIR = ROOT / "bench_results"
+LEVELS = "1,4,16"
+URLS_PER_LEVEL = 40
+BROWSERS = 4
+EXTRACT_TIMEOUT = 30  # browser wait per attempt; injected "empty" / "hang" failures run into it
+READY_TIMEOUT = 60
+REQUEST_TIMEOUT = 600
+STOP_TIMEOUT = 30
+RSS_SAMPLE_SEC = 0.2
+TOLERANCE = 0.1
+
+# metric -> True when higher is better
+COMPARED = {"urls_per_sec": True, "bytes_per_sec": True, "p50": False, "p95": False, "p99": False, "peak_rss_mb": False}
+
+
+# --- measurement ---
+def percentile(values: List[float], q: float) -> Optional[float]:
+    """Nearest-rank percentile."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)], 3)
+
+
+class RssSampler:
+    """Peak resident memory of a process and all its descendants (browsers included)."""
+
+    def __init__(self, pid: int, every: float = RSS_SAMPLE_SEC):
+        self.pid, self.every = pid, every
+        self.peak = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _sample(self) -> int:
+        try:
+            root = psutil.Process(self.pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            return 0
+        total = 0
+        for p in procs:
+            try: total += p.memory_info().rss
+            except psutil.Error: pass
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._sample())
+            self._stop.wait(self.every)
+
+    def __enter__(self):
+        if psutil is not None:
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def peak_mb(self) -> Optional[float]:
+        return round(self.peak / 2**20, 1) if psutil is not None and self.peak else None
+
+
+def summarize(rows: List[Dict], wall_sec: float, peak_rss_mb: Optional[float]) -> Dict:
+    """rows: {latency, ok, bytes, error} per URL."""
+    latencies = [r["latency"] for r in rows if r.get("latency") is not None]
+    total_bytes = sum(r.get("bytes") or 0 for r in rows)
+    errors = Counter(str(r["error"]).split(":")[0] for r in rows if r.get("error"))
+    return {
+        "urls": len(rows), "succeeded": sum(1 for r in rows if r.get("ok")), "errors": dict(errors),
+        "wall_sec": round(wall_sec, 3), "urls_per_sec": round(len(rows) / wall_sec, 3) if wall_sec else None,
+        "p50": percentile(latencies, 50), "p95": percentile(latencies, 95), "p99": percentile(latencies, 99),
+        "max": round(max(latencies), 3) if latencies else None,
+        "peak_rss_mb": peak_rss_mb, "bytes": total_bytes,
+        "bytes_per_sec": round(total_bytes / wall_sec) if wall_sec else None,
+    }
+
+
+# --- environment ---
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_http(url: str, timeout: float = READY_TIMEOUT, proc=None):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc is not None and proc.poll() is not None:
+            raise RuntimeError(f"process exited with {proc.returncode} before {url} answered")
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f"{url} did not answer within {timeout}s")
+
+
+def post_urls(scenario: str, level: int, n: int, run_id: str) -> List[str]:
+    """Distinct note IDs per run, scenario and level, so nothing is served from a cache."""
+    return [f"https://www.xiaohongshu.com/explore/{hashlib.md5(f'{run_id}/{scenario}/{level}/{i}'.encode()).hexdigest()[:24]}"
+            for i in range(n)]
+
+
+def child_env(args: argparse.Namespace, seekin_url: str, **extra) -> Dict[str, str]:
+    env = dict(os.environ)
+    for key in ("XHS_CACHE_DB", "XHS_MEDIA_DB", "XHS_MEDIA_ROOT", "XHS_API_TEMPLATE", "XHS_DEBUG_DIR", "XHS_PROFILE_DIR"):
+        env.pop(key, None)  # everything stays inside the level's working directory
+    env.update(XHS_SEEKIN_URL=seekin_url, XHS_API_MODE="off" if args.api_mode == "off" else "auto",
+               XHS_EXTRACT_TIMEOUT=str(args.extract_timeout), PYTHONUNBUFFERED="1", **{k: str(v) for k, v in extra.items()})
+    return env
+
+
+# --- scenarios ---
+def run_batch(args: argparse.Namespace, level: int, urls: List[str], workdir: Path, seekin_url: str) -> Dict:
+    links = workdir / "links.jsonl"
+    links.write_text("".join(json.dumps({"index": i, "postUrl": u}) + "\n" for i, u in enumerate(urls, start=1)), encoding="utf-8")
+    cmd = [sys.executable, str(ROOT / "bench.py"), "--batch-child", str(level), str(min(level, args.browsers)), str(links)]
+    with (workdir / "bench.log").open("wb") as log:
+        proc = subprocess.Popen(cmd, cwd=workdir, env=child_env(args, seekin_url), stdout=log, stderr=subprocess.STDOUT)
+        with RssSampler(proc.pid) as rss:
+            proc.wait()
+    if proc.returncode != 0:
+        raise RuntimeError(f"batch run failed with {proc.returncode}, see {workdir / 'bench.log'}")
+    wall = json.loads((workdir / "bench_child.json").read_text(encoding="utf-8"))["wall_sec"]
+    rows = []
+    for line in (workdir / "results.jsonl").read_text(encoding="utf-8").splitlines():
+        res = json.loads(line)
+        rows.append({"latency": (res.get("timings") or {}).get("total"), "ok": bool(res.get("saved_to")),
+                     "bytes": res.get("downloaded_bytes"), "error": res.get("error")})
+    return summarize(rows, wall, rss.peak_mb())
+
+
+def batch_child(level: int, browsers: int, links: str):
+    """Runs inside the level's working directory: one xhs_batch_download.main() call, timed."""
+    import xhs_batch_download as batch
+    from link_source import open_source
+
+    batch.WORKERS, batch.CONCURRENCY = level, browsers
+    started = time.monotonic()
+    summary = asyncio.run(batch.main(open_source(links), resume=False))
+    Path("bench_child.json").write_text(json.dumps({"wall_sec": time.monotonic() - started, "summary": summary}), encoding="utf-8")
+
+
+async def _fire(base: str, urls: List[str], level: int) -> Tuple[List[Dict], float]:
+    import aiohttp
+
+    rows, sem = [], asyncio.Semaphore(level)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+
+    async def one(session, index: int, url: str):
+        async with sem:
+            started = time.monotonic()
+            try:
+                async with session.post(f"{base}/extract", json={"url": url, "index": index}) as resp:
+                    body = await resp.json(content_type=None)
+                row = {"ok": bool(body.get("success")), "bytes": body.get("downloaded_bytes"),
+                       "error": body.get("error") or (None if resp.status == 200 else f"status_{resp.status}")}
+            except Exception as e:
+                row = {"ok": False, "error": type(e).__name__}
+            row["latency"] = time.monotonic() - started
+            rows.append(row)
+
+    async with aiohttp.ClientSession(timeout=timeout, connector=aiohttp.TCPConnector(limit=level)) as session:
+        started = time.monotonic()
+        await asyncio.gather(*(one(session, i, u) for i, u in enumerate(urls, start=1)))
+        return rows, time.monotonic() - started
+
+
+def run_api(args: argparse.Namespace, level: int, urls: List[str], workdir: Path, seekin_url: str) -> Dict:
+    port = free_port()
+    env = child_env(args, seekin_url, XHS_HOST="127.0.0.1", XHS_PORT=port, XHS_POOL_SIZE=min(level, args.browsers))
+    with (workdir / "bench.log").open("wb") as log:
+        proc = subprocess.Popen([sys.executable, str(ROOT / "app_playwright_update.py")], cwd=workdir, env=env,
+                                stdout=log, stderr=subprocess.STDOUT)
+        try:
+            wait_http(f"http://127.0.0.1:{port}/limits", proc=proc)
+            with RssSampler(proc.pid) as rss:
+                rows, wall = asyncio.run(_fire(f"http://127.0.0.1:{port}", urls, level))
+        finally:
+            proc.terminate()  # web.run_app shuts down cleanly on SIGTERM, closing the engine
+            try: proc.wait(STOP_TIMEOUT)
+            except subprocess.TimeoutExpired: proc.kill(); proc.wait()
+    return summarize(rows, wall, rss.peak_mb())
+
+
+SCENARIOS = {"batch": run_batch, "api": run_api}
+
+
+def run(args: argparse.Namespace) -> Dict:
+    levels = [int(x) for x in args.levels.split(",") if x.strip()]
+    scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        sys.exit(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    run_id = time.strftime("%Y%m%dT%H%M%S")
+    config = bench_servers.config_from_args(args)
+    seekin_url = f"http://{args.host}:{args.port}{bench_servers.SEEKIN_PATH}"
+    stand_in = multiprocessing.Process(target=bench_servers.serve, args=(config, args.host, args.port), daemon=True)
+    stand_in.start()
+    report = {"run_id": run_id, "git": git_rev(), "host": platform.node(), "python": platform.python_version(),
+              "cpus": os.cpu_count(), "psutil": psutil is not None, "stand_in": config,
+              "options": {"levels": levels, "urls": args.urls, "browsers": args.browsers, "api_mode": args.api_mode,
+                          "extract_timeout": args.extract_timeout},
+              "runs": {}}
+    root = Path(tempfile.mkdtemp(prefix="xhs-bench-"))
+    try:
+        wait_http(f"http://{args.host}:{args.port}/stats")
+        for scenario in scenarios:
+            for level in levels:
+                workdir = root / f"{scenario}-{level}"
+                workdir.mkdir()
+                if args.api_mode == "replay":
+                    template = bench_servers.api_template(f"http://{args.host}:{args.port}")
+                    (workdir / "seekin_api.json").write_text(json.dumps(template, indent=2), encoding="utf-8")
+                print(f"▶ {scenario} level={level} urls={args.urls} ...", flush=True)
+                urls = post_urls(scenario, level, args.urls, run_id)
+                try:
+                    metrics = SCENARIOS[scenario](args, level, urls, workdir, seekin_url)
+                except Exception as e:
+                    metrics = {"error": str(e)}
+                report["runs"].setdefault(scenario, {})[str(level)] = metrics
+                print("  ", json.dumps(metrics), flush=True)
+    finally:
+        stand_in.terminate()
+        stand_in.join(STOP_TIMEOUT)
+        if args.keep: print(f"Working directories kept in {root}")
+        else: shutil.rmtree(root, ignore_errors=True)
+    return report
+
+
+def git_rev() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- comparison ---
+def compare(old: Dict, new: Dict, tolerance: float = TOLERANCE) -> List[str]:
+    """Print every compared metric present in both runs; returns the regressions."""
+    regressions = []
+    print(f"{'scenario':8} {'level':>5} {'metric':14} {'old':>14} {'new':>14} {'change':>8}")
+    for scenario, levels in new.get("runs", {}).items():
+        for level, metrics in levels.items():
+            before = old.get("runs", {}).get(scenario, {}).get(level)
+            if not before:
+                continue
+            for metric, higher_is_better in COMPARED.items():
+                a, b = before.get(metric), metrics.get(metric)
+                if a is None or b is None:
+                    continue
+                change = (b - a) / a if a else 0.0
+                worse = -change if higher_is_better else change
+                flag = "  REGRESSION" if worse > tolerance else ""
+                print(f"{scenario:8} {level:>5} {metric:14} {a:>14} {b:>14} {change:>+8.1%}{flag}")
+                if flag:
+                    regressions.append(f"{scenario}/{level}/{metric}")
+    return regressions
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch-child":
+        batch_child(int(sys.argv[2]), int(sys.argv[3]), sys.argv[4])
+        sys.exit(0)
+
+    ap = argparse.ArgumentParser(description="Offline benchmarks against a local Seekin / CDN stand-in")
+    ap.add_argument("--scenarios", default=",".join(SCENARIOS))
+    ap.add_argument("--levels", default=LEVELS, help="comma separated concurrency levels")
+    ap.add_argument("--urls", type=int, default=URLS_PER_LEVEL, help="links per level")
+    ap.add_argument("--browsers", type=int, default=BROWSERS, help="upper bound on pooled browsers")
+    ap.add_argument("--api-mode", choices=("auto", "off", "replay"), default="auto", help="extraction path, see above")
+    ap.add_argument("--extract-timeout", type=float, default=EXTRACT_TIMEOUT)
+    ap.add_argument("--out", help="result file (default bench_results/<time>.json)")
+    ap.add_argument("--keep", action="store_true", help="keep the per-level working directories")
+    ap.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"))
+    ap.add_argument("--tolerance", type=float, default=TOLERANCE, help="relative change that counts as a regression")
+    bench_servers.add_arguments(ap)
+    args = ap.parse_args()
+
+    if args.compare:
+        old, new = (json.loads(Path(p).read_text(encoding="utf-8")) for p in args.compare)
+        regressions = compare(old, new, args.tolerance)
+        if regressions:
+            sys.exit(f"❌ {len(regressions)} regressions beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+        print("✅ No regressions")
+        sys.exit(0)
+
+    report = run(args)
+    out = Path(args.out) if args.out else RESULTS_DIR / f"{report['run_id']}.json"
+    out.parent.mkdir(parents=True, exist_ok=True)
+    out.write_text(json.dumps(report, indent=2), encoding="utf-8")
+    print(f"✅ Wrote {out.resolve()}")
@@ -0,0 +1,261 @@
+#!/usr/bin/env python3
+"""
+bench_servers.py
+Local stand-ins for Seekin and the XHS CDN, so bench.py runs offline.
+
+One aiohttp app serves both:
+
+  /xiaohongshu-video-downloader/   Seekin's form page: a text input and a submit button
+                                   whose script POSTs the post URL to /api/parse;
+                                   ?q=<post url> submits on load
+  /api/parse                       {code, data: {title, medias: [{url, quality}]}} after
+                                   the configured latency; a share of requests fails
+  /cdn/<note>/<quality>.mp4        deterministic bytes of the configured size, HEAD and
+                                   single-range requests, optional per-response rate cap
+  /cdn/<note>/master.m3u8          HLS master -> <quality>/index.m3u8 -> <quality>/<n>.ts
+
+Every note gets different bytes, so the media store never dedups two posts.
+Injected failures (--fail-kinds) are picked at random among:
+  500 / 429   error status with a JSON body that has no data
+  empty       data.medias is an empty list
+  hang        no answer until the client gives up
+
+Usage:
+  python bench_servers.py [--port 8765] [--latency-ms 300] [--jitter-ms 200] [--fail-rate 0]
+                          [--fail-kinds 500,429,empty] [--size-mb 4] [--media mp4|hls|both]
+                          [--segments 8] [--rate-mbps 0]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+from typing import Optional
+from urllib.parse import urlsplit
+
+from aiohttp import web
+
+# --- Configuration ---
+PORT = 8765
+SEEKIN_PATH = "/xiaohongshu-video-downloader/"
+BLOCK = 1 << 16  # bytes of the repeating per-file pattern, also the write chunk
+HANG_SEC = 600
+QUALITIES = {"720p": (1280, 720, 1.0), "1080p": (1920, 1080, 2.0)}  # width, height, size factor
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+NOTE_RE = re.compile(r"[^A-Za-z0-9]+")
+CONFIG = web.AppKey("config", dict)
+STATS = web.AppKey("stats", dict)
+
+FORM_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Xiaohongshu Video Downloader (local stand-in)</title></head>
+<body>
+<form id="form"><input type="text" name="url" placeholder="Paste a Xiaohongshu link"><button type="submit">Download</button></form>
+<div id="out"></div>
+<script>
+async function parse(link) {
+  const r = await fetch("/api/parse", {method: "POST", headers: {"Content-Type": "application/json"}, body: JSON.stringify({url: link})});
+  const j = await r.json();
+  const medias = (j.data && j.data.medias) || [];
+  document.getElementById("out").innerHTML = medias.map(m => '<video src="' + m.url + '"></video>').join("");
+}
+document.getElementById("form").addEventListener("submit", e => { e.preventDefault(); parse(e.target.url.value); });
+const q = new URLSearchParams(location.search).get("q");
+if (q) parse(q);
+</script>
+</body></html>
+"""
+
+
+def default_config(**overrides) -> dict:
+    cfg = {"latency_ms": 300, "jitter_ms": 200, "fail_rate": 0.0, "fail_kinds": ["500", "429", "empty"],
+           "size_mb": 4.0, "media": "mp4", "segments": 8, "rate_mbps": 0.0}
+    cfg.update(overrides)
+    return cfg
+
+
+def note_of(post_url: str) -> str:
+    last = urlsplit(post_url or "").path.rstrip("/").rsplit("/", 1)[-1]
+    return NOTE_RE.sub("", last)[:64] or "note"
+
+
+def api_template(base: str) -> dict:
+    """A seekin_api.py template for /api/parse, for benchmarks that skip the browser."""
+    return {"endpoint": f"{base}/api/parse", "method": "POST", "headers": {"Content-Type": "application/json"},
+            "body": '{"url": "{{POST_URL}}"}', "encoding": "json", "recorded_at": 0}
+
+
+def file_size(cfg: dict, quality: str) -> int:
+    return max(1, int(cfg["size_mb"] * QUALITIES[quality][2] * 1024 * 1024))
+
+
+def pattern(key: str) -> bytes:
+    return hashlib.sha256(key.encode()).digest() * (BLOCK // 32)
+
+
+def chunk_at(block: bytes, offset: int, n: int) -> bytes:
+    """n (<= BLOCK) bytes of the endless repetition of block, starting at offset."""
+    o = offset % BLOCK
+    return (block[o:] + block[:o])[:n]
+
+
+# --- Seekin ---
+async def form_page(request: web.Request) -> web.Response:
+    return web.Response(text=FORM_PAGE, content_type="text/html")
+
+
+async def parse(request: web.Request) -> web.Response:
+    cfg = request.app[CONFIG]
+    try:
+        payload = await request.json()
+    except ValueError:
+        payload = {}
+    post_url = payload.get("url") if isinstance(payload, dict) else None
+    if not post_url:
+        return web.json_response({"code": 400, "msg": "missing url"}, status=400)
+    await asyncio.sleep(max(0.0, cfg["latency_ms"] + random.uniform(-1, 1) * cfg["jitter_ms"]) / 1000)
+
+    stats = request.app[STATS]
+    stats["parse"] += 1
+    if cfg["fail_kinds"] and random.random() < cfg["fail_rate"]:
+        kind = random.choice(cfg["fail_kinds"])
+        stats["fail_" + kind] = stats.get("fail_" + kind, 0) + 1
+        if kind == "hang":
+            await asyncio.sleep(HANG_SEC)
+        if kind == "empty":
+            return web.json_response({"code": 0, "data": {"title": "", "medias": []}})
+        status = int(kind) if kind.isdigit() else 500
+        return web.json_response({"code": status, "msg": "injected failure"}, status=status)
+
+    note = note_of(post_url)
+    base = f"{request.url.origin()}/cdn/{note}"
+    medias = []
+    if cfg["media"] in ("mp4", "both"):
+        medias += [{"url": f"{base}/{q}.mp4", "quality": q} for q in QUALITIES]
+    if cfg["media"] in ("hls", "both"):
+        medias.append({"url": f"{base}/master.m3u8", "quality": "auto"})
+    return web.json_response({"code": 0, "data": {"title": f"Benchmark note {note}", "medias": medias}})
+
+
+# --- CDN ---
+async def send_bytes(request: web.Request, key: str, size: int, content_type: str) -> web.StreamResponse:
+    start, end, status = 0, size - 1, 200
+    m = RANGE_RE.match(request.headers.get("Range", ""))
+    if m and (m.group(1) or m.group(2)):
+        if m.group(1):
+            start = int(m.group(1))
+            end = min(int(m.group(2)), size - 1) if m.group(2) else size - 1
+        else:  # suffix range: the last n bytes
+            start = max(0, size - int(m.group(2)))
+        if start >= size or start > end:
+            return web.Response(status=416, headers={"Content-Range": f"bytes */{size}"})
+        status = 206
+    headers = {"Content-Type": content_type, "Accept-Ranges": "bytes", "Content-Length": str(end - start + 1)}
+    if status == 206:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    resp = web.StreamResponse(status=status, headers=headers)
+    await resp.prepare(request)
+    if request.method == "HEAD":
+        return resp
+
+    cfg, block, pos = request.app[CONFIG], pattern(key), start
+    per_chunk_sec = BLOCK / (cfg["rate_mbps"] * 125000) if cfg["rate_mbps"] > 0 else 0
+    while pos <= end:
+        n = min(BLOCK, end - pos + 1)
+        await resp.write(chunk_at(block, pos, n))
+        pos += n
+        request.app[STATS]["bytes_sent"] += n
+        if per_chunk_sec:
+            await asyncio.sleep(per_chunk_sec * n / BLOCK)
+    await resp.write_eof()
+    return resp
+
+
+def _quality(request: web.Request) -> str:
+    quality = request.match_info["quality"]
+    if quality not in QUALITIES:
+        raise web.HTTPNotFound()
+    return quality
+
+
+async def mp4(request: web.Request) -> web.StreamResponse:
+    quality = _quality(request)
+    note = request.match_info["note"]
+    return await send_bytes(request, f"{note}/{quality}.mp4", file_size(request.app[CONFIG], quality), "video/mp4")
+
+
+async def master_playlist(request: web.Request) -> web.Response:
+    cfg = request.app[CONFIG]
+    lines = ["#EXTM3U"]
+    for quality, (w, h, _) in QUALITIES.items():
+        bandwidth = file_size(cfg, quality) * 8 // (cfg["segments"] * 4)
+        lines += [f"#EXT-X-STREAM-INF:BANDWIDTH={bandwidth},RESOLUTION={w}x{h}", f"{quality}/index.m3u8"]
+    return web.Response(text="\n".join(lines) + "\n", content_type="application/vnd.apple.mpegurl")
+
+
+async def media_playlist(request: web.Request) -> web.Response:
+    _quality(request)
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", "#EXT-X-TARGETDURATION:4", "#EXT-X-MEDIA-SEQUENCE:0"]
+    for n in range(request.app[CONFIG]["segments"]):
+        lines += ["#EXTINF:4.0,", f"{n}.ts"]
+    lines.append("#EXT-X-ENDLIST")
+    return web.Response(text="\n".join(lines) + "\n", content_type="application/vnd.apple.mpegurl")
+
+
+async def segment(request: web.Request) -> web.StreamResponse:
+    quality, cfg = _quality(request), request.app[CONFIG]
+    n = int(request.match_info["n"])
+    if n >= cfg["segments"]:
+        raise web.HTTPNotFound()
+    size = max(1, file_size(cfg, quality) // cfg["segments"])
+    return await send_bytes(request, f"{request.match_info['note']}/{quality}/{n}.ts", size, "video/mp2t")
+
+
+async def stats(request: web.Request) -> web.Response:
+    return web.json_response(request.app[STATS])
+
+
+def create_app(config: Optional[dict] = None) -> web.Application:
+    app = web.Application()
+    app[CONFIG] = config or default_config()
+    app[STATS] = {"parse": 0, "bytes_sent": 0}
+    app.router.add_get(SEEKIN_PATH, form_page)
+    app.router.add_post("/api/parse", parse)
+    app.router.add_get("/cdn/{note}/master.m3u8", master_playlist)
+    app.router.add_get("/cdn/{note}/{quality}/index.m3u8", media_playlist)
+    app.router.add_get(r"/cdn/{note}/{quality}/{n:\d+}.ts", segment)
+    app.router.add_get("/cdn/{note}/{quality}.mp4", mp4)
+    app.router.add_get("/stats", stats)
+    return app
+
+
+def add_arguments(ap: argparse.ArgumentParser):
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=PORT)
+    ap.add_argument("--latency-ms", type=float, default=300, help="Seekin API latency")
+    ap.add_argument("--jitter-ms", type=float, default=200, help="uniform +/- jitter on the latency")
+    ap.add_argument("--fail-rate", type=float, default=0.0, help="share of Seekin API calls that fail")
+    ap.add_argument("--fail-kinds", default="500,429,empty", help="comma separated: 500, 429, empty, hang")
+    ap.add_argument("--size-mb", type=float, default=4.0, help="size of the 720p file (1080p is twice that)")
+    ap.add_argument("--media", choices=("mp4", "hls", "both"), default="mp4", help="candidates listed in data.medias")
+    ap.add_argument("--segments", type=int, default=8, help="segments per HLS variant")
+    ap.add_argument("--rate-mbps", type=float, default=0.0, help="per-response bandwidth cap in Mbit/s (0 = unlimited)")
+
+
+def config_from_args(args: argparse.Namespace) -> dict:
+    return default_config(latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, fail_rate=args.fail_rate,
+                          fail_kinds=[k for k in args.fail_kinds.split(",") if k], size_mb=args.size_mb,
+                          media=args.media, segments=max(1, args.segments), rate_mbps=args.rate_mbps)
+
+
+def serve(config: dict, host: str = "127.0.0.1", port: int = PORT):
+    print(f"Seekin stand-in: http://{host}:{port}{SEEKIN_PATH}", json.dumps(config), flush=True)
+    web.run_app(create_app(config), host=host, port=port, print=None)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local Seekin + CDN stand-in for benchmarks")
+    add_arguments(ap)
+    args = ap.parse_args()
+    serve(config_from_args(args), args.host, args.port)
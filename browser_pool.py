@@ -0,0 +1,221 @@
+"""
+browser_pool.py
+Long-lived pool of warm Chromium browsers with pre-created contexts.
+
+  AsyncBrowserPool  async Playwright, shared by the batch CLI, the API server
+                    and its jobs through engine.Engine. Slots are leased with
+                    `async with pool.lease() as lease:`.
+
+Slots are health-checked before every lease and recycled after POOL_MAX_USES
+leases or once the browser process tree grows past POOL_MAX_RSS_MB (needs
+psutil; without it only the use counter applies).
+"""
+
+import asyncio
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Set
+
+try:
+    import psutil
+except ImportError:  # memory based recycling is optional
+    psutil = None
+
+# --- Configuration ---
+POOL_SIZE = int(os.environ.get("XHS_POOL_SIZE", "2"))
+POOL_MAX_USES = int(os.environ.get("XHS_POOL_MAX_USES", "50"))
+POOL_MAX_RSS_MB = float(os.environ.get("XHS_POOL_MAX_RSS_MB", "1024"))
+POOL_ACQUIRE_TIMEOUT = float(os.environ.get("XHS_POOL_ACQUIRE_TIMEOUT", "30"))
+LAUNCH_ARGS = ["--no-sandbox", "--disable-setuid-sandbox"]
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+# --- Process memory helpers ---
+def _descendants() -> Set[int]:
+    if psutil is None:
+        return set()
+    try:
+        return {p.pid for p in psutil.Process(os.getpid()).children(recursive=True)}
+    except psutil.Error:
+        return set()
+
+
+def _spawned_roots(before: Set[int]) -> List[int]:
+    """Top-level processes that appeared since `before` was taken."""
+    if psutil is None:
+        return []
+    new = _descendants() - before
+    roots = []
+    for pid in new:
+        try:
+            if psutil.Process(pid).ppid() not in new:
+                roots.append(pid)
+        except psutil.Error:
+            pass
+    return roots
+
+
+def tree_rss_mb(pids: List[int]) -> Optional[float]:
+    if psutil is None or not pids:
+        return None
+    total = 0
+    for pid in pids:
+        try:
+            root = psutil.Process(pid)
+            procs = [root] + root.children(recursive=True)
+        except psutil.Error:
+            continue
+        for p in procs:
+            try:
+                total += p.memory_info().rss
+            except psutil.Error:
+                pass
+    return total / (1 << 20)
+
+
+async def _aclose_quietly(obj):
+    try:
+        await obj.close()
+    except Exception:
+        pass
+
+
+# --- Async pool ---
+class AsyncBrowserLease:
+    def __init__(self, slot: "_AsyncSlot"):
+        self._slot = slot
+        self.browser = slot.browser
+        self._opened = []
+
+    async def context(self, name: str):
+        ctx = self._slot.warm.pop(name, None)
+        if ctx is None:
+            ctx = await self.browser.new_context(**self._slot.pool.context_options.get(name, {}))
+        self._opened.append(ctx)
+        return ctx
+
+    async def close(self):
+        for ctx in self._opened:
+            await _aclose_quietly(ctx)
+        self._opened = []
+
+
+class _AsyncSlot:
+    def __init__(self, pool: "AsyncBrowserPool", slot_id: int):
+        self.pool = pool
+        self.slot_id = slot_id
+        self.browser = None
+        self.warm: Dict[str, object] = {}
+        self.pids: List[int] = []
+        self.uses = 0
+        self.recycled = 0
+
+    async def launch(self):
+        async with self.pool._spawn_lock:
+            before = _descendants()
+            self.browser = await self.pool.playwright.chromium.launch(headless=True, args=self.pool.launch_args)
+            self.pids = _spawned_roots(before)
+        self.uses = 0
+        await self.refill()
+
+    async def refill(self):
+        for name, opts in self.pool.context_options.items():
+            if name not in self.warm:
+                try:
+                    self.warm[name] = await self.browser.new_context(**opts)
+                except Exception:
+                    pass
+
+    async def shutdown(self):
+        for ctx in self.warm.values():
+            await _aclose_quietly(ctx)
+        self.warm = {}
+        if self.browser is not None:
+            await _aclose_quietly(self.browser)
+        self.browser = None
+        self.pids = []
+
+    async def ensure_healthy(self):
+        if self.browser is None or not self.browser.is_connected():
+            await self.shutdown()
+            await self.launch()
+            self.recycled += 1
+
+    async def after_use(self):
+        self.uses += 1
+        rss = tree_rss_mb(self.pids)
+        if self.uses >= self.pool.max_uses or (rss is not None and rss > self.pool.max_rss_mb):
+            await self.shutdown()
+            try:
+                await self.launch()
+            except Exception:
+                pass
+            self.recycled += 1
+        elif self.browser is not None and self.browser.is_connected():
+            await self.refill()
+
+    def stats(self) -> Dict:
+        return {"slot": self.slot_id, "uses": self.uses, "recycled": self.recycled, "rss_mb": tree_rss_mb(self.pids)}
+
+
+class AsyncBrowserPool:
+    def __init__(self, playwright, size: int = POOL_SIZE, context_options: Optional[Dict[str, dict]] = None,
+                 max_uses: int = POOL_MAX_USES, max_rss_mb: float = POOL_MAX_RSS_MB,
+                 acquire_timeout: Optional[float] = POOL_ACQUIRE_TIMEOUT, launch_args: Optional[List[str]] = None):
+        self.playwright = playwright
+        self.size = max(1, size)
+        self.context_options = context_options or {}
+        self.max_uses = max_uses
+        self.max_rss_mb = max_rss_mb
+        self.acquire_timeout = acquire_timeout
+        self.launch_args = launch_args or LAUNCH_ARGS
+        self._slots: List[_AsyncSlot] = []
+        self._idle: Optional[asyncio.Queue] = None
+        self._spawn_lock = asyncio.Lock()
+
+    async def start(self):
+        self._idle = asyncio.Queue()
+        self._slots = [_AsyncSlot(self, i) for i in range(self.size)]
+        await asyncio.gather(*(s.launch() for s in self._slots))
+        for slot in self._slots:
+            self._idle.put_nowait(slot)
+        return self
+
+    @asynccontextmanager
+    async def lease(self, timeout: Optional[float] = -1):
+        """Lease a warm browser. timeout=-1 uses acquire_timeout, None waits forever."""
+        wait = self.acquire_timeout if timeout == -1 else timeout
+        started = time.monotonic()
+        try:
+            slot = await asyncio.wait_for(self._idle.get(), wait)
+        except asyncio.TimeoutError:
+            raise PoolTimeout(f"no browser available after {time.monotonic() - started:.1f}s")
+        lease = None
+        try:
+            await slot.ensure_healthy()
+            lease = AsyncBrowserLease(slot)
+            yield lease
+        finally:
+            if lease is not None:
+                await lease.close()
+            try:
+                await slot.after_use()
+            finally:
+                self._idle.put_nowait(slot)
+
+    def stats(self) -> Dict:
+        idle = self._idle.qsize() if self._idle is not None else 0
+        return {"size": self.size, "idle": idle, "in_use": self.size - idle, "slots": [s.stats() for s in self._slots]}
+
+    async def close(self):
+        await asyncio.gather(*(s.shutdown() for s in self._slots))
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
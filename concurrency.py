@@ -0,0 +1,157 @@
+"""
+concurrency.py
+Adaptive (AIMD) concurrency limits per pipeline stage.
+
+Each limiter admits up to floor(limit) concurrent operations. Healthy
+completions (no error, latency under target) grow the limit additively by
+about one per window; timeouts, 429s and 5xx responses cut it
+multiplicatively, at most once per cooldown so a burst of failures from one
+window counts once. The extraction stage (browser / Seekin API) has one
+limiter; the download stage has one limiter per CDN host.
+
+AsyncLimiter gates the shared engine (engine.py), so batch runs, API
+requests and jobs are all admitted on the event loop; the AIMD arithmetic
+lives in _AIMD.
+
+  XHS_EXTRACT_INITIAL / XHS_EXTRACT_MAX     extraction limit start / ceiling (4 / 16)
+  XHS_DOWNLOAD_INITIAL / XHS_DOWNLOAD_MAX   per-CDN-host limit start / ceiling (4 / 16)
+  XHS_EXTRACT_TARGET_SEC / XHS_DOWNLOAD_TARGET_SEC
+                                            slower completions do not raise the limit
+"""
+
+import asyncio
+import os
+import re
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+# --- Configuration ---
+EXTRACT_INITIAL = int(os.environ.get("XHS_EXTRACT_INITIAL", "4"))
+EXTRACT_MAX = int(os.environ.get("XHS_EXTRACT_MAX", "16"))
+EXTRACT_TARGET_SEC = float(os.environ.get("XHS_EXTRACT_TARGET_SEC", "20"))
+DOWNLOAD_INITIAL = int(os.environ.get("XHS_DOWNLOAD_INITIAL", "4"))
+DOWNLOAD_MAX = int(os.environ.get("XHS_DOWNLOAD_MAX", "16"))
+DOWNLOAD_TARGET_SEC = float(os.environ.get("XHS_DOWNLOAD_TARGET_SEC", "120"))
+MIN_LIMIT = 1
+DECREASE_FACTOR = 0.5
+COOLDOWN_SEC = 5.0
+
+OVERLOAD_STATUS_RE = re.compile(r"^\s*(429|5\d\d)\b")
+
+
+def is_overload(status: Optional[int] = None, error: Optional[str] = None, timeout: bool = False) -> bool:
+    """True for signals that mean "back off": 429, 5xx and timeouts (the flag, or an error that says so)."""
+    if timeout:
+        return True
+    if status is not None and (status == 429 or 500 <= status < 600):
+        return True
+    if not error:
+        return False
+    e = error.lower()
+    return bool(OVERLOAD_STATUS_RE.match(error)) or "timeout" in e or "timed out" in e
+
+
+class _AIMD:
+    def __init__(self, name: str, initial: int, maximum: int, target_sec: float):
+        self.name = name
+        self.limit = float(max(MIN_LIMIT, min(initial, maximum)))
+        self.maximum = maximum
+        self.target_sec = target_sec
+        self.in_flight = 0
+        self.last_decrease = 0.0
+        self.counters = {"ok": 0, "slow": 0, "errors": 0, "overloads": 0, "decreases": 0}
+
+    def capacity(self) -> int:
+        return max(MIN_LIMIT, int(self.limit))
+
+    def on_done(self, ok: bool, latency: float, overload: bool):
+        if overload:
+            self.counters["overloads"] += 1
+            now = time.monotonic()
+            if now - self.last_decrease >= COOLDOWN_SEC:
+                self.limit = max(MIN_LIMIT, self.limit * DECREASE_FACTOR)
+                self.last_decrease = now
+                self.counters["decreases"] += 1
+        elif not ok:
+            self.counters["errors"] += 1  # content errors say nothing about load
+        elif latency > self.target_sec:
+            self.counters["slow"] += 1
+        else:
+            self.counters["ok"] += 1
+            self.limit = min(self.maximum, self.limit + 1.0 / max(1.0, self.limit))
+
+    def snapshot(self) -> Dict:
+        return dict(self.counters, name=self.name, limit=round(self.limit, 2), capacity=self.capacity(),
+                    in_flight=self.in_flight, max=self.maximum)
+
+
+class Outcome:
+    """Handed out by slot(); call report() before leaving the block (defaults to success)."""
+    def __init__(self):
+        self.ok, self.overload, self.started = True, False, time.monotonic()
+
+    def report(self, ok: bool, status: Optional[int] = None, error: Optional[str] = None, timeout: bool = False):
+        self.ok = ok
+        self.overload = is_overload(status, error, timeout)
+
+    def exclude(self, seconds: float):
+        """Leave time queued elsewhere (e.g. for a pooled browser) out of the latency signal."""
+        self.started += seconds
+
+
+class AsyncLimiter(_AIMD):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cond: Optional[asyncio.Condition] = None
+
+    @asynccontextmanager
+    async def slot(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < self.capacity())
+            self.in_flight += 1
+        outcome = Outcome()
+        try:
+            yield outcome
+        except asyncio.CancelledError:
+            outcome.ok = False
+            raise
+        except Exception as e:
+            outcome.report(False, error=str(e) or type(e).__name__, timeout=isinstance(e, asyncio.TimeoutError))
+            raise
+        finally:
+            self.on_done(outcome.ok, time.monotonic() - outcome.started, outcome.overload)
+            async with self._cond:
+                self.in_flight -= 1
+                self._cond.notify_all()
+
+
+class ConcurrencyController:
+    def __init__(self, limiter_cls=AsyncLimiter):
+        self._cls = limiter_cls
+        self._lock = threading.Lock()
+        self.extract = limiter_cls("extract", EXTRACT_INITIAL, EXTRACT_MAX, EXTRACT_TARGET_SEC)
+        self.hosts: Dict[str, _AIMD] = {}
+
+    def download(self, url: str):
+        host = (urlsplit(url).hostname or "unknown").lower()
+        with self._lock:
+            lim = self.hosts.get(host)
+            if lim is None:
+                lim = self.hosts[host] = self._cls(f"download:{host}", DOWNLOAD_INITIAL, DOWNLOAD_MAX, DOWNLOAD_TARGET_SEC)
+            return lim
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            hosts = {h: l.snapshot() for h, l in self.hosts.items()}
+        return {"extract": self.extract.snapshot(), "download": hosts}
+
+    def describe(self) -> str:
+        """Compact "extract=5 cdn.host=8" summary for progress bars."""
+        with self._lock:
+            parts = [f"{h}={l.capacity()}" for h, l in self.hosts.items()]
+        return " ".join([f"extract={self.extract.capacity()}"] + parts)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+coordinator.py
+Load a batch into the shared work queue (work_queue.py) and follow it.
+
+Usage:
+  python coordinator.py links.json|links.jsonl|-   enqueue, then report progress until drained
+  python coordinator.py --status                   print the batch's progress once
+  python coordinator.py --export                   replace results.jsonl / results.json with the queue's results
+
+Options:
+  --no-watch   only enqueue (with a file argument)
+
+Start any number of workers against the same XHS_QUEUE / XHS_QUEUE_BATCH,
+on this host or others sharing the volume:
+  XHS_QUEUE=sqlite:///shared/queue.sqlite python xhs_batch_download.py --worker
+Indices already in the batch are not enqueued twice, so re-running the
+coordinator with the same links only resumes watching.
+"""
+
+import json
+import os
+import sys
+import time
+from pathlib import Path
+from typing import Dict
+
+from tqdm import tqdm
+
+from link_source import open_source
+from results_store import ResultsWriter, compact
+from work_queue import QUEUE_BATCH, open_queue
+
+# --- Configuration ---
+WATCH_EVERY_SEC = 2.0
+RESULTS_FILE = Path("./results.json")
+RESULTS_JSONL = Path("./results.jsonl")
+
+
+def describe(prog: Dict) -> str:
+    return f"pending={prog['pending']} leased={prog['leased']} failed={prog['failed']} workers={prog['workers']} attempts={prog['attempts']}"
+
+
+def watch(queue, batch: str) -> Dict:
+    """Progress bar over finished items until nothing is pending or leased."""
+    prog = queue.progress(batch)
+    with tqdm(total=prog["total"], unit="url") as pbar:
+        while True:
+            finished = prog["done"] + prog["failed"]
+            pbar.total = prog["total"]
+            pbar.update(finished - pbar.n)
+            pbar.set_postfix_str(describe(prog), refresh=True)
+            if not prog["pending"] and not prog["leased"]:
+                return prog
+            time.sleep(WATCH_EVERY_SEC)
+            prog = queue.progress(batch)
+
+
+def export(queue, batch: str) -> int:
+    """Replace results.jsonl with the queue's results (never appended to: re-exports must not duplicate records)."""
+    tmp = RESULTS_JSONL.with_name(RESULTS_JSONL.name + ".tmp")
+    with ResultsWriter(tmp, mode="w") as writer:
+        for res in queue.results(batch):
+            writer.write(res)
+    os.replace(tmp, RESULTS_JSONL)
+    n = compact(RESULTS_JSONL, RESULTS_FILE)
+    print(f"✅ Wrote {n} results to {RESULTS_FILE.resolve()}")
+    return n
+
+
+if __name__ == "__main__":
+    flags = {"--status", "--export", "--no-watch"}
+    opts = {a for a in sys.argv[1:] if a in flags}
+    argv = [a for a in sys.argv if a not in flags]
+    queue = open_queue()
+    if "--status" in opts:
+        print(json.dumps(queue.progress(QUEUE_BATCH)))
+        sys.exit(0)
+    if "--export" in opts:
+        export(queue, QUEUE_BATCH)
+        sys.exit(0)
+    if len(argv) < 2:
+        sys.exit("Usage: python coordinator.py [--no-watch] links.json|links.jsonl|-  or  --status | --export")
+
+    added = queue.add(QUEUE_BATCH, open_source(argv[1]))
+    print(f"Enqueued {added} new items into batch {QUEUE_BATCH!r}:", json.dumps(queue.progress(QUEUE_BATCH)))
+    if "--no-watch" in opts:
+        sys.exit(0)
+    print("Final:", json.dumps(watch(queue, QUEUE_BATCH)))
+    export(queue, QUEUE_BATCH)
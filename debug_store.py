@@ -0,0 +1,164 @@
+"""
+debug_store.py
+Policy-driven debug artifacts (page HTML + screenshot).
+
+Only the page snapshot (HTML and a JPEG screenshot rendered by the browser)
+happens on the extraction path, and only when the policy asks for it.
+Gzipping, writing and retention run on one background writer thread; the
+caller gets a Future and fills debug_html / debug_png from it once the files
+exist, typically after the download has overlapped the write.
+
+  XHS_DEBUG_MODE           always | on_failure (default) | sampled | off
+  XHS_DEBUG_SAMPLE         success sampling rate for "sampled" (default 0.05; failures always kept)
+  XHS_DEBUG_DIR            output folder (default ./debug)
+  XHS_DEBUG_IMAGE          jpeg (default) | png | none
+  XHS_DEBUG_JPEG_QUALITY   default 60
+  XHS_DEBUG_FULL_PAGE      1 = full-page screenshots (default 0, viewport only)
+  XHS_DEBUG_MAX_MB         total size kept in the folder (default 500)
+  XHS_DEBUG_MAX_AGE_HOURS  artifacts older than this are deleted (default 72)
+"""
+
+import asyncio
+import gzip
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Optional
+
+# --- Configuration ---
+DEBUG_MODE = os.environ.get("XHS_DEBUG_MODE", "on_failure")
+DEBUG_SAMPLE = float(os.environ.get("XHS_DEBUG_SAMPLE", "0.05"))
+DEBUG_DIR = Path(os.environ.get("XHS_DEBUG_DIR", "./debug"))
+DEBUG_IMAGE = os.environ.get("XHS_DEBUG_IMAGE", "jpeg")
+DEBUG_JPEG_QUALITY = int(os.environ.get("XHS_DEBUG_JPEG_QUALITY", "60"))
+DEBUG_FULL_PAGE = os.environ.get("XHS_DEBUG_FULL_PAGE", "0") == "1"
+DEBUG_MAX_BYTES = int(float(os.environ.get("XHS_DEBUG_MAX_MB", "500")) * 1024 * 1024)
+DEBUG_MAX_AGE_SEC = float(os.environ.get("XHS_DEBUG_MAX_AGE_HOURS", "72")) * 3600
+PRUNE_EVERY = 20  # writes between retention passes
+ARTIFACT_SUFFIXES = (".html.gz", ".html", ".jpg", ".png")
+
+
+class DebugStore:
+    def __init__(self, folder: Path = DEBUG_DIR, mode: str = DEBUG_MODE, sample: float = DEBUG_SAMPLE,
+                 image: str = DEBUG_IMAGE, quality: int = DEBUG_JPEG_QUALITY, full_page: bool = DEBUG_FULL_PAGE,
+                 max_bytes: int = DEBUG_MAX_BYTES, max_age_sec: float = DEBUG_MAX_AGE_SEC):
+        self.folder = folder
+        self.mode, self.sample = mode, sample
+        self.image, self.quality, self.full_page = image, quality, full_page
+        self.max_bytes, self.max_age_sec = max_bytes, max_age_sec
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="debug-writer")
+        self._lock = threading.Lock()
+        self._writes = 0
+        self.counters = {"captured": 0, "skipped": 0, "written_bytes": 0, "pruned": 0, "errors": 0}
+        self._executor.submit(self.prune)
+
+    def wants(self, ok: bool) -> bool:
+        if self.mode == "always":
+            keep = True
+        elif self.mode == "on_failure":
+            keep = not ok
+        elif self.mode == "sampled":
+            keep = not ok or random.random() < self.sample
+        else:
+            keep = False
+        with self._lock:
+            self.counters["captured" if keep else "skipped"] += 1
+        return keep
+
+    def screenshot_options(self) -> Optional[Dict]:
+        if self.image == "none":
+            return None
+        if self.image == "png":
+            return {"type": "png", "full_page": self.full_page}
+        return {"type": "jpeg", "quality": self.quality, "full_page": self.full_page}
+
+    def submit(self, html: Optional[str], image: Optional[bytes]) -> Future:
+        """Queue a write; the Future resolves to {"debug_html": path|None, "debug_png": path|None}."""
+        return self._executor.submit(self._write, uuid.uuid4().hex, html, image)
+
+    def _write(self, uid: str, html: Optional[str], image: Optional[bytes]) -> Dict:
+        out = {"debug_html": None, "debug_png": None}
+        self.folder.mkdir(parents=True, exist_ok=True)
+        try:
+            if html is not None:
+                p = self.folder / f"{uid}.html.gz"
+                p.write_bytes(gzip.compress(html.encode("utf-8"), compresslevel=6))
+                out["debug_html"] = str(p.resolve())
+                self.counters["written_bytes"] += p.stat().st_size
+            if image:
+                p = self.folder / f"{uid}{'.png' if self.image == 'png' else '.jpg'}"
+                p.write_bytes(image)
+                out["debug_png"] = str(p.resolve())
+                self.counters["written_bytes"] += len(image)
+        except OSError:
+            self.counters["errors"] += 1
+        self._writes += 1
+        if self._writes % PRUNE_EVERY == 0:
+            self.prune()
+        return out
+
+    def prune(self):
+        """Drop artifacts older than max_age_sec, then the oldest ones until under max_bytes."""
+        try:
+            files = [(p.stat().st_mtime, p.stat().st_size, p) for p in self.folder.iterdir()
+                     if p.is_file() and p.name.endswith(ARTIFACT_SUFFIXES)]
+        except OSError:
+            return
+        files.sort()
+        now, total = time.time(), sum(size for _, size, _ in files)
+        for mtime, size, p in files:
+            if now - mtime <= self.max_age_sec and total <= self.max_bytes:
+                break
+            try:
+                p.unlink()
+                total -= size
+                self.counters["pruned"] += 1
+            except OSError:
+                pass
+
+    def stats(self) -> Dict:
+        return dict(self.counters, mode=self.mode, folder=str(self.folder))
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+
+# --- capture helpers ---
+async def capture_async(store: DebugStore, page, ok: bool) -> Optional[Future]:
+    if not store.wants(ok):
+        return None
+    html = image = None
+    try:
+        html = await page.content()
+        opts = store.screenshot_options()
+        image = await page.screenshot(**opts) if opts else None
+    except Exception:
+        if html is None:
+            return None
+    return store.submit(html, image)
+
+
+async def collect_async(fut: Optional[Future], timeout: float = 10) -> Dict:
+    """Artifact paths of a finished write; fields stay None if nothing was written."""
+    if fut is None:
+        return {"debug_html": None, "debug_png": None}
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(fut), timeout)
+    except Exception:
+        return {"debug_html": None, "debug_png": None}
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_debug_store() -> DebugStore:
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = DebugStore()
+        return _default_store
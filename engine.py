@@ -0,0 +1,415 @@
+"""
+engine.py
+The one extraction + download path, shared by the batch CLI
+(xhs_batch_download.py), the API server (app_playwright_update.py) and its
+background jobs (jobs.py).
+
+An Engine owns one async Playwright instance, one AsyncBrowserPool and one
+aiohttp session per process. Every batch link, API request and job item is a
+coroutine on the same event loop, so a single process multiplexes many
+extractions over a few warm browsers:
+
+  resolve()              media store / cache / Seekin API / hedged browser extraction, then probing
+  probe / rank           concurrent probing and candidate ranking live in probe.py
+  choose_and_download()  link known media or download, hash and commit it
+  worker()               resolve + download for one link, with timings and metrics
+
+  XHS_EXTRACT_TIMEOUT   seconds a browser attempt waits for Seekin (default 90)
+  XHS_SEEKIN_URL        Seekin page to drive (e.g. the local stand-in of bench_servers.py)
+"""
+
+import asyncio
+import html
+import os
+import re
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import aiohttp
+from aiohttp import ClientTimeout
+from playwright.async_api import async_playwright, Page, Response
+
+from browser_pool import AsyncBrowserPool, PoolTimeout, POOL_SIZE
+from concurrency import ConcurrencyController, is_overload
+from debug_store import capture_async, collect_async, get_debug_store
+from extract_cache import get_default_cache
+from extract_state import ExtractionState, VIDEO_EXT_RE
+from ranged_download import ranged_download, RANGED_MIN_SIZE
+from hls import is_hls_url, download_hls
+from media_store import StreamHash, get_media_store
+from metrics import Timings, observe_result
+from probe import choose_candidate, probe_candidates
+from resource_filter import ResourceFilter, install_async, new_stats
+from ua_hedge import get_default_stats as get_ua_stats, run_hedged
+from seekin_api import get_default_store, replay_async
+from response_inspect import inspect_async, new_stats as new_inspect_stats
+
+# --- Configuration ---
+CONNECTOR_LIMIT = 100  # sockets; per-host download limits are enforced by LIMITS
+KEEPALIVE_SEC = 30  # idle pooled connections (e.g. from probing) stay open for the download
+SEEKIN_URL = os.environ.get("XHS_SEEKIN_URL", "https://www.seekin.ai/xiaohongshu-video-downloader/")
+TIMEOUT_SEC = float(os.environ.get("XHS_EXTRACT_TIMEOUT", "90"))
+INPUT_SELECTOR = 'input[type="text"], input[placeholder], textarea'
+USER_AGENTS = {
+    "mobile": "Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/604.1",
+    "desktop": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115 Safari/537.36",
+}
+CDN_HEADERS = {"User-Agent": USER_AGENTS["desktop"], "Referer": "https://www.xiaohongshu.com/"}
+CONTEXT_OPTIONS = {
+    "mobile": {"user_agent": USER_AGENTS["mobile"], "viewport": {"width":390,"height":844}},
+    "desktop": {"user_agent": USER_AGENTS["desktop"], "viewport": {"width":1280,"height":800}},
+}
+
+SANITIZE_FILENAME_RE = re.compile(r'[^A-Za-z0-9 _\-\.\(\)\[\]]+')
+EXPIRED_LINK_RE = re.compile(r"^download_failed: (403|410)\b")  # signed CDN URL refused: expired or revoked
+JS_TITLE_RE = re.compile(r"""title\s*:\s*(['"])(.*?)\1""", flags=re.IGNORECASE | re.DOTALL)
+RESOURCE_FILTER = ResourceFilter()
+LIMITS = ConcurrencyController()
+
+
+# --- Helpers ---
+async def download_file(session: aiohttp.ClientSession, url: str, out_path: Path, size: Optional[int] = None,
+                        hasher: Optional[StreamHash] = None) -> Tuple[bool, Optional[str]]:
+    if size and size >= RANGED_MIN_SIZE:
+        return await ranged_download(session, url, out_path, size, headers=CDN_HEADERS, hasher=hasher)
+    try:
+        async with session.get(url, headers=CDN_HEADERS, timeout=ClientTimeout(total=0)) as resp:
+            resp.raise_for_status()
+            with out_path.open("wb") as fh:
+                async for chunk in resp.content.iter_chunked(1 << 14):
+                    fh.write(chunk)
+                    if hasher: hasher.update(chunk)
+        return True, None
+    except Exception as e:
+        return False, str(e) or type(e).__name__  # a bare TimeoutError has no message
+
+
+def sanitize_filename(s: str, fallback: str = "video") -> str:
+    if not s: return fallback
+    s = html.unescape(s).strip()
+    s = SANITIZE_FILENAME_RE.sub("_", s)
+    s = re.sub(r"_+", "_", s)
+    return s[:180].rstrip("_")
+
+
+def extract_title_from_text(text: str) -> Optional[str]:
+    if not text: return None
+    m = JS_TITLE_RE.search(text)
+    if m: return m.group(2).strip()
+    return None
+
+
+def download_folder() -> Path:
+    """Where "<index> - <title>" names go: the media store's root, so hardlinks stay on one filesystem."""
+    return get_media_store().root
+
+
+def media_ext(url: str) -> str:
+    return ".ts" if is_hls_url(url) else (Path(url.split("?")[0]).suffix or ".mp4")
+
+
+def new_result(url: str, index: int) -> Dict:
+    return {"postUrl": url, "index": index, "found": False, "video_url": None, "error": None, "candidates": [], "caption": None,
+            "saved_to": None, "cached": False, "via": None, "ua": None, "resources": {}}
+
+
+# --- Seekin extraction ---
+async def try_extract_from_seekin(page: Page, post_url: str, collector: List[str], meta_out: Dict, state: Optional[ExtractionState] = None,
+                                  timings: Optional[Timings] = None):
+    state = state or ExtractionState(candidates=collector)
+    timings = timings if timings is not None else Timings()
+    inspection = meta_out.setdefault("inspection", new_inspect_stats())
+
+    async def on_response(resp: Response):
+        try: await inspect_async(resp, state, inspection, extract_title_from_text, api_url=SEEKIN_URL)
+        except: pass
+
+    page.on("response", on_response)
+    goto_started = time.monotonic()
+    await page.goto(SEEKIN_URL, wait_until="domcontentloaded")
+    try: await page.wait_for_selector(INPUT_SELECTOR, timeout=10000)
+    except: pass
+    try:
+        inp = await page.query_selector(INPUT_SELECTOR)
+        if inp:
+            await inp.fill(post_url)
+            btn = await page.query_selector('button[type="submit"], button:has-text("解析"), button:has-text("Download"), button[class*="btn"]')
+            if btn:
+                try: await btn.click()
+                except: await page.keyboard.press("Enter")
+            else: await page.keyboard.press("Enter")
+        else:
+            await page.goto(SEEKIN_URL + "?q=" + post_url)
+    except: pass
+    timings.add("goto", time.monotonic() - goto_started)
+
+    with timings.stage("wait"):
+        await state.wait_async(TIMEOUT_SEC)
+    if state.title and not meta_out.get("title"): meta_out["title"] = state.title
+    meta_out["extract_sec"] = state.elapsed()
+
+    if not collector:
+        try:
+            vids = await page.query_selector_all("video")
+            for v in vids:
+                src = await v.get_attribute("src")
+                if src and src not in collector: collector.append(src)
+                for s in await v.query_selector_all("source"):
+                    s2 = await s.get_attribute("src")
+                    if s2 and s2 not in collector: collector.append(s2)
+        except: pass
+    return collector, meta_out
+
+
+def backoff_signal(*outcomes: Tuple[Optional[int], Optional[str], bool]) -> Dict:
+    """status / error / timeout for the extract limiter: the first outcome that means Seekin is overloaded."""
+    for status, error, timeout in outcomes:
+        if is_overload(status, error, timeout):
+            return {"status": status, "error": error, "timeout": timeout}
+    return {}
+
+
+def browser_outcome(value) -> Tuple[Optional[int], Optional[str], bool]:
+    """(Seekin API status, error, timed out) of a browser extraction; a wait deadline counts as a timeout."""
+    if isinstance(value, Exception):
+        return None, str(value) or type(value).__name__, isinstance(value, asyncio.TimeoutError)
+    meta = value[1] if isinstance(value, tuple) and len(value) == 2 and isinstance(value[1], dict) else {}
+    return meta.get("api_status"), None, bool(meta.get("timed_out"))
+
+
+async def extract_with_browser(pool: AsyncBrowserPool, result: Dict, timings: Timings, lease_timeout: Optional[float] = None,
+                               capture_debug: bool = True):
+    """Hedged mobile/desktop extraction on a leased browser; returns (ua_key or None, value, debug future)."""
+    url = result["postUrl"]
+    api_store = get_default_store()
+    lease_started = time.monotonic()
+    async with pool.lease(timeout=lease_timeout) as lease:
+        timings.add("pool_wait", time.monotonic() - lease_started)
+        browser_started = time.monotonic()
+        attempt_timings, debug_futures = {}, {}
+        async def attempt(ua_key: str):
+            context = await lease.context(ua_key)
+            candidates, meta = [], {}
+            state = ExtractionState(candidates=candidates)
+            result["resources"][ua_key] = new_stats()
+            await install_async(context, RESOURCE_FILTER, result["resources"][ua_key], on_media=state.add_candidate)
+            page = await context.new_page()
+            page.set_default_timeout(TIMEOUT_SEC * 1000)
+            at = attempt_timings[ua_key] = Timings()
+            await try_extract_from_seekin(page, url, candidates, meta, state=state, timings=at)
+            result.setdefault("inspection", {})[ua_key] = meta.get("inspection")
+
+            normalized = list(dict.fromkeys(candidates))
+            if meta.get("medias") and isinstance(meta["medias"], list):
+                for m in meta["medias"]:
+                    if isinstance(m, str) and m not in normalized and VIDEO_EXT_RE.search(m): normalized.append(m)
+                    elif isinstance(m, dict):
+                        candidate_url = m.get("url") or m.get("src") or m.get("playUrl")
+                        if candidate_url and candidate_url not in normalized: normalized.append(candidate_url)
+            meta["hints"] = state.hints
+            meta["api_status"], meta["timed_out"] = state.api_status, state.timed_out
+            if normalized: api_store.record(state.api_request, url)
+            if capture_debug:
+                with at.stage("debug"):
+                    debug_futures[ua_key] = await capture_async(get_debug_store(), page, bool(normalized))
+            return bool(normalized), (normalized, meta)
+
+        # hedged: the second UA starts after HEDGE_DELAY_SEC or as soon as the first fails
+        ua_key, value = await run_hedged(get_ua_stats().order(["mobile", "desktop"]), attempt)
+        timings.add("browser", time.monotonic() - browser_started)
+        # hedged attempts overlap, so only the winner's (or last) stage split is reported
+        reported = ua_key or next(reversed(attempt_timings), None)
+        for stage, sec in attempt_timings.get(reported, {}).items():
+            timings.add(stage, sec)
+        return ua_key, value, debug_futures.get(reported)
+
+
+async def resolve(pool: AsyncBrowserPool, session: aiohttp.ClientSession, result: Dict, limits: Optional[ConcurrencyController] = None,
+                  lease_timeout: Optional[float] = None, use_store: bool = True,
+                  capture_debug: bool = True) -> Optional[Tuple[List[Dict], Optional[str]]]:
+    """Find and probe the candidates of result["postUrl"]; returns (cand_info, caption).
+
+    None means there is nothing to download: the post is already in the media
+    store (result is complete) or extraction failed (result["error"]). A debug
+    write still in flight is left in result["debug_future"]; capture_debug=False
+    (streaming) keeps pages out of ./debug.
+    """
+    url, index = result["postUrl"], result["index"]
+    limits = limits or LIMITS
+    timings = result.setdefault("timings", Timings())
+    cache = get_default_cache()
+    with timings.stage("cache"):  # both are SQLite-backed: off the event loop
+        stored = await asyncio.to_thread(get_media_store().lookup_note, url) if use_store else None
+        cached = None if stored else await asyncio.to_thread(cache.get, url)
+    if stored:  # this post's video is already on disk: no extraction, no download
+        result.update(via="store", found=True, dedup=True, video_url=stored["video_url"], caption=stored["title"])
+        name = download_folder() / f"{index} - {sanitize_filename(stored['title'] or f'xhs_{index}')}{stored['ext']}"
+        result["saved_to"] = await link_name(get_media_store(), stored, name)
+        return None
+    if cached:
+        result["cached"] = True; result["via"] = "cache"
+        return cached["candidates"], cached["title"]
+
+    async with limits.extract.slot() as slot:
+        api_outcome: Dict = {}
+        with timings.stage("api"):
+            api_state = await replay_async(session, get_default_store(), url, api_outcome)
+        api_signal = (api_outcome.get("status"), api_outcome.get("error"), api_outcome.get("timeout", False))
+        if api_state:
+            result["via"] = "api"
+            ua_key, value = "api", (list(api_state.candidates), {"title": api_state.title, "hints": api_state.hints})
+        else:
+            result["via"] = "browser"
+            pool_wait = timings.get("pool_wait", 0.0)
+            try:
+                ua_key, value, result["debug_future"] = await extract_with_browser(pool, result, timings, lease_timeout,
+                                                                                    capture_debug)
+                # waiting for a free browser is local contention, not Seekin latency: a saturated pool must not grow the limit
+                slot.exclude(timings.get("pool_wait", 0.0) - pool_wait)
+            except PoolTimeout as e:
+                # local browser contention, not Seekin overload: an error, not a reason to back off
+                slot.report(False, **backoff_signal(api_signal))
+                result.update(error="browser_pool_busy", detail=str(e))
+                return None
+        # Seekin 429/5xx (replayed API or the page's XHR) and wait deadlines shrink the extract limit; "no video" does not
+        slot.report(ua_key is not None, **backoff_signal(browser_outcome(value), api_signal))
+
+    if ua_key is None:
+        if isinstance(value, Exception): result["error"] = str(value)
+        return None
+    normalized, meta = value
+    if ua_key != "api": result["ua"] = ua_key
+    with timings.stage("probe"):
+        cand_info = await probe_candidates(session, normalized, CDN_HEADERS, hints=meta.get("hints"))
+    caption = meta.get("title") or meta.get("name")
+    await asyncio.to_thread(cache.put, url, caption, cand_info)
+    return cand_info, caption
+
+
+# --- download ---
+async def link_name(media, entry: Dict, name: Path) -> str:
+    """Link a stored blob under name (SQLite index + filesystem), off the event loop."""
+    return str((await asyncio.to_thread(media.link, entry, name)).resolve())
+
+
+async def attach_debug(result: Dict, fut) -> None:
+    for key, path in (await collect_async(fut)).items():
+        if path: result[key] = path
+
+
+async def choose_and_download(session: aiohttp.ClientSession, result: Dict, cand_info: List[Dict], caption: Optional[str], index: int,
+                              limits: Optional[ConcurrencyController] = None) -> Dict:
+    result["candidates"] = cand_info
+    chosen = choose_candidate(cand_info)
+    if not chosen: result["error"]="no_candidate_chosen"; return result
+
+    chosen_url = chosen["url"]
+    result["video_url"] = chosen_url; result["found"]=True
+    result["caption"] = caption
+
+    ext = media_ext(chosen_url)
+    name = download_folder() / f"{index} - {sanitize_filename(caption or f'xhs_{index}')}{ext}"
+
+    media = get_media_store()
+    known = await asyncio.to_thread(media.lookup_url, chosen_url)
+    if known:  # same video already stored: link it, fetch nothing
+        await asyncio.to_thread(media.remember, result["postUrl"], chosen_url, known, caption)
+        result["saved_to"] = await link_name(media, known, name); result["dedup"] = True
+        return result
+
+    staging = await asyncio.to_thread(media.staging_path, chosen_url, ext)  # takes the staging lock file
+    hasher = StreamHash()
+    timings = result.setdefault("timings", Timings())
+    try:
+        async with (limits or LIMITS).download(chosen_url).slot() as slot:
+            with timings.stage("download"):
+                if is_hls_url(chosen_url):
+                    ok, err, staging = await download_hls(session, chosen_url, staging, CDN_HEADERS, hasher=hasher)
+                else:
+                    ok, err = await download_file(session, chosen_url, staging, size=chosen.get("size_bytes"), hasher=hasher)
+            slot.report(ok, error=err)
+    except BaseException:
+        media.release(staging)  # cancelled mid-download: the next attempt may take the lock and resume
+        raise
+    if not ok:
+        media.release(staging)
+        result["error"]=f"download_failed: {err}"; return result
+    # commit re-hashes only a file its hasher did not fully see: keep that off the event loop
+    stored = await asyncio.to_thread(media.commit, staging, result["postUrl"], chosen_url, caption, hasher)
+    result["saved_to"] = await link_name(media, stored, name); result["downloaded_bytes"] = stored["size"]
+    return result
+
+
+async def worker(pool: AsyncBrowserPool, session: aiohttp.ClientSession, url: str, index: int, semaphore: asyncio.Semaphore,
+                 limits: Optional[ConcurrencyController] = None, lease_timeout: Optional[float] = None) -> Dict:
+    result = new_result(url, index)
+    timings = result["timings"] = Timings()
+    started = time.monotonic()
+    try:
+        async with semaphore:
+            found = await resolve(pool, session, result, limits, lease_timeout)
+            if found:
+                await choose_and_download(session, result, found[0], found[1], index, limits)
+            if result.get("cached") and EXPIRED_LINK_RE.match(result.get("error") or ""):
+                # the cached signed URLs were refused: forget them and extract once more
+                await asyncio.to_thread(get_default_cache().invalidate, url)
+                result.update(error=None, cached=False, via=None, found=False, video_url=None, stale_cache=True)
+                found = await resolve(pool, session, result, limits, lease_timeout)
+                if found:
+                    await choose_and_download(session, result, found[0], found[1], index, limits)
+            await attach_debug(result, result.pop("debug_future", None))  # written while the download ran
+    except Exception as e:  # one item's failure (browser relaunch, disk) must not cancel the rest of a batch
+        result["error"] = str(e) or type(e).__name__
+    finally:
+        result.pop("debug_future", None)
+        timings["total"] = round(time.monotonic() - started, 3)
+        observe_result(result)
+    return result
+
+
+# --- Engine ---
+class Engine:
+    def __init__(self, pool_size: int = POOL_SIZE, limits: Optional[ConcurrencyController] = None,
+                 connector_limit: int = CONNECTOR_LIMIT):
+        self.pool_size = pool_size
+        self.limits = limits or LIMITS
+        self.connector_limit = connector_limit
+        self.playwright = None
+        self.pool: Optional[AsyncBrowserPool] = None
+        self.session: Optional[aiohttp.ClientSession] = None
+
+    async def start(self):
+        self.playwright = await async_playwright().start()
+        try:
+            self.pool = await AsyncBrowserPool(self.playwright, size=self.pool_size, context_options=CONTEXT_OPTIONS).start()
+        except BaseException:
+            await self.playwright.stop()
+            raise
+        conn = aiohttp.TCPConnector(limit=self.connector_limit, keepalive_timeout=KEEPALIVE_SEC, ssl=False)
+        self.session = aiohttp.ClientSession(timeout=ClientTimeout(total=0), connector=conn)
+        return self
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+        if self.pool is not None:
+            await self.pool.close()
+        if self.playwright is not None:
+            await self.playwright.stop()
+        self.session = self.pool = self.playwright = None
+
+    async def process(self, url: str, index: int, semaphore=None, lease_timeout: Optional[float] = None) -> Dict:
+        """Extract and download one link; lease_timeout=None waits for a browser, -1 uses the pool's acquire timeout."""
+        return await worker(self.pool, self.session, url, index, semaphore or nullcontext(), self.limits, lease_timeout)
+
+    async def resolve(self, result: Dict, lease_timeout: Optional[float] = None, use_store: bool = True,
+                      capture_debug: bool = True):
+        return await resolve(self.pool, self.session, result, self.limits, lease_timeout, use_store, capture_debug)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
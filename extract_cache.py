@@ -0,0 +1,166 @@
+"""
+extract_cache.py
+Cache of Seekin extraction results keyed by Xiaohongshu note ID.
+
+The key is the note ID from the postUrl path, so the volatile xsec_token /
+xsec_source query does not defeat the cache. Values hold the title and the
+probed candidate list ({"url", "size_bytes"}). There is an in-memory LRU
+layer and, when XHS_CACHE_DB is set, a SQLite layer on disk that survives
+restarts and is shared between processes.
+
+Candidates are signed CDN URLs, so an entry never outlives the earliest
+expiry found in their query strings (probe.signed_expiry), whatever
+XHS_CACHE_TTL_SEC says. The engine drops an entry whose download is refused
+with 403 / 410 and extracts the note again.
+"""
+
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from probe import EXPIRY_MARGIN_SEC, signed_expiry
+
+# --- Configuration ---
+CACHE_TTL_SEC = int(os.environ.get("XHS_CACHE_TTL_SEC", "3600"))
+CACHE_MAX_ENTRIES = int(os.environ.get("XHS_CACHE_MAX_ENTRIES", "2048"))
+CACHE_DB = os.environ.get("XHS_CACHE_DB") or None
+CACHE_DB_MAX_ENTRIES = int(os.environ.get("XHS_CACHE_DB_MAX_ENTRIES", "100000"))
+
+NOTE_ID_RE = re.compile(r"^[0-9a-f]{24}$", flags=re.I)
+
+
+def note_id_from_url(url: str) -> str:
+    """Note ID from a post URL (last 24-hex path segment); falls back to the URL without its query."""
+    parts = urlsplit((url or "").strip())
+    segments = [s for s in parts.path.split("/") if s]
+    for seg in reversed(segments):
+        if NOTE_ID_RE.match(seg):
+            return seg.lower()
+    return f"{parts.netloc}{parts.path}".rstrip("/") or (url or "")
+
+
+class ExtractionCache:
+    def __init__(self, ttl_sec: int = CACHE_TTL_SEC, max_entries: int = CACHE_MAX_ENTRIES,
+                 db_path: Optional[str] = CACHE_DB, db_max_entries: int = CACHE_DB_MAX_ENTRIES):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max(1, max_entries)
+        self.db_max_entries = db_max_entries
+        self._mem: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        self._puts_since_trim = 0
+        self.stats_counters = {"hits": 0, "memory_hits": 0, "disk_hits": 0, "misses": 0, "puts": 0, "evictions": 0, "expired": 0,
+                               "invalidated": 0}
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False, timeout=10)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS extract_cache ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            self._db.commit()
+
+    def get(self, post_url: str) -> Optional[Dict]:
+        key = note_id_from_url(post_url)
+        now = time.time()
+        with self._lock:
+            entry = self._mem.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._mem.move_to_end(key)
+                    self.stats_counters["hits"] += 1
+                    self.stats_counters["memory_hits"] += 1
+                    return json.loads(value)
+                del self._mem[key]
+                self.stats_counters["expired"] += 1
+            if self._db is not None:
+                row = self._db.execute("SELECT value, expires_at FROM extract_cache WHERE key = ?", (key,)).fetchone()
+                if row and row[1] > now:
+                    self._db.execute("UPDATE extract_cache SET accessed_at = ? WHERE key = ?", (now, key))
+                    self._db.commit()
+                    self._remember(key, row[1], row[0])
+                    self.stats_counters["hits"] += 1
+                    self.stats_counters["disk_hits"] += 1
+                    return json.loads(row[0])
+            self.stats_counters["misses"] += 1
+            return None
+
+    def put(self, post_url: str, title: Optional[str], candidates: list):
+        if not candidates:
+            return  # never cache a failed extraction
+        key = note_id_from_url(post_url)
+        now = time.time()
+        expires_at = now + self.ttl_sec
+        signed = [signed_expiry(c["url"]) for c in candidates if isinstance(c, dict) and c.get("url")]
+        signed = [s for s in signed if s is not None]
+        if signed:
+            expires_at = min(expires_at, min(signed) - EXPIRY_MARGIN_SEC)
+        if expires_at <= now:
+            return  # the URLs are about to expire: caching them would only hand out dead links
+        value = json.dumps({"title": title, "candidates": candidates, "cached_at": now}, ensure_ascii=False)
+        with self._lock:
+            self._remember(key, expires_at, value)
+            self.stats_counters["puts"] += 1
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO extract_cache (key, value, expires_at, accessed_at) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now),
+                )
+                self._puts_since_trim += 1
+                if self._puts_since_trim >= 100:
+                    self._trim_db(now)
+                self._db.commit()
+
+    def invalidate(self, post_url: str):
+        """Forget a note, e.g. after its cached URLs were refused by the CDN."""
+        key = note_id_from_url(post_url)
+        with self._lock:
+            self._mem.pop(key, None)
+            if self._db is not None:
+                self._db.execute("DELETE FROM extract_cache WHERE key = ?", (key,))
+                self._db.commit()
+            self.stats_counters["invalidated"] += 1
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self.stats_counters)
+            out["entries"] = len(self._mem)
+            lookups = out["hits"] + out["misses"]
+            out["hit_ratio"] = round(out["hits"] / lookups, 4) if lookups else None
+            return out
+
+    def _remember(self, key: str, expires_at: float, value: str):
+        self._mem[key] = (expires_at, value)
+        self._mem.move_to_end(key)
+        while len(self._mem) > self.max_entries:
+            self._mem.popitem(last=False)
+            self.stats_counters["evictions"] += 1
+
+    def _trim_db(self, now: float):
+        self._puts_since_trim = 0
+        self._db.execute("DELETE FROM extract_cache WHERE expires_at <= ?", (now,))
+        self._db.execute(
+            "DELETE FROM extract_cache WHERE key IN ("
+            " SELECT key FROM extract_cache ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+            (self.db_max_entries,),
+        )
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> ExtractionCache:
+    """Process-wide cache shared by the API, the jobs loop and the batch CLI."""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ExtractionCache()
+        return _default_cache
@@ -0,0 +1,133 @@
+"""
+extract_state.py
+Shared state of one Seekin extraction attempt with event-driven completion.
+
+Response handlers feed the state (feed_json / add_candidate / set_title) and
+the state signals completion as soon as the configured criteria are met.
+Waiting is deadline based: wait_async() awaits an asyncio.Event. After
+completion a short settle window collects sibling candidates (e.g. the other
+qualities in medias[]).
+
+  XHS_COMPLETION   any_candidate (default) | mp4 | title_and_medias | title_or_candidate
+  XHS_SETTLE_SEC   settle window after completion (default 0.3)
+"""
+
+import asyncio
+import os
+import re
+import time
+from typing import Dict, List, Optional
+
+# --- Configuration ---
+COMPLETION_CRITERIA = os.environ.get("XHS_COMPLETION", "any_candidate")
+SETTLE_SEC = float(os.environ.get("XHS_SETTLE_SEC", "0.3"))
+
+VIDEO_EXT_RE = re.compile(r"\.(mp4|webm|m3u8|ts)(?:\?|$)", flags=re.I)
+HINT_KEYS = ("quality", "height", "width", "resolution")
+MP4_RE = re.compile(r"\.(mp4|webm)(?:\?|$)", flags=re.I)
+TITLE_SOURCES = {"text": 0, "json": 1}  # a title from the API JSON replaces one scraped from HTML / JS
+
+
+class ExtractionState:
+    def __init__(self, criteria: str = COMPLETION_CRITERIA, settle_sec: float = SETTLE_SEC,
+                 candidates: Optional[List[str]] = None):
+        self.criteria = criteria
+        self.settle_sec = settle_sec
+        self.title: Optional[str] = None
+        self.title_source: Optional[str] = None
+        self.candidates: List[str] = candidates if candidates is not None else []
+        self.medias_seen = False
+        self.hints: Dict[str, Dict] = {}  # candidate URL -> quality fields of its medias[] entry
+        self.api_request = None  # Playwright request that delivered data.medias
+        self.api_status: Optional[int] = None  # HTTP status of Seekin's API call (an error sticks until data arrives)
+        self.timed_out = False  # the wait deadline passed before completion
+        self.started_at = time.monotonic()
+        self.completed_at: Optional[float] = None
+        self._event: Optional[asyncio.Event] = None
+
+    # --- feeding ---
+    def add_candidate(self, url: Optional[str]):
+        if url and url not in self.candidates:
+            self.candidates.append(url)
+            self._check()
+
+    def set_title(self, title: Optional[str], source: str = "text"):
+        """First title wins within a source; a higher-ranked source (TITLE_SOURCES) replaces it."""
+        if not title:
+            return
+        if self.title and TITLE_SOURCES.get(source, 0) <= TITLE_SOURCES.get(self.title_source, 0):
+            return
+        self.title, self.title_source = title, source
+        self._check()
+
+    def note_status(self, status: Optional[int], delivered: bool = False):
+        """Record the status of a Seekin API response; delivered=True for the one that carried data."""
+        if status and (delivered or status >= 400 or self.api_status is None):
+            self.api_status = status
+
+    def feed_json(self, j) -> bool:
+        """Consume a Seekin API payload ({data: {title, medias: [...]}}). True if it looked like one."""
+        if not isinstance(j, dict):
+            return False
+        data = j.get("data") or j.get("result") or j.get("payload")
+        if not isinstance(data, dict):
+            return False
+        self.set_title(data.get("title") or data.get("name") or data.get("desc"), source="json")
+        medias = data.get("medias") or data.get("media") or data.get("urls")
+        if isinstance(medias, list):
+            for m in medias:
+                candidate_url = None
+                if isinstance(m, dict):
+                    candidate_url = m.get("url") or m.get("uri") or m.get("src") or m.get("playUrl")
+                    if not candidate_url:
+                        for v in m.values():
+                            if isinstance(v, str) and VIDEO_EXT_RE.search(v):
+                                candidate_url = v
+                                break
+                    hint = {k: m[k] for k in HINT_KEYS if m.get(k)}
+                    if candidate_url and hint:
+                        self.hints[candidate_url] = hint
+                elif isinstance(m, str) and VIDEO_EXT_RE.search(m):
+                    candidate_url = m
+                if candidate_url and candidate_url not in self.candidates:
+                    self.candidates.append(candidate_url)
+            self.medias_seen = True
+        self._check()
+        return True
+
+    # --- completion ---
+    def is_complete(self) -> bool:
+        if self.criteria == "mp4":
+            return any(MP4_RE.search(u) for u in self.candidates)
+        if self.criteria == "title_and_medias":
+            return bool(self.title) and self.medias_seen
+        if self.criteria == "title_or_candidate":
+            return bool(self.title or self.candidates)
+        return bool(self.candidates)
+
+    def _check(self):
+        if self.completed_at is None and self.is_complete():
+            self.completed_at = time.monotonic()
+            if self._event is not None:
+                self._event.set()
+
+    def elapsed(self) -> float:
+        return round((self.completed_at or time.monotonic()) - self.started_at, 3)
+
+    # --- waiting ---
+    async def wait_async(self, timeout: float) -> bool:
+        """Wait until complete (plus the settle window) or until timeout seconds elapsed."""
+        if self._event is None:
+            self._event = asyncio.Event()
+            if self.completed_at is not None:
+                self._event.set()
+        if not self._event.is_set():  # wait_for(..., 0) would time out even on a set event
+            try:
+                await asyncio.wait_for(self._event.wait(), max(0.0, timeout))
+            except asyncio.TimeoutError:
+                self.timed_out = True
+                return False
+        if self.settle_sec > 0:
+            await asyncio.sleep(self.settle_sec)
+        return True
+
@@ -0,0 +1,236 @@
+"""
+hls.py
+Native HLS (.m3u8) support: playlist parsing, variant selection, size
+estimation and a concurrent segment downloader.
+
+Segments are fetched by HLS_CONCURRENCY workers with per-segment retry and
+written strictly in playlist order into a single output file. At most
+HLS_WINDOW segments are fetched ahead of the write position, so memory is
+bounded by the reorder window and not by the video length. Playlists with an
+EXT-X-MAP init segment (fMP4) are written as .mp4, classic MPEG-TS as .ts.
+Encrypted playlists (EXT-X-KEY other than NONE) are reported as unsupported.
+"""
+
+import asyncio
+import os
+import re
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urljoin
+
+import aiohttp
+
+# --- Configuration ---
+HLS_CONCURRENCY = int(os.environ.get("XHS_HLS_CONCURRENCY", "6"))
+HLS_WINDOW = int(os.environ.get("XHS_HLS_WINDOW", "12"))
+HLS_SEGMENT_RETRIES = 3
+HLS_VARIANT_POLICY = os.environ.get("XHS_HLS_VARIANT_POLICY", "highest")  # highest | lowest | max_height:<px>
+PLAYLIST_TIMEOUT = 10
+SEGMENT_TIMEOUT = 60
+
+ATTR_RE = re.compile(r'([A-Z0-9\-]+)=("[^"]*"|[^",]*)')
+
+
+class HLSError(Exception):
+    pass
+
+
+def is_hls_url(url: str) -> bool:
+    return url.split("?")[0].lower().endswith(".m3u8")
+
+
+# --- Parsing ---
+def _attrs(line: str) -> Dict[str, str]:
+    _, _, rest = line.partition(":")
+    return {k: v.strip('"') for k, v in ATTR_RE.findall(rest)}
+
+
+def _byterange(value: str, next_offset: int) -> Tuple[int, int]:
+    length, _, offset = value.partition("@")
+    start = int(offset) if offset else next_offset
+    return start, int(length)
+
+
+def parse_playlist(text: str, base_url: str) -> Dict:
+    """Parse a master or media playlist into a plain dict."""
+    lines = [ln.strip() for ln in (text or "").splitlines() if ln.strip()]
+    if not lines or not lines[0].startswith("#EXTM3U"):
+        raise HLSError("not an m3u8 playlist")
+
+    variants, segments = [], []
+    out = {"type": "media", "variants": variants, "segments": segments, "target_duration": None,
+           "init": None, "encrypted": False, "endlist": False}
+    pending_variant, duration, byterange, next_offset = None, None, None, 0
+    for ln in lines[1:]:
+        if ln.startswith("#EXT-X-STREAM-INF"):
+            a = _attrs(ln)
+            res = a.get("RESOLUTION", "")
+            w, _, h = res.partition("x")
+            pending_variant = {
+                "bandwidth": int(a["BANDWIDTH"]) if a.get("BANDWIDTH", "").isdigit() else None,
+                "width": int(w) if w.isdigit() else None,
+                "height": int(h) if h.isdigit() else None,
+                "codecs": a.get("CODECS"),
+            }
+        elif ln.startswith("#EXTINF"):
+            try: duration = float(ln.split(":", 1)[1].split(",")[0])
+            except ValueError: duration = 0.0
+        elif ln.startswith("#EXT-X-BYTERANGE"):
+            byterange = _byterange(ln.split(":", 1)[1], next_offset)
+        elif ln.startswith("#EXT-X-TARGETDURATION"):
+            try: out["target_duration"] = float(ln.split(":", 1)[1])
+            except ValueError: pass
+        elif ln.startswith("#EXT-X-MAP"):
+            a = _attrs(ln)
+            out["init"] = {"uri": urljoin(base_url, a.get("URI", "")),
+                           "byterange": _byterange(a["BYTERANGE"], 0) if a.get("BYTERANGE") else None}
+        elif ln.startswith("#EXT-X-KEY"):
+            if _attrs(ln).get("METHOD", "NONE").upper() != "NONE":
+                out["encrypted"] = True
+        elif ln.startswith("#EXT-X-ENDLIST"):
+            out["endlist"] = True
+        elif ln.startswith("#"):
+            continue
+        elif pending_variant is not None:
+            pending_variant["uri"] = urljoin(base_url, ln)
+            variants.append(pending_variant)
+            pending_variant = None
+        else:
+            segments.append({"uri": urljoin(base_url, ln), "duration": duration or 0.0, "byterange": byterange})
+            if byterange:
+                next_offset = byterange[0] + byterange[1]
+            duration, byterange = None, None
+    if variants:
+        out["type"] = "master"
+    return out
+
+
+def select_variant(variants: List[Dict], policy: str = HLS_VARIANT_POLICY) -> Optional[Dict]:
+    if not variants:
+        return None
+    by_bw = sorted(variants, key=lambda v: (v.get("bandwidth") or 0, v.get("height") or 0))
+    if policy == "lowest":
+        return by_bw[0]
+    if policy.startswith("max_height:"):
+        limit = int(policy.split(":", 1)[1])
+        fitting = [v for v in by_bw if v.get("height") and v["height"] <= limit]
+        return fitting[-1] if fitting else by_bw[0]
+    return by_bw[-1]
+
+
+def estimate_size(media: Dict, bandwidth: Optional[int]) -> Optional[int]:
+    """Byte estimate from explicit byteranges, else total duration x bandwidth."""
+    segs = media.get("segments") or []
+    if segs and all(s.get("byterange") for s in segs):
+        return sum(s["byterange"][1] for s in segs)
+    total_sec = sum(s.get("duration") or 0.0 for s in segs)
+    if bandwidth and total_sec:
+        return int(total_sec * bandwidth / 8)
+    return None
+
+
+# --- Network ---
+async def _get_text(session: aiohttp.ClientSession, url: str, headers: Dict) -> str:
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=PLAYLIST_TIMEOUT)) as resp:
+        resp.raise_for_status()
+        return await resp.text()
+
+
+async def resolve_media_playlist(session: aiohttp.ClientSession, url: str, headers: Dict,
+                                 policy: str = HLS_VARIANT_POLICY) -> Tuple[Dict, Optional[Dict]]:
+    """Return (media playlist, chosen variant or None) for a master or media URL."""
+    pl = parse_playlist(await _get_text(session, url, headers), url)
+    variant = None
+    if pl["type"] == "master":
+        variant = select_variant(pl["variants"], policy)
+        pl = parse_playlist(await _get_text(session, variant["uri"], headers), variant["uri"])
+    return pl, variant
+
+
+async def probe_hls(session: aiohttp.ClientSession, url: str, headers: Optional[Dict] = None,
+                    policy: str = HLS_VARIANT_POLICY) -> Dict:
+    """Candidate metadata for an m3u8 URL: estimated size, duration, resolution."""
+    headers = headers or {}
+    try:
+        media, variant = await resolve_media_playlist(session, url, headers, policy)
+    except Exception as e:
+        return {"size_bytes": None, "error": str(e)}
+    variant = variant or {}
+    return {
+        "size_bytes": estimate_size(media, variant.get("bandwidth")),
+        "duration_sec": round(sum(s["duration"] for s in media["segments"]), 3),
+        "segments": len(media["segments"]),
+        "height": variant.get("height"),
+        "bandwidth": variant.get("bandwidth"),
+        "encrypted": media["encrypted"],
+    }
+
+
+async def fetch_segment(session: aiohttp.ClientSession, seg: Dict, headers: Dict) -> bytes:
+    hdrs = dict(headers)
+    if seg.get("byterange"):
+        start, length = seg["byterange"]
+        hdrs["Range"] = f"bytes={start}-{start + length - 1}"
+    for attempt in range(HLS_SEGMENT_RETRIES + 1):
+        try:
+            async with session.get(seg["uri"], headers=hdrs, timeout=aiohttp.ClientTimeout(total=SEGMENT_TIMEOUT)) as resp:
+                resp.raise_for_status()
+                return await resp.read()
+        except Exception:
+            if attempt >= HLS_SEGMENT_RETRIES:
+                raise
+            await asyncio.sleep(min(2 ** attempt, 8))
+
+
+async def download_hls(session: aiohttp.ClientSession, url: str, out_path: Path, headers: Optional[Dict] = None,
+                       policy: str = HLS_VARIANT_POLICY, concurrency: int = HLS_CONCURRENCY,
+                       window: int = HLS_WINDOW, hasher=None) -> Tuple[bool, Optional[str], Path]:
+    """Download an HLS stream into one file. Returns (ok, error, final_path).
+
+    hasher (anything with update(bytes)) sees the bytes in file order.
+    """
+    headers = headers or {}
+    try:
+        media, _ = await resolve_media_playlist(session, url, headers, policy)
+        if media["encrypted"]:
+            return False, "hls_encrypted_unsupported", out_path
+        segments = media["segments"]
+        if not segments:
+            return False, "hls_no_segments", out_path
+        out_path = out_path.with_suffix(".mp4" if media["init"] else ".ts")
+        part = out_path.with_name(out_path.name + ".part")
+
+        window = max(window, concurrency)
+        sem = asyncio.Semaphore(concurrency)
+
+        async def fetch(seg):
+            async with sem:
+                return await fetch_segment(session, seg, headers)
+
+        pending: Dict[int, asyncio.Task] = {}
+        next_to_start = 0
+        with part.open("wb") as fh:
+            def write(data: bytes):
+                fh.write(data)
+                if hasher is not None:
+                    hasher.update(data)
+
+            if media["init"]:
+                write(await fetch_segment(session, media["init"], headers))
+            try:
+                for i in range(len(segments)):
+                    # keep the reorder window full, then write segment i as soon as it lands
+                    while next_to_start < len(segments) and next_to_start < i + window:
+                        pending[next_to_start] = asyncio.ensure_future(fetch(segments[next_to_start]))
+                        next_to_start += 1
+                    write(await pending.pop(i))
+            finally:
+                for t in pending.values():
+                    t.cancel()
+                if pending:
+                    await asyncio.gather(*pending.values(), return_exceptions=True)
+        os.replace(part, out_path)
+        return True, None, out_path
+    except Exception as e:
+        return False, str(e) or type(e).__name__, out_path
+
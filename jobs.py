@@ -0,0 +1,210 @@
+"""
+jobs.py
+Background batch jobs for the API server.
+
+A job is a batch in the shared work queue (work_queue.py, XHS_JOBS_QUEUE),
+so every server process can answer GET/DELETE /jobs/<id> and every process
+works on every job. Each process runs one bounded producer/consumer loop,
+like the batch CLI: the producer leases items of the oldest active jobs into
+a queue of JOB_CONCURRENCY slots, JOB_CONCURRENCY consumers run them through
+the process's engine.Engine (browser pool, aiohttp session, adaptive
+limits, shared with /extract), heartbeat their leases and publish results.
+
+Cancelling a job marks its queued and running items cancelled in the store
+at once; processes still running one of them stop it within JOB_POLL_SEC.
+
+  XHS_JOBS_QUEUE          queue URL for jobs (default sqlite://jobs.sqlite; use a shared volume across hosts)
+  XHS_JOB_CONCURRENCY     items in flight per server process (default XHS_POOL_SIZE)
+  XHS_JOB_MAX_ITEMS       links per job (default 10000)
+  XHS_JOB_RETENTION_SEC   how long finished jobs stay queryable (default 3600)
+  XHS_JOB_MAX_ATTEMPTS    attempts per item; 2+ also retries items of a crashed process (default 1)
+"""
+
+import asyncio
+import os
+import socket
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+
+from browser_pool import POOL_SIZE
+from work_queue import open_queue
+
+# --- Configuration ---
+JOBS_QUEUE_URL = os.environ.get("XHS_JOBS_QUEUE", "sqlite://jobs.sqlite")
+JOB_CONCURRENCY = int(os.environ.get("XHS_JOB_CONCURRENCY", str(POOL_SIZE)))
+JOB_MAX_ITEMS = int(os.environ.get("XHS_JOB_MAX_ITEMS", "10000"))
+JOB_RETENTION_SEC = int(os.environ.get("XHS_JOB_RETENTION_SEC", "3600"))
+JOB_MAX_ATTEMPTS = int(os.environ.get("XHS_JOB_MAX_ATTEMPTS", "1"))
+JOB_POLL_SEC = 1.0  # idle producers look for new jobs, running items for cancellation
+JOB_BATCH_PREFIX = "job:"
+
+# queue item status -> job item status
+ITEM_STATUS = {"pending": "queued", "leased": "running", "done": "succeeded", "failed": "failed", "cancelled": "cancelled"}
+
+
+class JobManager:
+    def __init__(self, engine, queue=None, concurrency: int = JOB_CONCURRENCY, retention_sec: int = JOB_RETENTION_SEC):
+        self.engine = engine
+        self.queue = queue or open_queue(JOBS_QUEUE_URL, max_attempts=JOB_MAX_ATTEMPTS)
+        self.concurrency = max(1, concurrency)
+        self.retention_sec = retention_sec
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self._held: Dict[Tuple[str, int], Optional[asyncio.Task]] = {}  # leased here: waiting (None) or running
+        self._dropped = set()  # held keys whose job was cancelled before they started
+        self._wake = asyncio.Event()
+        self._loop: Optional[asyncio.Task] = None
+
+    def start(self) -> "JobManager":
+        self._loop = asyncio.ensure_future(self._run())
+        return self
+
+    async def close(self):
+        if self._loop is not None:
+            self._loop.cancel()
+            await asyncio.gather(self._loop, return_exceptions=True)
+
+    # --- public API (called from request handlers) ---
+    async def submit(self, links: List[Tuple[int, str]]) -> Dict:
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self._create, JOB_BATCH_PREFIX + job_id, links)
+        self._wake.set()
+        return await self.get(job_id)
+
+    async def get(self, job_id: str) -> Optional[Dict]:
+        return await asyncio.to_thread(self._snapshot, job_id)
+
+    async def cancel(self, job_id: str) -> Optional[Dict]:
+        batch = JOB_BATCH_PREFIX + job_id
+        if await asyncio.to_thread(self.queue.cancel, batch) is None:
+            return None
+        self._stop([k for k in self._held if k[0] == batch])
+        return await self.get(job_id)
+
+    def _stop(self, keys: List[Tuple[str, int]]):
+        for key in keys:
+            task = self._held.get(key)
+            if task is not None:
+                task.cancel()
+            elif key in self._held:
+                self._dropped.add(key)
+
+    # --- store (run in threads) ---
+    def _create(self, batch: str, links: List[Tuple[int, str]]):
+        self.queue.purge(JOB_BATCH_PREFIX, time.time() - self.retention_sec)
+        self.queue.add(batch, links)
+        self.queue.open_batch(batch)  # after the items, so other processes never see a half-loaded job
+
+    def _snapshot(self, job_id: str) -> Optional[Dict]:
+        batch = JOB_BATCH_PREFIX + job_id
+        info = self.queue.batch_info(batch)
+        if info is None:
+            return None
+        items = self.queue.items(batch)
+        counts: Dict[str, int] = {}
+        for it in items:
+            it["status"] = ITEM_STATUS[it["status"]]
+            counts[it["status"]] = counts.get(it["status"], 0) + 1
+        unfinished = counts.get("queued", 0) + counts.get("running", 0)
+        if info["cancelled_at"]:
+            status, finished_at = "cancelled", info["cancelled_at"]
+        elif unfinished:
+            status, finished_at = "running" if info["started_at"] else "queued", None
+        else:
+            status, finished_at = "done", max((it["updated_at"] or 0 for it in items), default=info["created_at"])
+        for it in items:
+            del it["updated_at"]
+        return {"id": job_id, "status": status, "created_at": info["created_at"], "started_at": info["started_at"],
+                "finished_at": finished_at, "total": len(items), "counts": counts, "items": items}
+
+    def _lease_next(self) -> Optional[Tuple[str, Dict]]:
+        for batch in self.queue.active_batches(JOB_BATCH_PREFIX):
+            leased = self.queue.lease(batch, self.owner, 1)
+            if leased:
+                return batch, leased[0]
+        return None
+
+    def _watch(self, keys: List[Tuple[str, int]], beat: bool) -> List[Tuple[str, int]]:
+        """Heartbeat the leases if due; return the keys whose job was cancelled."""
+        batches = {b for b, _ in keys}
+        if beat:
+            for batch in batches:
+                self.queue.heartbeat(batch, self.owner, [i for b, i in keys if b == batch])
+        cancelled = {b for b in batches if (self.queue.batch_info(b) or {}).get("cancelled_at")}
+        return [k for k in keys if k[0] in cancelled]
+
+    # --- worker loop ---
+    async def _run(self):
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency)
+
+        async def producer():
+            while True:
+                self._wake.clear()  # before looking, so a submit during the lookup still wakes us
+                try:
+                    found = await asyncio.to_thread(self._lease_next)
+                except Exception as e:
+                    print("Job lease failed:", e); found = None
+                if found is None:
+                    try: await asyncio.wait_for(self._wake.wait(), JOB_POLL_SEC)
+                    except asyncio.TimeoutError: pass
+                    continue
+                batch, item = found
+                self._held[(batch, item["index"])] = None
+                await queue.put((batch, item))
+
+        async def consumer():
+            while True:
+                batch, item = await queue.get()
+                key = (batch, item["index"])
+                if key in self._dropped:
+                    self._dropped.discard(key); self._held.pop(key, None)
+                    continue
+                task = self._held[key] = asyncio.ensure_future(self._process(item))
+                try:
+                    await asyncio.wait({task})
+                except asyncio.CancelledError:
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+                    raise  # the key stays held, so shutdown releases it
+                self._held.pop(key, None)
+                if task.cancelled():
+                    continue  # the job was cancelled; the store already says so
+                res = task.result()
+                try:
+                    await asyncio.to_thread(self.queue.complete, batch, self.owner, item["index"], res, bool(res.get("saved_to")))
+                except Exception as e:
+                    print("Job result not saved:", e)  # the lease expires and the item is handed out again
+
+        async def watcher():
+            last_beat = time.monotonic()
+            while True:
+                await asyncio.sleep(JOB_POLL_SEC)
+                beat = time.monotonic() - last_beat >= self.queue.heartbeat_sec
+                if beat:
+                    last_beat = time.monotonic()
+                keys = list(self._held)
+                if not keys:
+                    continue
+                try:
+                    self._stop(await asyncio.to_thread(self._watch, keys, beat))
+                except Exception as e:
+                    print("Job heartbeat failed:", e)
+
+        tasks = [asyncio.ensure_future(producer()), asyncio.ensure_future(watcher())]
+        tasks += [asyncio.ensure_future(consumer()) for _ in range(self.concurrency)]
+        try:
+            await asyncio.gather(*tasks)
+        finally:
+            for t in tasks:
+                t.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)  # consumers cancel the items they run
+            held = list(self._held)
+            self._held.clear(); self._dropped.clear()
+            for batch in {b for b, _ in held}:  # hand unfinished items to the other processes
+                await asyncio.to_thread(self.queue.release, batch, self.owner, [i for b, i in held if b == batch])
+
+    async def _process(self, item: Dict) -> Dict:
+        try:
+            return await self.engine.process(item["postUrl"], item["index"])
+        except Exception as e:
+            return {"postUrl": item["postUrl"], "index": item["index"], "error": str(e) or type(e).__name__}
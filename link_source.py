@@ -0,0 +1,137 @@
+"""
+link_source.py
+Streaming input for batch runs.
+
+Links are yielded one at a time as (index, postUrl) pairs, so a list of
+millions of links never has to be loaded or turned into coroutines up front.
+Entries are bare URL strings or {"index", "postUrl"} objects, as in
+links.json. Supported sources:
+
+  *.jsonl / *.ndjson   one entry per line
+  -                    stdin, JSON array or JSONL (auto-detected)
+  anything else        a JSON array, parsed incrementally
+"""
+
+import json
+import sys
+from pathlib import Path
+from typing import Iterable, Iterator, TextIO, Tuple
+
+READ_CHUNK = 1 << 16
+
+
+def normalize_link(pos: int, it) -> Tuple[int, str]:
+    if isinstance(it, str):
+        return pos, it
+    if isinstance(it, dict) and "postUrl" in it:
+        idx = it.get("index")
+        return (idx if isinstance(idx, int) else pos), str(it["postUrl"])
+    return pos, str(it)
+
+
+def iter_items(items: Iterable) -> Iterator[Tuple[int, str]]:
+    for pos, it in enumerate(items, start=1):
+        yield normalize_link(pos, it)
+
+
+def iter_jsonl(fh: TextIO) -> Iterator[Tuple[int, str]]:
+    pos = 0
+    for line in fh:
+        line = line.strip()
+        if not line:
+            continue
+        pos += 1
+        if line[0] in "{[\"":
+            try:
+                yield normalize_link(pos, json.loads(line))
+                continue
+            except ValueError:
+                pass
+        yield pos, line  # a bare URL per line is fine too
+
+
+def iter_json_array(fh: TextIO) -> Iterator[Tuple[int, str]]:
+    """Parse a top-level JSON array element by element without reading the whole file."""
+    decoder = json.JSONDecoder()
+    buf, eof, pos = "", False, 0
+    started = False
+
+    def fill():
+        nonlocal buf, eof
+        chunk = fh.read(READ_CHUNK)
+        if chunk:
+            buf += chunk
+        else:
+            eof = True
+
+    while True:
+        buf = buf.lstrip()
+        if not started:
+            if not buf and not eof:
+                fill(); continue
+            if not buf.startswith("["):
+                raise ValueError("expected a JSON array")
+            buf, started = buf[1:], True
+            continue
+        buf = buf.lstrip(", \t\r\n")
+        if buf.startswith("]"):
+            return
+        if not buf:
+            if eof:
+                raise ValueError("unterminated JSON array")
+            fill(); continue
+        try:
+            item, end = decoder.raw_decode(buf)
+        except ValueError:
+            if eof:
+                raise
+            fill(); continue
+        if end == len(buf) and not eof and isinstance(item, (int, float)):
+            fill(); continue  # a number may continue in the next chunk
+        buf = buf[end:]
+        pos += 1
+        yield normalize_link(pos, item)
+
+
+def iter_stream(fh: TextIO) -> Iterator[Tuple[int, str]]:
+    head = ""
+    while not head.strip():
+        chunk = fh.read(1)
+        if not chunk:
+            return
+        head += chunk
+    if head.strip() == "[":
+        yield from iter_json_array(_Prefixed(head, fh))
+    else:
+        yield from iter_jsonl(_Prefixed(head, fh))
+
+
+class _Prefixed:
+    """File-like wrapper that replays already consumed text before the rest of the stream."""
+    def __init__(self, prefix: str, fh: TextIO):
+        self.prefix, self.fh = prefix, fh
+
+    def read(self, n: int = -1) -> str:
+        if self.prefix:
+            out, self.prefix = self.prefix, ""
+            return out
+        return self.fh.read(n)
+
+    def __iter__(self):
+        first = self.prefix + self.fh.readline()
+        self.prefix = ""
+        if first:
+            yield first
+        yield from self.fh
+
+
+def open_source(arg: str) -> Iterator[Tuple[int, str]]:
+    if arg == "-":
+        yield from iter_stream(sys.stdin)
+        return
+    path = Path(arg)
+    with path.open("r", encoding="utf-8-sig") as fh:
+        if path.suffix.lower() in (".jsonl", ".ndjson"):
+            yield from iter_jsonl(fh)
+        else:
+            yield from iter_stream(fh)
@@ -0,0 +1,270 @@
+"""
+media_store.py
+Content-addressed download store.
+
+Videos are downloaded into a staging file while being hashed (SHA-256), then
+moved to .blobs/<aa>/<digest><ext> under the download folder. The familiar
+"<index> - <title>.mp4" names are hardlinks (or symlinks, XHS_MEDIA_LINK) to
+the blob, so reprocessing a post never produces "-1", "-2" copies. A SQLite
+index maps note IDs and CDN URLs (without their signed query) to digests;
+known media is linked again without fetching a single byte.
+
+Staging paths are derived from the CDN URL, so an interrupted ranged
+download resumes on the next run. Each staging file is guarded by a
+"<name>.lock" file held with flock (msvcrt on Windows) across processes and
+hosts sharing the volume; a URL that is already downloading elsewhere gets a
+unique staging name instead. The lock holder is the only writer, so its
+stream hash is trusted when it saw every byte; anything else is hashed from
+disk at commit. The index uses the rollback journal (journal_mode=DELETE),
+like work_queue.py, so it is safe on shared volumes.
+
+  XHS_MEDIA_ROOT   download folder holding names, .blobs and the index (default ./downloads);
+                   the engine links names under the store's root
+  XHS_MEDIA_DB     index file (default <root>/.media.sqlite)
+  XHS_MEDIA_LINK   hardlink (default) | symlink
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+from extract_cache import note_id_from_url
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# --- Configuration ---
+MEDIA_ROOT = Path(os.environ.get("XHS_MEDIA_ROOT", "./downloads"))
+MEDIA_DB = os.environ.get("XHS_MEDIA_DB") or None
+MEDIA_LINK = os.environ.get("XHS_MEDIA_LINK", "hardlink")
+HASH_CHUNK = 1 << 20
+
+
+def media_key(url: str) -> str:
+    """CDN URL without scheme and query; the signed query changes between extractions."""
+    parts = urlsplit(url or "")
+    return f"{parts.netloc.lower()}{parts.path}"
+
+
+class StreamHash:
+    """SHA-256 fed chunk by chunk while a download is written."""
+    def __init__(self):
+        self._h = hashlib.sha256()
+        self.bytes = 0
+
+    def update(self, chunk: bytes):
+        self._h.update(chunk)
+        self.bytes += len(chunk)
+
+    def reset(self):
+        self._h = hashlib.sha256()
+        self.bytes = 0
+
+    def hexdigest(self) -> str:
+        return self._h.hexdigest()
+
+
+def _try_lock(fd: int) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+
+def _unlock(fd: int):
+    try:
+        if fcntl is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+        else:
+            os.lseek(fd, 0, os.SEEK_SET)
+            msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+    except OSError:
+        pass
+
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as fh:
+        for chunk in iter(lambda: fh.read(HASH_CHUNK), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class MediaStore:
+    def __init__(self, root: Path = MEDIA_ROOT, db_path: Optional[str] = MEDIA_DB, link_mode: str = MEDIA_LINK):
+        self.root = root
+        self.blobs = root / ".blobs"
+        self.staging = self.blobs / ".staging"
+        self.staging.mkdir(parents=True, exist_ok=True)
+        self.link_mode = link_mode
+        self._lock = threading.Lock()
+        self._held: Dict[str, int] = {}  # staging name -> fd of its held lock file
+        self.stats_counters = {"note_hits": 0, "url_hits": 0, "misses": 0, "stored": 0, "duplicate_blobs": 0, "bytes_saved": 0}
+        self._db = sqlite3.connect(db_path or str(root / ".media.sqlite"), check_same_thread=False, timeout=10)
+        self._db.execute("PRAGMA journal_mode=DELETE")  # WAL's shared memory is unsafe on network volumes
+        self._db.execute("CREATE TABLE IF NOT EXISTS blobs (digest TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS media_urls (url_key TEXT PRIMARY KEY, digest TEXT NOT NULL)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS notes (note_id TEXT PRIMARY KEY, digest TEXT NOT NULL, video_url TEXT, title TEXT)")
+        self._db.commit()
+
+    def blob_path(self, digest: str, ext: str) -> Path:
+        return self.blobs / digest[:2] / f"{digest}{ext}"
+
+    def _blob(self, digest: Optional[str]) -> Optional[Dict]:
+        if not digest:
+            return None
+        row = self._db.execute("SELECT ext, size FROM blobs WHERE digest = ?", (digest,)).fetchone()
+        if not row:
+            return None
+        path = self.blob_path(digest, row[0])
+        if not path.exists():
+            self._db.execute("DELETE FROM blobs WHERE digest = ?", (digest,))
+            self._db.commit()
+            return None
+        return {"digest": digest, "ext": row[0], "size": row[1], "blob": path}
+
+    def lookup_note(self, post_url: str) -> Optional[Dict]:
+        """Stored media for a post: blob info plus the video_url and title it was saved with."""
+        with self._lock:
+            row = self._db.execute("SELECT digest, video_url, title FROM notes WHERE note_id = ?", (note_id_from_url(post_url),)).fetchone()
+            found = self._blob(row[0]) if row else None
+            if found:
+                found.update(video_url=row[1], title=row[2])
+                self.stats_counters["note_hits"] += 1
+                self.stats_counters["bytes_saved"] += found["size"]
+            return found
+
+    def lookup_url(self, media_url: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT digest FROM media_urls WHERE url_key = ?", (media_key(media_url),)).fetchone()
+            found = self._blob(row[0]) if row else None
+            if found:
+                self.stats_counters["url_hits"] += 1
+                self.stats_counters["bytes_saved"] += found["size"]
+            else:
+                self.stats_counters["misses"] += 1
+            return found
+
+    def _acquire(self, name: str) -> Optional[int]:
+        path = self.staging / f"{name}.lock"
+        fd = os.open(path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            # a released lock file is unlinked: holding one that is no longer at path guards nothing
+            if _try_lock(fd) and os.path.samestat(os.fstat(fd), os.stat(path)):
+                return fd
+        except OSError:
+            pass
+        os.close(fd)
+        return None
+
+    def staging_path(self, media_url: str, ext: str) -> Path:
+        """Stable per CDN URL (so ranged downloads resume); unique if another thread or process holds that URL."""
+        name = hashlib.sha1(media_key(media_url).encode("utf-8")).hexdigest()
+        fd = self._acquire(name)
+        while fd is None:
+            name = f"{name[:40]}-{uuid.uuid4().hex[:8]}"
+            fd = self._acquire(name)
+        with self._lock:
+            self._held[name] = fd
+        return self.staging / f"{name}{ext}"
+
+    def holds(self, staging: Path) -> bool:
+        with self._lock:
+            return staging.stem in self._held
+
+    def release(self, staging: Path):
+        with self._lock:
+            fd = self._held.pop(staging.stem, None)
+        if fd is None:
+            return
+        try: os.unlink(self.staging / f"{staging.stem}.lock")  # before unlocking, see _acquire
+        except OSError: pass
+        _unlock(fd)
+        os.close(fd)
+
+    def commit(self, staging: Path, post_url: str, media_url: str, title: Optional[str] = None,
+               hasher: Optional[StreamHash] = None) -> Dict:
+        """Move a finished staging file into the store and index it under the note and the URL."""
+        try:
+            size = staging.stat().st_size
+            trusted = hasher is not None and hasher.bytes == size and self.holds(staging)
+            digest = hasher.hexdigest() if trusted else hash_file(staging)
+            ext = staging.suffix or ".mp4"
+            blob = self.blob_path(digest, ext)
+            blob.parent.mkdir(parents=True, exist_ok=True)
+            with self._lock:
+                if blob.exists():
+                    staging.unlink()
+                    self.stats_counters["duplicate_blobs"] += 1
+                else:
+                    os.replace(staging, blob)
+                    self.stats_counters["stored"] += 1
+                self._db.execute("INSERT OR IGNORE INTO blobs (digest, ext, size, created_at) VALUES (?, ?, ?, ?)", (digest, ext, size, time.time()))
+                self._db.execute("INSERT OR REPLACE INTO media_urls (url_key, digest) VALUES (?, ?)", (media_key(media_url), digest))
+                self._db.execute("INSERT OR REPLACE INTO notes (note_id, digest, video_url, title) VALUES (?, ?, ?, ?)",
+                                 (note_id_from_url(post_url), digest, media_url, title))
+                self._db.commit()
+            return {"digest": digest, "ext": ext, "size": size, "blob": blob}
+        finally:
+            self.release(staging)
+
+    def remember(self, post_url: str, media_url: str, found: Dict, title: Optional[str] = None):
+        """Index a URL hit under its note as well, so the next run skips extraction."""
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO notes (note_id, digest, video_url, title) VALUES (?, ?, ?, ?)",
+                             (note_id_from_url(post_url), found["digest"], media_url, title))
+            self._db.commit()
+
+    def link(self, found: Dict, name: Path) -> Path:
+        """Expose the blob under a human-friendly name; a name taken by other content gets a digest suffix."""
+        blob, digest = found["blob"], found["digest"]
+        ext = found["ext"]
+        name = name.with_suffix(ext)
+        for candidate in (name, name.with_name(f"{name.stem} [{digest[:8]}]{ext}")):
+            if candidate.exists():
+                if os.path.samefile(candidate, blob):
+                    return candidate
+                if candidate is name:
+                    continue  # someone else's video: keep it, use the suffixed name
+            tmp = candidate.with_name(f".{candidate.name}.{uuid.uuid4().hex[:8]}")
+            if self.link_mode == "symlink":
+                os.symlink(os.path.relpath(blob, candidate.parent), tmp)
+            else:
+                try:
+                    os.link(blob, tmp)
+                except OSError:
+                    os.symlink(os.path.relpath(blob, candidate.parent), tmp)
+            os.replace(tmp, candidate)
+            return candidate
+        return name
+
+    def stats(self) -> Dict:
+        with self._lock:
+            out = dict(self.stats_counters)
+            out["blobs"], out["blob_bytes"] = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM blobs").fetchone()
+            return out
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_media_store() -> MediaStore:
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = MediaStore()
+        return _default_store
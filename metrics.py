@@ -0,0 +1,239 @@
+"""
+metrics.py
+Per-stage timings and Prometheus text-format metrics.
+
+Every result carries a "timings" dict (seconds per stage: cache, api,
+pool_wait, browser, goto, wait, debug, probe, download, total). observe_result()
+folds a finished result into the process-wide registry that the API server
+serves at GET /metrics; there is no dependency on prometheus_client.
+
+profile_if_slow() wraps a request in cProfile and keeps the profile only if
+the request took longer than XHS_PROFILE_SLOW_SEC (0 = off). Profiles go to
+XHS_PROFILE_DIR as <label>-<timestamp>.prof; open them with pstats or
+snakeviz. cProfile sees the whole thread, and on the async server that is the
+event loop: a profile covers every coroutine that ran while the slow request
+was in flight. Only one profiler can be active at a time, so overlapping
+slow requests are not all profiled.
+"""
+
+import cProfile
+import os
+import re
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+# --- Configuration ---
+PROFILE_SLOW_SEC = float(os.environ.get("XHS_PROFILE_SLOW_SEC", "0"))
+PROFILE_DIR = Path(os.environ.get("XHS_PROFILE_DIR", "./debug/profiles"))
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 90)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13)
+REASON_RE = re.compile(r"[a-z_]{3,40}")
+
+
+class Timings(dict):
+    """Plain dict of stage -> seconds, so it serializes with the result."""
+
+    @contextmanager
+    def stage(self, name: str):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started)
+
+    def add(self, name: str, seconds: float):
+        self[name] = round(self.get(name, 0.0) + seconds, 3)
+
+
+# --- Prometheus primitives ---
+def _escape(text: str) -> str:
+    """Backslash and newline escaping for HELP text and label values."""
+    return text.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(names: Tuple[str, ...], values: Tuple) -> str:
+    if not names:
+        return ""
+    pairs = ",".join('%s="%s"' % (n, _escape(str(v)).replace('"', '\\"')) for n, v in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self._values: Dict[Tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.label_names, k), v) for k, v in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, buckets=LATENCY_BUCKETS, labels: Iterable[str] = ()):
+        self.name, self.help, self.label_names = name, help_text, tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self._values: Dict[Tuple, list] = {}  # key -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(n, "") for n in self.label_names)
+        with self._lock:
+            row = self._values.setdefault(key, [0] * (len(self.buckets) + 2))
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, row in self._values.items():
+                for bound, n in zip(self.buckets + ("+Inf",), row[:len(self.buckets)] + [row[-1]]):
+                    le = _labels(self.label_names + ("le",), key + (bound,))
+                    out.append((self.name + "_bucket", le, n))
+                out.append((self.name + "_sum", _labels(self.label_names, key), row[-2]))
+                out.append((self.name + "_count", _labels(self.label_names, key), row[-1]))
+        return out
+
+
+class GaugeFn:
+    """Gauge evaluated at scrape time: fn() returns {label value tuple: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, fn: Callable[[], Dict[Tuple, float]], labels: Iterable[str] = ()):
+        self.name, self.help, self.label_names, self.fn = name, help_text, tuple(labels), fn
+
+    def samples(self):
+        try:
+            values = self.fn() or {}
+        except Exception:
+            values = {}
+        return [(self.name, _labels(self.label_names, k), v) for k, v in values.items()]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+
+    def register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for m in list(self._metrics.values()):
+            lines.append(f"# HELP {m.name} {_escape(m.help)}")
+            lines.append(f"# TYPE {m.name} {m.kind}")
+            for name, labels, value in m.samples():
+                # repr() is the shortest exact form; ":g" rounded long-running sums to 6 digits
+                lines.append(f"{name}{labels} {value!r}" if isinstance(value, float) else f"{name}{labels} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.register(Histogram("xhs_stage_seconds", "Time spent per pipeline stage.", labels=("stage",)))
+EXTRACT_SECONDS = REGISTRY.register(Histogram("xhs_extract_seconds", "Extraction latency by source.", labels=("via",)))
+PROBE_SECONDS = REGISTRY.register(Histogram("xhs_probe_seconds", "Candidate size probing latency per post."))
+CANDIDATES = REGISTRY.register(Histogram("xhs_candidates", "Candidate video URLs found per post.", buckets=COUNT_BUCKETS))
+DOWNLOAD_BYTES = REGISTRY.register(Counter("xhs_downloaded_bytes_total", "Bytes of media written to disk."))
+STREAMED_BYTES = REGISTRY.register(Counter("xhs_streamed_bytes_total", "Bytes of media relayed without touching disk, by destination.",
+                                           labels=("to",)))
+RESULTS = REGISTRY.register(Counter("xhs_results_total", "Finished posts by source and outcome.", labels=("via", "outcome")))
+FAILURES = REGISTRY.register(Counter("xhs_failures_total", "Failed posts by reason.", labels=("reason",)))
+
+
+def failure_reason(result: Dict) -> Optional[str]:
+    if result.get("saved_to") or result.get("streamed_to"):
+        return None
+    err = result.get("error")
+    if not err:
+        return "no_candidates"
+    token = str(err).split(":", 1)[0].strip()
+    return token if REASON_RE.fullmatch(token) else "extract_error"
+
+
+def observe_result(result: Dict):
+    timings = result.get("timings") or {}
+    for stage, sec in timings.items():
+        STAGE_SECONDS.observe(sec, stage=stage)
+    via = result.get("via") or "none"
+    extract_sec = sum(timings.get(k, 0.0) for k in ("cache", "api", "pool_wait", "browser"))
+    EXTRACT_SECONDS.observe(extract_sec, via=via)
+    if "probe" in timings:
+        PROBE_SECONDS.observe(timings["probe"])
+    CANDIDATES.observe(len(result.get("candidates") or []))
+    if result.get("downloaded_bytes"):
+        DOWNLOAD_BYTES.inc(result["downloaded_bytes"])
+    if result.get("streamed_bytes"):
+        STREAMED_BYTES.inc(result["streamed_bytes"], to=result.get("sink") or "client")
+    reason = failure_reason(result)
+    RESULTS.inc(via=via, outcome="failed" if reason else "succeeded")
+    if reason:
+        FAILURES.inc(reason=reason)
+
+
+def pool_gauge(pools: Callable[[], Dict[str, object]]):
+    """Register browser pool occupancy; pools() returns {name: pool} for pools that exist."""
+    def values():
+        out = {}
+        for name, pool in (pools() or {}).items():
+            st = pool.stats()
+            for key in ("size", "idle", "in_use"):
+                out[(name, key)] = st[key]
+        return out
+    REGISTRY.register(GaugeFn("xhs_browser_pool", "Browser pool slots by state.", values, labels=("pool", "state")))
+
+
+def limits_gauge(controllers: Dict[str, object]):
+    """Register the live adaptive limits of concurrency.ConcurrencyController instances."""
+    def values():
+        out = {}
+        for name, ctl in controllers.items():
+            snap = ctl.snapshot()
+            for lim in [snap["extract"]] + list(snap["download"].values()):
+                out[(name, lim["name"])] = lim["capacity"]
+        return out
+    REGISTRY.register(GaugeFn("xhs_concurrency_limit", "Current adaptive concurrency limit.", values, labels=("scope", "limiter")))
+
+
+# --- profiling ---
+_profile_lock = threading.Lock()
+
+
+@contextmanager
+def profile_if_slow(label: str, threshold: float = PROFILE_SLOW_SEC):
+    if threshold <= 0 or not _profile_lock.acquire(blocking=False):
+        yield None
+        return
+    profiler = cProfile.Profile()
+    started = time.monotonic()
+    try:
+        try:
+            profiler.enable()
+        except ValueError:  # another profiler is active in this process
+            profiler = None
+        yield profiler
+    finally:
+        try:
+            if profiler is not None:
+                profiler.disable()
+                if time.monotonic() - started >= threshold:
+                    PROFILE_DIR.mkdir(parents=True, exist_ok=True)
+                    profiler.dump_stats(str(PROFILE_DIR / f"{label}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof"))
+        finally:
+            _profile_lock.release()
@@ -0,0 +1,270 @@
+"""
+probe.py
+Concurrent candidate probing and ranking.
+
+All candidates of a post are probed at once over the engine's pooled
+keep-alive session, under one shared deadline (PROBE_DEADLINE_SEC); a
+candidate that has not answered by then is ranked without a size. HEAD is
+tried first, then a one-byte Range GET whose body is read to the end so the
+connection goes back to the pool, where the download that follows picks it
+up again. A server that ignores Range and answers 200 with the whole file
+gets its connection closed instead of being read.
+
+Probe results are cached by full URL while the URL's signature is valid
+(expiry read from the query string, capped by PROBE_CACHE_TTL_SEC), so
+re-resolving a post inside that window sends no probe requests.
+
+Ranking puts sized, unencrypted video first (content type or extension),
+then unsized video, then everything else (HTML error pages, images,
+encrypted HLS). Sized video is ordered by XHS_RANK_POLICY, using resolution
+hints from HLS variants, Seekin's medias[] fields and the URL itself;
+progressive files beat HLS on ties.
+
+  XHS_PROBE_DEADLINE_SEC    shared deadline for probing one post's candidates (default 8)
+  XHS_PROBE_CACHE_TTL_SEC   upper bound on how long a probe is reused (default 1800)
+  XHS_RANK_POLICY           smallest (default) | best | max_height:<px>
+"""
+
+import asyncio
+import os
+import re
+import time
+from calendar import timegm
+from collections import OrderedDict
+from typing import Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+
+import aiohttp
+
+from hls import is_hls_url, probe_hls
+
+# --- Configuration ---
+PROBE_DEADLINE_SEC = float(os.environ.get("XHS_PROBE_DEADLINE_SEC", "8"))
+PROBE_REQUEST_TIMEOUT = 6
+PROBE_CACHE_TTL_SEC = float(os.environ.get("XHS_PROBE_CACHE_TTL_SEC", "1800"))
+PROBE_CACHE_MAX_ENTRIES = 4096
+PROBE_DRAIN_MAX_BYTES = 64 * 1024  # a body this small is read so the connection stays pooled
+EXPIRY_MARGIN_SEC = 60  # stop reusing a probe shortly before the signed URL dies
+RANK_POLICY = os.environ.get("XHS_RANK_POLICY", "smallest")
+
+EXPIRY_KEYS = ("x-expires", "expires", "expire", "deadline", "e")
+VIDEO_PATH_RE = re.compile(r"\.(mp4|webm|m3u8)$", flags=re.I)
+HEIGHT_RE = re.compile(r"(?:^|[_/\-.])(\d{3,4})p(?:$|[_/\-.])", flags=re.I)
+WXH_RE = re.compile(r"(?:^|[_/\-.])(\d{3,4})x(\d{3,4})(?:$|[_/\-.])", flags=re.I)
+QUALITY_HEIGHTS = {"4k": 2160, "uhd": 2160, "2k": 1440, "fhd": 1080, "hd": 720, "sd": 480, "ld": 360}
+
+
+# --- probe cache ---
+def signed_expiry(url: str) -> Optional[float]:
+    """Epoch seconds at which a signed CDN URL stops working, if its query says so."""
+    query = {k.lower(): v for k, v in parse_qsl(urlsplit(url).query)}
+    if "x-amz-date" in query and query.get("x-amz-expires", "").isdigit():
+        try:
+            return timegm(time.strptime(query["x-amz-date"], "%Y%m%dT%H%M%SZ")) + int(query["x-amz-expires"])
+        except ValueError:
+            pass
+    for key in EXPIRY_KEYS:
+        value = query.get(key, "")
+        if value.isdigit() and len(value) >= 10:
+            return int(value) / 1000 if len(value) >= 13 else float(value)
+    return None
+
+
+class ProbeCache:
+    def __init__(self, ttl_sec: float = PROBE_CACHE_TTL_SEC, max_entries: int = PROBE_CACHE_MAX_ENTRIES):
+        self.ttl_sec = ttl_sec
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.counters = {"hits": 0, "misses": 0, "expired": 0, "stored": 0}
+
+    def get(self, url: str) -> Optional[Dict]:
+        entry = self._entries.get(url)
+        if entry is None:
+            self.counters["misses"] += 1
+            return None
+        if entry[0] <= time.time():
+            del self._entries[url]
+            self.counters["expired"] += 1
+            return None
+        self._entries.move_to_end(url)
+        self.counters["hits"] += 1
+        return dict(entry[1])
+
+    def put(self, url: str, info: Dict):
+        expires = time.time() + self.ttl_sec
+        signed = signed_expiry(url)
+        if signed is not None:
+            expires = min(expires, signed - EXPIRY_MARGIN_SEC)
+        if expires <= time.time():
+            return
+        self._entries[url] = (expires, dict(info))
+        self._entries.move_to_end(url)
+        self.counters["stored"] += 1
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def stats(self) -> Dict:
+        return dict(self.counters, entries=len(self._entries))
+
+
+_default_cache = None
+
+
+def get_probe_cache() -> ProbeCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ProbeCache()
+    return _default_cache
+
+
+# --- probing ---
+def _content_type(resp) -> Optional[str]:
+    ct = resp.headers.get("Content-Type")
+    return ct.split(";")[0].strip().lower() if ct else None
+
+
+async def probe_url(session: aiohttp.ClientSession, url: str, headers: Dict, timeout: float = PROBE_REQUEST_TIMEOUT) -> Dict:
+    """Size, content type and range support of one progressive candidate."""
+    info = {"size_bytes": None, "content_type": None, "accept_ranges": False}
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+    try:
+        async with session.head(url, headers=headers, timeout=client_timeout, allow_redirects=True) as resp:
+            if resp.status < 400:
+                info["content_type"] = _content_type(resp)
+                info["accept_ranges"] = resp.headers.get("Accept-Ranges", "").lower() == "bytes"
+                cl = resp.headers.get("Content-Length")
+                if cl and cl.isdigit():
+                    info["size_bytes"] = int(cl)
+                    return info
+    except Exception:
+        pass
+    try:
+        async with session.get(url, headers=dict(headers, Range="bytes=0-0"), timeout=client_timeout, allow_redirects=True) as resp:
+            cl = resp.headers.get("Content-Length")
+            if resp.status == 206 or (cl and cl.isdigit() and int(cl) <= PROBE_DRAIN_MAX_BYTES):
+                await resp.read()  # one byte when ranged; finishing the body keeps the connection reusable
+            else:
+                resp.close()  # Range ignored: never pull the whole video just to probe it
+            if resp.status >= 400:
+                info["error"] = f"status_{resp.status}"
+                return info
+            info["content_type"] = info["content_type"] or _content_type(resp)
+            info["accept_ranges"] = info["accept_ranges"] or resp.status == 206
+            cr = resp.headers.get("Content-Range")
+            if cr and "/" in cr and cr.rsplit("/", 1)[1].isdigit():
+                info["size_bytes"] = int(cr.rsplit("/", 1)[1])
+            else:
+                cl = resp.headers.get("Content-Length")
+                if cl and cl.isdigit() and int(cl) > 1:
+                    info["size_bytes"] = int(cl)
+    except Exception as e:
+        info["error"] = str(e) or type(e).__name__
+    return info
+
+
+async def _measure(session: aiohttp.ClientSession, url: str, headers: Dict) -> Dict:
+    if is_hls_url(url):
+        hls_info = await probe_hls(session, url, headers)
+        return {"size_bytes": hls_info.get("size_bytes"), "content_type": "application/vnd.apple.mpegurl", "hls": hls_info}
+    return await probe_url(session, url, headers)
+
+
+async def probe_candidates(session: aiohttp.ClientSession, urls: List[str], headers: Dict,
+                           hints: Optional[Dict[str, Dict]] = None, deadline: float = PROBE_DEADLINE_SEC) -> List[Dict]:
+    """Probe every URL concurrently; returns one info dict per URL, in the given order."""
+    cache = get_probe_cache()
+    found: Dict[str, Dict] = {}
+    tasks: Dict[str, asyncio.Task] = {}
+    for u in urls:
+        cached = cache.get(u)
+        if cached is not None:
+            found[u] = cached
+        else:
+            tasks[u] = asyncio.ensure_future(_measure(session, u, headers))
+    if tasks:
+        _, pending = await asyncio.wait(tasks.values(), timeout=deadline)
+        for t in pending:
+            t.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        for u, t in tasks.items():
+            if t.cancelled():
+                found[u] = {"size_bytes": None, "error": "probe_deadline"}
+            elif t.exception() is not None:
+                found[u] = {"size_bytes": None, "error": str(t.exception())}
+            else:
+                found[u] = t.result()
+                if found[u].get("size_bytes") and not found[u].get("error"):
+                    cache.put(u, found[u])
+    out = []
+    for u in urls:
+        info = dict({"url": u}, **found[u])
+        height = height_hint(u, (hints or {}).get(u), info.get("hls"))
+        if height:
+            info["height"] = height
+        out.append(info)
+    return out
+
+
+# --- ranking ---
+def height_hint(url: str, hint: Optional[Dict] = None, hls_info: Optional[Dict] = None) -> Optional[int]:
+    """Vertical resolution from the HLS variant, Seekin's medias[] fields or the URL path."""
+    if hls_info and hls_info.get("height"):
+        return int(hls_info["height"])
+    for key in ("height", "resolution", "quality"):
+        value = str((hint or {}).get(key) or "").strip().lower()
+        if not value:
+            continue
+        if value.isdigit():
+            return int(value)
+        m = HEIGHT_RE.search(f"_{value}_") or WXH_RE.search(f"_{value}_")
+        if m:
+            return int(m.group(m.lastindex))
+        if value in QUALITY_HEIGHTS:
+            return QUALITY_HEIGHTS[value]
+    path = urlsplit(url).path
+    m = HEIGHT_RE.search(path)
+    if m:
+        return int(m.group(1))
+    m = WXH_RE.search(path)
+    return int(m.group(2)) if m else None
+
+
+def is_video(info: Dict) -> Optional[bool]:
+    """True / False from the probed content type; None when the server did not say."""
+    ct = info.get("content_type")
+    if not ct or ct in ("application/octet-stream", "binary/octet-stream"):
+        return None
+    return ct.startswith("video/") or "mpegurl" in ct
+
+
+def _policy_key(info: Dict, policy: str):
+    size, height = info["size_bytes"], info.get("height") or 0
+    if policy == "best":
+        return (-height, -size)
+    if policy.startswith("max_height:"):
+        try:
+            cap = int(policy.split(":", 1)[1])
+        except ValueError:
+            cap = 0
+        return (0, -height, size) if 0 < height <= cap else (1, size)
+    return (size,)
+
+
+def rank_candidates(cand_info: List[Dict], policy: str = RANK_POLICY) -> List[Dict]:
+    """Candidates best first; see the module docstring for the order."""
+    def key(pos_info):
+        pos, info = pos_info
+        video = is_video(info)
+        encrypted = (info.get("hls") or {}).get("encrypted")
+        downloadable = video or (video is None and VIDEO_PATH_RE.search(urlsplit(info["url"]).path))
+        if downloadable and info.get("size_bytes") and not encrypted:
+            return (0,) + _policy_key(info, policy) + (bool(info.get("hls")), pos)
+        if video is not False and not encrypted:
+            return (1, pos)
+        return (2, pos)
+    return [info for _, info in sorted(enumerate(cand_info), key=key)]
+
+
+def choose_candidate(cand_info: List[Dict], policy: str = RANK_POLICY) -> Optional[Dict]:
+    ranked = rank_candidates(cand_info, policy)
+    return ranked[0] if ranked else None
@@ -0,0 +1,265 @@
+"""
+ranged_download.py
+Multi-connection ranged downloads with resume.
+
+A file of known size is split into byte ranges fetched in parallel and
+written at their offsets into a preallocated "<name>.part" file. Progress is
+kept in a "<name>.part.json" sidecar manifest, so an interrupted transfer
+resumes where each range stopped. When the server ignores Range, or answers
+206 with a Content-Range that does not start where asked or names another
+total size, the file is fetched over a single stream instead. The finished
+.part is renamed into place and the manifest removed.
+
+Checkpoints (flush, fsync, manifest write) run in a thread, off the event
+loop; the manifest is snapshotted before the flush, so it never claims
+bytes that are not on disk yet.
+
+An optional hasher (media_store.StreamHash) is fed the file in offset order:
+bytes arriving at the hashed offset are hashed as they come, and bytes that
+landed ahead of it (later ranges, or a resumed run) are read back from the
+.part file in a thread once everything before them is hashed. The media
+store then trusts the digest instead of re-reading the whole file.
+
+ranged_download() runs on aiohttp and is used by the shared engine (engine.py).
+"""
+
+import asyncio
+import json
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+# --- Configuration ---
+RANGED_CONNECTIONS = int(os.environ.get("XHS_RANGED_CONNECTIONS", "4"))
+RANGED_MIN_SIZE = int(os.environ.get("XHS_RANGED_MIN_SIZE", str(8 << 20)))
+RANGED_MIN_PART = 2 << 20
+RANGE_RETRIES = 3
+CHUNK_SIZE = 1 << 16
+MANIFEST_EVERY_SEC = 1.0
+HASH_READ = 1 << 20
+CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+|\*)$")
+
+
+class RangeNotSupported(Exception):
+    pass
+
+
+# --- Manifest ---
+def part_paths(out_path: Path) -> Tuple[Path, Path]:
+    return out_path.with_name(out_path.name + ".part"), out_path.with_name(out_path.name + ".part.json")
+
+
+def _url_key(url: str) -> str:
+    # signed CDN URLs change their query between extractions; the path identifies the object
+    p = urlsplit(url)
+    return f"{p.netloc}{p.path}"
+
+
+def plan_ranges(size: int, connections: int = RANGED_CONNECTIONS) -> List[List[int]]:
+    """[[start, end_inclusive, done_bytes], ...] covering size bytes."""
+    n = max(1, min(connections, size // RANGED_MIN_PART or 1))
+    step = -(-size // n)
+    return [[start, min(start + step, size) - 1, 0] for start in range(0, size, step)]
+
+
+def load_manifest(manifest_path: Path, url: str, size: int) -> Optional[Dict]:
+    try:
+        m = json.loads(manifest_path.read_text(encoding="utf-8"))
+    except Exception:
+        return None
+    if m.get("size") != size or m.get("url_key") != _url_key(url) or not m.get("ranges"):
+        return None
+    return m
+
+
+def save_manifest(manifest_path: Path, manifest: Dict):
+    tmp = manifest_path.with_name(manifest_path.name + ".tmp")
+    tmp.write_text(json.dumps(manifest), encoding="utf-8")
+    os.replace(tmp, manifest_path)
+
+
+def _checkpoint_sync(fh, manifest_path: Path, snapshot: Dict, io_lock: threading.Lock):
+    with io_lock:  # a cancelled checkpoint's thread may still be running
+        fh.flush(); os.fsync(fh.fileno())
+        save_manifest(manifest_path, snapshot)
+
+
+def _prepare(out_path: Path, url: str, size: int, connections: int):
+    part, manifest_path = part_paths(out_path)
+    manifest = load_manifest(manifest_path, url, size) if part.exists() else None
+    if manifest is None:
+        manifest = {"url_key": _url_key(url), "size": size, "ranges": plan_ranges(size, connections)}
+        with part.open("wb") as fh:
+            fh.truncate(size)  # preallocate so ranges can be written at their offsets
+        save_manifest(manifest_path, manifest)
+    return part, manifest_path, manifest
+
+
+def _finish(out_path: Path, part: Path, manifest_path: Path, manifest: Dict):
+    missing = [r for r in manifest["ranges"] if r[0] + r[2] <= r[1]]
+    if missing:
+        return False, f"incomplete ranges: {missing}"
+    os.replace(part, out_path)
+    try: manifest_path.unlink()
+    except OSError: pass
+    return True, None
+
+
+# --- Hashing ---
+class _OrderedHash:
+    def __init__(self, hasher, part: Path, fh, ranges: List[List[int]], io_lock: threading.Lock):
+        self.hasher, self.part, self.fh, self.io_lock = hasher, part, fh, io_lock
+        self.ranges = sorted(ranges)  # the manifest's own lists, updated in place by the fetchers
+        self.offset = 0
+        self.closed = False
+        self._lock = asyncio.Lock()
+        self._hash_lock = threading.Lock()
+
+    def feed(self, pos: int, chunk: bytes):
+        """A chunk just written at pos: hashed right away if it is next in order."""
+        if pos == self.offset and not self.closed:
+            with self._hash_lock:
+                self.hasher.update(chunk)
+            self.offset += len(chunk)
+
+    def _written_to(self) -> int:
+        for r in self.ranges:
+            if r[0] <= self.offset <= r[1]:
+                return r[0] + r[2]
+        return self.offset
+
+    def _read_sync(self, start: int, end: int):
+        with self.io_lock:
+            self.fh.flush()
+        with self.part.open("rb") as rf:
+            rf.seek(start)
+            while start < end:
+                data = rf.read(min(HASH_READ, end - start))
+                if not data:
+                    return
+                with self._hash_lock:
+                    if self.closed:
+                        return
+                    self.hasher.update(data)
+                start += len(data)
+
+    async def catch_up(self):
+        """Hash the bytes already on disk past the offset, up to the first gap."""
+        async with self._lock:
+            while not self.closed:
+                end = self._written_to()
+                if end <= self.offset:
+                    return
+                await asyncio.to_thread(self._read_sync, self.offset, end)
+                self.offset = end
+
+    def close(self):
+        """Stop feeding; a read still running in a thread drops its remaining bytes."""
+        with self._hash_lock:
+            self.closed = True
+
+
+# --- Download ---
+def _range_matches(content_range: Optional[str], start: int, size: int) -> bool:
+    m = CONTENT_RANGE_RE.match((content_range or "").strip())
+    return bool(m) and int(m.group(1)) == start and m.group(3) in ("*", str(size))
+
+
+async def _fetch_range_async(session, url: str, headers: Dict, fh, rng: List[int], size: int, checkpoint,
+                             ordered: Optional[_OrderedHash] = None):
+    import aiohttp
+    for attempt in range(RANGE_RETRIES + 1):
+        start = rng[0] + rng[2]
+        if start > rng[1]:
+            break
+        hdrs = dict(headers); hdrs["Range"] = f"bytes={start}-{rng[1]}"
+        try:
+            async with session.get(url, headers=hdrs, timeout=aiohttp.ClientTimeout(total=None, sock_read=60)) as resp:
+                if resp.status == 200:
+                    raise RangeNotSupported(url)
+                resp.raise_for_status()
+                if not _range_matches(resp.headers.get("Content-Range"), start, size):
+                    raise RangeNotSupported(f"{url}: asked for bytes {start}-{rng[1]}/{size}, got {resp.headers.get('Content-Range')!r}")
+                async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                    pos = rng[0] + rng[2]
+                    chunk = chunk[: rng[1] + 1 - pos]
+                    if not chunk:
+                        break
+                    fh.seek(pos); fh.write(chunk)  # no await in between, so no interleaving
+                    rng[2] += len(chunk)
+                    if ordered: ordered.feed(pos, chunk)
+                    await checkpoint()
+            if rng[0] + rng[2] > rng[1]:
+                break
+        except RangeNotSupported:
+            raise
+        except Exception:
+            if attempt >= RANGE_RETRIES:
+                raise
+            await asyncio.sleep(min(2 ** attempt, 8))
+    if ordered:  # this range is done: the next one may now be hashable
+        await ordered.catch_up()
+
+
+async def _single_stream_async(session, url: str, headers: Dict, out_path: Path, hasher=None):
+    import aiohttp
+    part, manifest_path = part_paths(out_path)
+    async with session.get(url, headers=headers, timeout=aiohttp.ClientTimeout(total=0)) as resp:
+        resp.raise_for_status()
+        with part.open("wb") as fh:
+            async for chunk in resp.content.iter_chunked(CHUNK_SIZE):
+                fh.write(chunk)
+                if hasher: hasher.update(chunk)
+    os.replace(part, out_path)
+    try: manifest_path.unlink()
+    except OSError: pass
+
+
+async def ranged_download(session, url: str, out_path: Path, size: Optional[int], headers: Optional[Dict] = None,
+                          connections: int = RANGED_CONNECTIONS, hasher=None) -> Tuple[bool, Optional[str]]:
+    headers = headers or {}
+    ordered = None
+    try:
+        if not size:
+            await _single_stream_async(session, url, headers, out_path, hasher)
+            return True, None
+        part, manifest_path, manifest = _prepare(out_path, url, size, connections)
+        last = {"t": time.monotonic()}
+        lock, io_lock = asyncio.Lock(), threading.Lock()
+        with part.open("r+b") as fh:
+            ordered = _OrderedHash(hasher, part, fh, manifest["ranges"], io_lock) if hasher is not None else None
+            async def checkpoint(force: bool = False):
+                if not force and (lock.locked() or time.monotonic() - last["t"] < MANIFEST_EVERY_SEC):
+                    return
+                async with lock:
+                    last["t"] = time.monotonic()
+                    snapshot = dict(manifest, ranges=[list(r) for r in manifest["ranges"]])
+                    await asyncio.to_thread(_checkpoint_sync, fh, manifest_path, snapshot, io_lock)
+            tasks = [asyncio.ensure_future(_fetch_range_async(session, url, headers, fh, r, size, checkpoint, ordered))
+                     for r in manifest["ranges"]]
+            try:
+                await asyncio.gather(*tasks)
+                if ordered: await ordered.catch_up()  # bytes from a resumed run when every range was already done
+            except BaseException:
+                for t in tasks:
+                    t.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            finally:
+                await checkpoint(force=True)
+        return _finish(out_path, part, manifest_path, manifest)
+    except RangeNotSupported:
+        if ordered: ordered.close()
+        if hasher is not None: hasher.reset()
+        try:
+            await _single_stream_async(session, url, headers, out_path, hasher)
+            return True, None
+        except Exception as e:
+            return False, str(e) or type(e).__name__
+    except Exception as e:
+        return False, str(e) or type(e).__name__
+
@@ -0,0 +1,102 @@
+"""
+resource_filter.py
+Request routing for Seekin browser contexts.
+
+Only the document, its scripts and XHR/fetch calls are needed to find media
+URLs, so images, fonts, stylesheets and media plus known tracker/ad hosts are
+aborted before they hit the network. Media requests are reported through
+`on_media` before being aborted, so video URLs are still collected without
+downloading them in the browser.
+
+  XHS_BLOCK_TYPES    comma separated Playwright resource types to abort
+  XHS_BLOCK_DOMAINS  extra tracker/ad hosts to abort (subdomains included)
+  XHS_ALLOW_DOMAINS  hosts that are never blocked
+  XHS_RESOURCE_FILTER=0 disables routing entirely
+"""
+
+import os
+from typing import Callable, Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+# --- Configuration ---
+RESOURCE_FILTER_ENABLED = os.environ.get("XHS_RESOURCE_FILTER", "1") != "0"
+BLOCK_TYPES = {"image", "media", "font", "stylesheet", "imageset", "texttrack", "beacon", "csp_report", "ping", "manifest"}
+BLOCK_DOMAINS = {
+    "google-analytics.com", "googletagmanager.com", "googlesyndication.com", "googleadservices.com",
+    "doubleclick.net", "adservice.google.com", "facebook.net", "facebook.com", "connect.facebook.net",
+    "hotjar.com", "clarity.ms", "bing.com", "criteo.com", "taboola.com", "outbrain.com",
+    "amazon-adsystem.com", "adsrvr.org", "scorecardresearch.com", "quantserve.com", "hm.baidu.com",
+    "cnzz.com", "umeng.com", "sentry.io", "fundingchoicesmessages.google.com",
+}
+ALLOW_DOMAINS = set()
+
+# rough per-type transfer sizes, used to estimate bytes saved for aborted requests
+TYPICAL_BYTES = {"image": 40_000, "imageset": 40_000, "media": 1_000_000, "font": 60_000, "stylesheet": 30_000,
+                 "script": 80_000, "xhr": 2_000, "fetch": 2_000, "beacon": 500, "ping": 500}
+
+
+def _split_env(name: str) -> set:
+    return {x.strip().lower() for x in os.environ.get(name, "").split(",") if x.strip()}
+
+
+def _host_in(host: str, domains: Iterable[str]) -> bool:
+    return any(host == d or host.endswith("." + d) for d in domains)
+
+
+class ResourceFilter:
+    def __init__(self, block_types: Optional[set] = None, deny_domains: Optional[set] = None,
+                 allow_domains: Optional[set] = None):
+        self.block_types = block_types if block_types is not None else (_split_env("XHS_BLOCK_TYPES") or BLOCK_TYPES)
+        self.deny_domains = deny_domains if deny_domains is not None else (BLOCK_DOMAINS | _split_env("XHS_BLOCK_DOMAINS"))
+        self.allow_domains = allow_domains if allow_domains is not None else (ALLOW_DOMAINS | _split_env("XHS_ALLOW_DOMAINS"))
+
+    def decide(self, url: str, resource_type: str) -> Optional[str]:
+        """Reason to abort the request, or None to let it through."""
+        host = (urlsplit(url).hostname or "").lower()
+        if host and _host_in(host, self.allow_domains):
+            return None
+        if host and _host_in(host, self.deny_domains):
+            return "tracker"
+        if resource_type in self.block_types:
+            return resource_type
+        return None
+
+
+def new_stats() -> Dict:
+    return {"requests": 0, "blocked": 0, "blocked_by_reason": {}, "bytes_loaded": 0, "bytes_saved_est": 0}
+
+
+def _record_block(stats: Dict, reason: str, resource_type: str):
+    stats["blocked"] += 1
+    stats["blocked_by_reason"][reason] = stats["blocked_by_reason"].get(reason, 0) + 1
+    stats["bytes_saved_est"] += TYPICAL_BYTES.get(resource_type, 5_000)
+
+
+def _record_response(stats: Dict, resp):
+    try:
+        cl = resp.headers.get("content-length")
+        if cl and cl.isdigit():
+            stats["bytes_loaded"] += int(cl)
+    except Exception:
+        pass
+
+
+async def install_async(context, rf: Optional[ResourceFilter], stats: Dict, on_media: Optional[Callable[[str], None]] = None):
+    """Route every request of an async Playwright context through rf."""
+    context.on("response", lambda resp: _record_response(stats, resp))
+    if rf is None or not RESOURCE_FILTER_ENABLED:
+        return
+
+    async def handler(route):
+        req = route.request
+        stats["requests"] += 1
+        reason = rf.decide(req.url, req.resource_type)
+        if reason is None:
+            await route.continue_()
+            return
+        if req.resource_type == "media" and on_media:
+            on_media(req.url)
+        _record_block(stats, reason, req.resource_type)
+        await route.abort()
+
+    await context.route("**/*", handler)
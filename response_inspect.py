@@ -0,0 +1,138 @@
+"""
+response_inspect.py
+Decide from URL and headers alone whether a Seekin page response is worth
+reading, before any body is pulled into Python.
+
+  video  URL or content type says media: record the URL, never read the body
+  json   API payloads: parsed into the ExtractionState
+  text   HTML / JS: scanned for a title
+  skip   everything else, and any body above INSPECT_MAX_BYTES (from
+         Content-Length, or for chunked / compressed responses from the
+         browser's transfer size, before the body is pulled)
+
+The HTTP status of XHR / fetch and JSON responses from Seekin's own site
+(api_url's domain, subdomains included) is recorded in the state, so Seekin
+429 / 5xx reach the extraction limiter even when the page only shows "no
+result"; trackers and other third parties on the page are not counted.
+
+Each extraction keeps counters of inspected vs skipped responses and bytes.
+"""
+
+import json
+import os
+from typing import Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+from extract_state import ExtractionState, VIDEO_EXT_RE
+
+# --- Configuration ---
+INSPECT_MAX_BYTES = int(os.environ.get("XHS_INSPECT_MAX_BYTES", str(2 << 20)))
+
+API_RESOURCE_TYPES = {"xhr", "fetch"}
+SKIP_RESOURCE_TYPES = {"image", "imageset", "media", "font", "stylesheet", "texttrack", "websocket", "eventsource"}
+VIDEO_CONTENT_TYPES = ("video/", "application/vnd.apple.mpegurl", "application/x-mpegurl", "audio/mpegurl")
+TEXT_CONTENT_TYPES = ("text/html", "javascript", "ecmascript")
+
+
+def new_stats() -> Dict:
+    return {"inspected": 0, "skipped": 0, "videos": 0, "bytes_inspected": 0, "bytes_skipped": 0, "oversize": 0}
+
+
+def _content_length(headers: Dict) -> Optional[int]:
+    cl = headers.get("content-length")
+    return int(cl) if cl and cl.isdigit() else None
+
+
+def classify(url: str, headers: Dict, resource_type: str = "") -> str:
+    ct = (headers.get("content-type") or "").lower()
+    if VIDEO_EXT_RE.search(url or "") or ct.startswith(VIDEO_CONTENT_TYPES):
+        return "video"
+    if resource_type in SKIP_RESOURCE_TYPES:
+        return "skip"
+    size = _content_length(headers)
+    if size is not None and size > INSPECT_MAX_BYTES:
+        return "oversize"
+    if "json" in ct or (url or "").split("?")[0].lower().endswith(".json"):
+        return "json"
+    if ct.startswith(TEXT_CONTENT_TYPES) or any(t in ct for t in TEXT_CONTENT_TYPES):
+        return "text"
+    return "skip"
+
+
+def is_api_response(url: str, api_url: Optional[str]) -> bool:
+    """url is on api_url's site (www. dropped, subdomains included); any url when api_url is None."""
+    if api_url is None:
+        return True
+    site = (urlsplit(api_url).hostname or "").lower()
+    site = site[4:] if site.startswith("www.") else site
+    host = (urlsplit(url or "").hostname or "").lower()
+    return bool(site) and (host == site or host.endswith("." + site))
+
+
+def _plan(resp, stats: Dict, state: ExtractionState, api_url: Optional[str] = None) -> str:
+    try:
+        resource_type = resp.request.resource_type
+    except Exception:
+        resource_type = ""
+    headers = resp.headers or {}
+    kind = classify(resp.url, headers, resource_type)
+    size = _content_length(headers)
+    if (kind == "json" or resource_type in API_RESOURCE_TYPES) and is_api_response(resp.url, api_url):
+        state.note_status(getattr(resp, "status", None))
+    if kind == "video":
+        state.add_candidate(resp.url)
+        stats["videos"] += 1
+    if kind in ("video", "skip", "oversize"):
+        stats["skipped"] += 1
+        stats["oversize"] += kind == "oversize"
+        stats["bytes_skipped"] += size or 0
+    return kind
+
+
+def _consume(resp, kind: str, text: str, stats: Dict, state: ExtractionState, title_fn: Callable[[str], Optional[str]],
+             api_url: Optional[str] = None):
+    stats["inspected"] += 1
+    stats["bytes_inspected"] += len(text)
+    if not text:
+        return
+    if kind == "json":
+        try:
+            if state.feed_json(json.loads(text)):
+                if state.medias_seen and is_api_response(resp.url, api_url):
+                    state.note_status(getattr(resp, "status", None), delivered=True)
+                if state.medias_seen and state.api_request is None:
+                    state.api_request = resp.request
+                return
+        except ValueError:
+            pass
+    state.set_title(title_fn(text))
+
+
+def _skip_oversize(stats: Dict, size: int):
+    stats["skipped"] += 1
+    stats["oversize"] += 1
+    stats["bytes_skipped"] += size
+
+
+async def _transfer_size(resp) -> Optional[int]:
+    try:
+        return (await resp.request.sizes()).get("responseBodySize")
+    except Exception:
+        return None
+
+
+async def inspect_async(resp, state: ExtractionState, stats: Dict, title_fn: Callable[[str], Optional[str]],
+                        api_url: Optional[str] = None):
+    kind = _plan(resp, stats, state, api_url)
+    if kind not in ("json", "text"):
+        return
+    if _content_length(resp.headers or {}) is None:  # chunked or compressed: ask the browser before pulling the body
+        size = await _transfer_size(resp)
+        if size is not None and size > INSPECT_MAX_BYTES:
+            _skip_oversize(stats, size)
+            return
+    text = await resp.text()
+    if len(text) > INSPECT_MAX_BYTES:  # decoded body still too big (or the browser could not tell)
+        _skip_oversize(stats, len(text))
+        return
+    _consume(resp, kind, text, stats, state, title_fn, api_url)
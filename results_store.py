@@ -0,0 +1,122 @@
+"""
+results_store.py
+Streaming JSONL results for batch runs.
+
+Every result is appended to results.jsonl as soon as it completes and the
+file is fsynced every FSYNC_EVERY_SEC / FSYNC_EVERY_RECORDS. On restart,
+load_completed() returns the indices that need no more work, so a crashed
+10k-link run only repeats its in-flight items. compact() turns the JSONL
+log into the final results.json without holding the results in memory.
+
+Both pick one record per index: the latest one whose saved_to file still
+exists, else the latest one. A failed retry therefore never hides a file
+that an earlier attempt saved.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from typing import Dict, Set
+
+# --- Configuration ---
+FSYNC_EVERY_SEC = 2.0
+FSYNC_EVERY_RECORDS = 50
+
+
+def is_done(res: Dict) -> bool:
+    saved = res.get("saved_to")
+    return bool(saved) and Path(saved).exists()
+
+
+def load_completed(path: Path) -> Set[int]:
+    """Indices with a record whose saved_to file still exists."""
+    done: Set[int] = set()
+    if not path.exists():
+        return set()
+    with path.open("r", encoding="utf-8") as fh:
+        for line in fh:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                res = json.loads(line)
+            except ValueError:
+                continue  # torn last line after a crash
+            idx = res.get("index")
+            if isinstance(idx, int) and is_done(res):
+                done.add(idx)
+    return done
+
+
+class ResultsWriter:
+    def __init__(self, path: Path, mode: str = "a"):
+        """mode "a" appends (resumable runs); "w" starts the file over."""
+        self.path = path
+        self.mode = mode
+        self.count = 0
+        self._fh = None
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._fh = self.path.open(self.mode, encoding="utf-8")
+        return self
+
+    def write(self, res: Dict):
+        self._fh.write(json.dumps(res, ensure_ascii=False) + "\n")
+        self._fh.flush()
+        self.count += 1
+        self._unsynced += 1
+        if self._unsynced >= FSYNC_EVERY_RECORDS or time.monotonic() - self._last_sync >= FSYNC_EVERY_SEC:
+            self.sync()
+
+    def sync(self):
+        if self._fh is None or not self._unsynced:
+            return
+        os.fsync(self._fh.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def __exit__(self, *exc):
+        self.sync()
+        self._fh.close()
+        self._fh = None
+
+
+def compact(jsonl_path: Path, json_path: Path) -> int:
+    """Write json_path as a JSON array of one record per index (see the module docstring), ordered by index."""
+    offsets: Dict[int, int] = {}
+    saved: Dict[int, int] = {}  # latest record with an existing file
+    extra = []  # records without an integer index are kept as-is
+    with jsonl_path.open("rb") as fh:
+        while True:
+            pos = fh.tell()
+            line = fh.readline()
+            if not line:
+                break
+            try:
+                res = json.loads(line)
+            except ValueError:
+                continue
+            idx = res.get("index")
+            if isinstance(idx, int):
+                offsets[idx] = pos
+                if is_done(res):
+                    saved[idx] = pos
+            else:
+                extra.append(pos)
+
+    tmp = json_path.with_name(json_path.name + ".tmp")
+    n = 0
+    with jsonl_path.open("rb") as src, tmp.open("w", encoding="utf-8") as out:
+        out.write("[\n")
+        for pos in [saved.get(i, offsets[i]) for i in sorted(offsets)] + extra:
+            src.seek(pos)
+            res = json.loads(src.readline())
+            out.write(("  " if n == 0 else ",\n  ") + json.dumps(res, ensure_ascii=False))
+            n += 1
+        out.write("\n]\n")
+    os.replace(tmp, json_path)
+    return n
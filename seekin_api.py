@@ -0,0 +1,184 @@
+"""
+seekin_api.py
+Browserless fast path: replay Seekin's JSON API directly.
+
+The browser path still runs whenever no template is known. The first time it
+sees the Seekin XHR that carries data.title / data.medias, the request shape
+(endpoint, method, headers and a body template with the post URL replaced by
+a placeholder) is recorded into XHS_API_TEMPLATE. From then on every post URL
+is one HTTP call. A failed call or a response that no longer matches the
+expected schema falls back to the browser; after API_MAX_FAILURES consecutive
+failures the template is dropped and re-recorded by the next browser run.
+
+Point XHS_API_TEMPLATE at a hand-written template to run against a local
+stand-in server.
+"""
+
+import asyncio
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+from urllib.parse import quote, quote_plus
+
+from extract_state import ExtractionState
+
+# --- Configuration ---
+API_MODE = os.environ.get("XHS_API_MODE", "auto")  # auto | off
+API_TEMPLATE_FILE = Path(os.environ.get("XHS_API_TEMPLATE", "./seekin_api.json"))
+API_TIMEOUT = 15
+API_MAX_FAILURES = 3
+
+PLACEHOLDER = "{{POST_URL}}"
+DROP_HEADERS = {"host", "content-length", "cookie", "accept-encoding", "connection", "transfer-encoding"}
+ENCODERS = {
+    "raw": lambda u: u,
+    "json": lambda u: json.dumps(u)[1:-1],
+    "quote": lambda u: quote(u, safe=""),
+    "quote_plus": lambda u: quote_plus(u),
+}
+
+
+class ApiSchemaError(Exception):
+    pass
+
+
+def build_template(url: str, method: str, headers: Dict, body: Optional[str], post_url: str) -> Optional[Dict]:
+    """Turn one captured request into a template, or None if the post URL cannot be located."""
+    ct = next((v for k, v in (headers or {}).items() if k.lower() == "content-type"), "") or ""
+    order = ("json", "raw", "quote", "quote_plus") if "json" in ct.lower() else ("quote_plus", "quote", "raw", "json")
+    for enc in order:
+        needle = ENCODERS[enc](post_url)
+        if not needle:
+            continue
+        in_body = bool(body) and needle in body
+        in_url = needle in url
+        if in_body or in_url:
+            return {
+                "endpoint": url.replace(needle, PLACEHOLDER),
+                "method": (method or "POST").upper(),
+                "headers": {k: v for k, v in (headers or {}).items() if k.lower() not in DROP_HEADERS and not k.startswith(":")},
+                "body": body.replace(needle, PLACEHOLDER) if body else body,
+                "encoding": enc,
+                "recorded_at": time.time(),
+            }
+    return None
+
+
+def render(template: Dict, post_url: str) -> Dict:
+    value = ENCODERS.get(template.get("encoding", "raw"), ENCODERS["raw"])(post_url)
+    body = template.get("body")
+    return {
+        "method": template.get("method", "POST"),
+        "url": template["endpoint"].replace(PLACEHOLDER, value),
+        "headers": dict(template.get("headers") or {}),
+        "data": body.replace(PLACEHOLDER, value).encode("utf-8") if body else None,
+    }
+
+
+def parse_payload(payload) -> ExtractionState:
+    state = ExtractionState(settle_sec=0)
+    if not state.feed_json(payload) or not state.medias_seen:
+        raise ApiSchemaError("response has no data.medias")
+    if not state.candidates:
+        raise ApiSchemaError("data.medias contained no video URL")
+    return state
+
+
+class ApiTemplateStore:
+    def __init__(self, path: Path = API_TEMPLATE_FILE, mode: str = API_MODE):
+        self.path = path
+        self.enabled = mode != "off"
+        self._lock = threading.Lock()
+        self._template: Optional[Dict] = None
+        self._failures = 0
+        self.stats_counters = {"api_hits": 0, "api_failures": 0, "recorded": 0, "dropped": 0}
+        try:
+            self._template = json.loads(self.path.read_text(encoding="utf-8"))
+        except Exception:
+            self._template = None
+
+    def get(self) -> Optional[Dict]:
+        return self._template if self.enabled else None
+
+    def record(self, request, post_url: str):
+        """Record the request behind a Seekin API response if no template is known yet."""
+        if not self.enabled or self._template is not None or request is None:
+            return
+        try:
+            tpl = build_template(request.url, request.method, request.headers, request.post_data, post_url)
+        except Exception:
+            tpl = None
+        if tpl is None:
+            return
+        with self._lock:
+            if self._template is not None:
+                return
+            self._template, self._failures = tpl, 0
+            self.stats_counters["recorded"] += 1
+            try:
+                self.path.write_text(json.dumps(tpl, ensure_ascii=False, indent=2), encoding="utf-8")
+            except Exception:
+                pass
+
+    def report(self, ok: bool):
+        with self._lock:
+            if ok:
+                self._failures = 0
+                self.stats_counters["api_hits"] += 1
+                return
+            self._failures += 1
+            self.stats_counters["api_failures"] += 1
+            if self._failures >= API_MAX_FAILURES and self._template is not None:
+                self._template = None
+                self.stats_counters["dropped"] += 1
+                try: self.path.unlink()
+                except OSError: pass
+
+    def stats(self) -> Dict:
+        out = dict(self.stats_counters)
+        out["template"] = bool(self._template)
+        return out
+
+
+# --- replay ---
+async def replay_async(session, store: ApiTemplateStore, post_url: str, outcome: Optional[Dict] = None) -> Optional[ExtractionState]:
+    """Replay the template for post_url; None falls back to the browser.
+
+    outcome (optional) receives the response "status" and, on failure, the
+    "error" and whether it was a "timeout", so callers can tell Seekin
+    overload (429 / 5xx / timeout) from a changed schema.
+    """
+    import aiohttp
+    outcome = outcome if outcome is not None else {}
+    template = store.get()
+    if template is None:
+        return None
+    req = render(template, post_url)
+    try:
+        async with session.request(req["method"], req["url"], headers=req["headers"], data=req["data"],
+                                   timeout=aiohttp.ClientTimeout(total=API_TIMEOUT)) as resp:
+            outcome["status"] = resp.status
+            resp.raise_for_status()
+            state = parse_payload(await resp.json(content_type=None))
+    except Exception as e:
+        outcome["error"] = str(e) or type(e).__name__
+        outcome["timeout"] = isinstance(e, asyncio.TimeoutError)
+        store.report(False)
+        return None
+    store.report(True)
+    return state
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_default_store() -> ApiTemplateStore:
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = ApiTemplateStore()
+        return _default_store
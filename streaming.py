@@ -0,0 +1,131 @@
+"""
+streaming.py
+Zero-disk delivery of a chosen candidate.
+
+The API can pipe a video from the CDN straight to the client (the client's
+Range header is passed through so players can seek) or upload it to a sink
+while it streams. Nothing is written to local disk on either path; HLS
+streams are delivered as their segments concatenated in order.
+
+Sinks implement `async upload(key, chunks, content_type) -> location`, where
+chunks is an async iterator of bytes:
+
+  s3       S3-compatible multipart upload (needs boto3; its blocking calls run
+           in worker threads). XHS_S3_BUCKET, XHS_S3_PREFIX, XHS_S3_ENDPOINT
+           (e.g. a local MinIO) and the usual AWS_* credentials.
+  memory   keeps objects in process; a stand-in for tests and benchmarks.
+"""
+
+import asyncio
+import os
+from typing import AsyncIterable, AsyncIterator, Dict, Optional
+
+import aiohttp
+
+import hls
+
+# --- Configuration ---
+STREAM_CHUNK = 1 << 16
+UPSTREAM_TIMEOUT = aiohttp.ClientTimeout(total=None, sock_connect=10, sock_read=60)
+S3_BUCKET = os.environ.get("XHS_S3_BUCKET", "")
+S3_PREFIX = os.environ.get("XHS_S3_PREFIX", "")
+S3_ENDPOINT = os.environ.get("XHS_S3_ENDPOINT") or None
+S3_PART_SIZE = 8 * 1024 * 1024  # S3 requires >= 5 MiB for all parts but the last
+
+PASS_HEADERS = ("Content-Type", "Content-Length", "Content-Range", "Accept-Ranges", "ETag", "Last-Modified")
+
+
+# --- CDN -> client ---
+async def open_upstream(session: aiohttp.ClientSession, url: str, headers: Dict, range_header: Optional[str] = None):
+    """Start a GET; the caller owns the response and must release it (iter_body does)."""
+    hdrs = dict(headers)
+    if range_header:
+        hdrs["Range"] = range_header
+    return await session.get(url, headers=hdrs, timeout=UPSTREAM_TIMEOUT, allow_redirects=True)
+
+
+def passthrough_headers(resp) -> Dict[str, str]:
+    return {k: resp.headers[k] for k in PASS_HEADERS if k in resp.headers}
+
+
+async def iter_body(resp) -> AsyncIterator[bytes]:
+    try:
+        async for chunk in resp.content.iter_chunked(STREAM_CHUNK):
+            yield chunk
+    finally:
+        resp.release()
+
+
+async def iter_hls(session: aiohttp.ClientSession, media: Dict, headers: Dict) -> AsyncIterator[bytes]:
+    """Segments of a resolved media playlist (hls.resolve_media_playlist) in order.
+
+    Whole segments are yielded, so a retried segment never duplicates bytes already sent.
+    """
+    if media.get("init"):
+        yield await hls.fetch_segment(session, media["init"], headers)
+    for seg in media["segments"]:
+        yield await hls.fetch_segment(session, seg, headers)
+
+
+# --- sinks ---
+class MemorySink:
+    def __init__(self):
+        self.objects: Dict[str, bytes] = {}
+
+    async def upload(self, key: str, chunks: AsyncIterable[bytes], content_type: Optional[str] = None) -> str:
+        self.objects[key] = b"".join([chunk async for chunk in chunks])
+        return f"memory://{key}"
+
+
+class S3Sink:
+    def __init__(self, bucket: str = S3_BUCKET, prefix: str = S3_PREFIX, endpoint_url: Optional[str] = S3_ENDPOINT,
+                 part_size: int = S3_PART_SIZE, client=None):
+        if client is None:
+            import boto3  # optional dependency, only needed for this sink
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        if not bucket:
+            raise ValueError("XHS_S3_BUCKET is not set")
+        self.client, self.bucket, self.prefix, self.part_size = client, bucket, prefix, part_size
+
+    async def upload(self, key: str, chunks: AsyncIterable[bytes], content_type: Optional[str] = None) -> str:
+        key = self.prefix + key
+        extra = {"ContentType": content_type} if content_type else {}
+        buf, parts, upload_id = bytearray(), [], None
+        try:
+            async for chunk in chunks:
+                buf += chunk
+                if len(buf) >= self.part_size:
+                    if upload_id is None:
+                        created = await asyncio.to_thread(self.client.create_multipart_upload, Bucket=self.bucket, Key=key, **extra)
+                        upload_id = created["UploadId"]
+                    parts.append(await self._part(key, upload_id, len(parts) + 1, bytes(buf)))
+                    buf.clear()
+            if upload_id is None:  # small object: one PUT
+                await asyncio.to_thread(self.client.put_object, Bucket=self.bucket, Key=key, Body=bytes(buf), **extra)
+            else:
+                if buf:
+                    parts.append(await self._part(key, upload_id, len(parts) + 1, bytes(buf)))
+                await asyncio.to_thread(self.client.complete_multipart_upload, Bucket=self.bucket, Key=key,
+                                        UploadId=upload_id, MultipartUpload={"Parts": parts})
+        except BaseException:
+            if upload_id is not None:
+                try: await asyncio.to_thread(self.client.abort_multipart_upload, Bucket=self.bucket, Key=key, UploadId=upload_id)
+                except Exception: pass
+            raise
+        return f"s3://{self.bucket}/{key}"
+
+    async def _part(self, key: str, upload_id: str, number: int, body: bytes) -> Dict:
+        resp = await asyncio.to_thread(self.client.upload_part, Bucket=self.bucket, Key=key, UploadId=upload_id,
+                                       PartNumber=number, Body=body)
+        return {"ETag": resp["ETag"], "PartNumber": number}
+
+
+SINK_FACTORIES = {"memory": MemorySink, "s3": S3Sink}
+_sinks: Dict[str, object] = {}
+
+
+def get_sink(name: str):
+    """Shared sink instance by name; raises KeyError for unknown sinks."""
+    if name not in _sinks:
+        _sinks[name] = SINK_FACTORIES[name]()
+    return _sinks[name]
@@ -0,0 +1,30 @@
+import asyncio
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import aiohttp  # noqa: E402
+from aiohttp import web  # noqa: E402
+
+import bench_servers  # noqa: E402
+
+
+@pytest.fixture
+def stand_in():
+    """run(config, check): serve bench_servers.create_app(config) on a free port and await check(base_url, session)."""
+    def run(config, check):
+        async def main():
+            runner = web.AppRunner(bench_servers.create_app(config))
+            await runner.setup()
+            await web.TCPSite(runner, "127.0.0.1", 0).start()
+            base = f"http://127.0.0.1:{runner.addresses[0][1]}"
+            try:
+                async with aiohttp.ClientSession() as session:
+                    await check(base, session)
+            finally:
+                await runner.cleanup()
+        asyncio.run(main())
+    return run
@@ -0,0 +1,53 @@
+import asyncio
+import json
+import time
+
+import xhs_batch_download
+
+
+class FakeEngine:
+    def __init__(self, pool_size=None):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    async def process(self, url, index):
+        return {"postUrl": url, "index": index, "error": "no_video"}
+
+
+def slow_links(n, delay):
+    for i in range(1, n + 1):
+        time.sleep(delay)  # a slow pipe / stdin
+        yield i, f"https://www.xiaohongshu.com/explore/{i}"
+
+
+def test_slow_input_does_not_block_the_loop(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(xhs_batch_download, "Engine", FakeEngine)
+    monkeypatch.setattr(xhs_batch_download, "RESULTS_JSONL", tmp_path / "results.jsonl")
+
+    async def run():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        beat = asyncio.ensure_future(ticker())
+        try:
+            summary = await xhs_batch_download.main(slow_links(5, 0.1), resume=False)
+        finally:
+            beat.cancel()
+        return summary, ticks
+
+    summary, ticks = asyncio.run(run())
+    assert summary == {"total": 5, "skipped": 0, "succeeded": 0, "failed": 5}
+    assert ticks >= 20  # ~50 over 0.5 s; a loop blocked in next() would manage about 5
+    lines = (tmp_path / "results.jsonl").read_text(encoding="utf-8").splitlines()
+    assert sorted(json.loads(line)["index"] for line in lines) == [1, 2, 3, 4, 5]
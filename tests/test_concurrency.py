@@ -0,0 +1,88 @@
+import asyncio
+
+import pytest
+
+import concurrency
+from concurrency import AsyncLimiter, _AIMD, is_overload
+
+
+@pytest.mark.parametrize("kwargs,expected", [
+    ({"status": 429}, True),
+    ({"status": 503}, True),
+    ({"status": 404}, False),
+    ({"timeout": True}, True),
+    ({"error": "503, message='Service Unavailable'"}, True),
+    ({"error": "Read timed out"}, True),
+    ({"error": "TimeoutError"}, True),
+    ({"error": ""}, False),
+    ({"error": "no_video"}, False),
+    ({}, False),
+])
+def test_is_overload(kwargs, expected):
+    assert is_overload(**kwargs) is expected
+
+
+def test_additive_increase_up_to_the_maximum():
+    lim = _AIMD("t", initial=2, maximum=3, target_sec=10)
+    for _ in range(2):
+        lim.on_done(True, 1.0, False)
+    assert lim.capacity() == 2  # about +1 per window of `limit` completions
+    lim.on_done(True, 1.0, False)
+    assert lim.capacity() == 3
+    for _ in range(10):
+        lim.on_done(True, 1.0, False)
+    assert lim.limit == 3
+
+
+def test_slow_and_failed_completions_hold_the_limit():
+    lim = _AIMD("t", initial=4, maximum=16, target_sec=10)
+    lim.on_done(True, 11.0, False)
+    lim.on_done(False, 1.0, False)
+    assert lim.limit == 4
+    assert lim.counters["slow"] == 1 and lim.counters["errors"] == 1
+
+
+def test_overloads_halve_once_per_cooldown(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(concurrency.time, "monotonic", lambda: now[0])
+    lim = _AIMD("t", initial=8, maximum=16, target_sec=10)
+    lim.on_done(False, 1.0, True)
+    lim.on_done(False, 1.0, True)
+    assert lim.limit == 4 and lim.counters["overloads"] == 2 and lim.counters["decreases"] == 1
+    now[0] += concurrency.COOLDOWN_SEC
+    for _ in range(3):
+        lim.on_done(False, 1.0, True)
+        now[0] += concurrency.COOLDOWN_SEC
+    assert lim.limit == concurrency.MIN_LIMIT
+
+
+def test_slot_admits_up_to_capacity():
+    lim = AsyncLimiter("t", initial=2, maximum=2, target_sec=10)
+    peak = 0
+
+    async def job():
+        nonlocal peak
+        async with lim.slot():
+            peak = max(peak, lim.in_flight)
+            await asyncio.sleep(0.01)
+
+    async def main():
+        await asyncio.gather(*(job() for _ in range(6)))
+
+    asyncio.run(main())
+    assert peak == 2 and lim.in_flight == 0 and lim.counters["ok"] == 6
+
+
+def test_slot_timeout_backs_off_and_excluded_wait_is_not_latency():
+    lim = AsyncLimiter("t", initial=4, maximum=16, target_sec=0.05)
+
+    async def main():
+        with pytest.raises(asyncio.TimeoutError):
+            async with lim.slot():
+                raise asyncio.TimeoutError()
+        async with lim.slot() as slot:
+            await asyncio.sleep(0.1)  # e.g. waiting for a pooled browser
+            slot.exclude(0.1)
+
+    asyncio.run(main())
+    assert lim.counters["decreases"] == 1 and lim.counters["ok"] == 1 and lim.counters["slow"] == 0
@@ -0,0 +1,78 @@
+import time
+
+import pytest
+
+import extract_cache
+from probe import EXPIRY_MARGIN_SEC
+
+NOTE_A = "64ab0000000000000000aaaa"
+NOTE_B = "64ab0000000000000000bbbb"
+NOTE_C = "64ab0000000000000000cccc"
+CANDIDATES = [{"url": "https://cdn.example/a.mp4", "size_bytes": 10}]
+
+
+def post(note, token="abc"):
+    return f"https://www.xiaohongshu.com/explore/{note}?xsec_token={token}"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(time, "time", lambda: now[0])
+    return now
+
+
+def test_key_ignores_the_token():
+    assert extract_cache.note_id_from_url(post(NOTE_A, "x")) == extract_cache.note_id_from_url(post(NOTE_A.upper(), "y"))
+
+
+def test_ttl(clock):
+    cache = extract_cache.ExtractionCache(ttl_sec=100, db_path=None)
+    cache.put(post(NOTE_A), "t", CANDIDATES)
+    assert cache.get(post(NOTE_A, "other"))["candidates"] == CANDIDATES
+    clock[0] += 101
+    assert cache.get(post(NOTE_A)) is None
+    assert cache.stats()["expired"] == 1
+
+
+def test_failed_extractions_are_not_cached(clock):
+    cache = extract_cache.ExtractionCache(db_path=None)
+    cache.put(post(NOTE_A), "t", [])
+    assert cache.get(post(NOTE_A)) is None
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = extract_cache.ExtractionCache(ttl_sec=100, max_entries=2, db_path=None)
+    cache.put(post(NOTE_A), "a", CANDIDATES)
+    cache.put(post(NOTE_B), "b", CANDIDATES)
+    cache.get(post(NOTE_A))  # A is now the most recent
+    cache.put(post(NOTE_C), "c", CANDIDATES)
+    assert cache.get(post(NOTE_B)) is None
+    assert cache.get(post(NOTE_A))["title"] == "a"
+    assert cache.stats()["evictions"] == 1
+
+
+def test_signed_expiry_caps_the_ttl(clock):
+    cache = extract_cache.ExtractionCache(ttl_sec=3600, db_path=None)
+    expires = int(clock[0]) + 600
+    cache.put(post(NOTE_A), "t", [{"url": f"https://cdn.example/a.mp4?x-expires={expires}", "size_bytes": 1},
+                                  {"url": "https://cdn.example/b.mp4", "size_bytes": 1}])
+    clock[0] = expires - EXPIRY_MARGIN_SEC - 1
+    assert cache.get(post(NOTE_A)) is not None
+    clock[0] += 2
+    assert cache.get(post(NOTE_A)) is None
+
+
+def test_nearly_expired_urls_are_not_cached(clock):
+    cache = extract_cache.ExtractionCache(db_path=None)
+    cache.put(post(NOTE_A), "t", [{"url": f"https://cdn.example/a.mp4?expires={int(clock[0]) + 30}", "size_bytes": 1}])
+    assert cache.get(post(NOTE_A)) is None and cache.stats()["puts"] == 0
+
+
+def test_disk_layer_survives_a_restart_and_invalidate(tmp_path, clock):
+    db = str(tmp_path / "cache.sqlite")
+    extract_cache.ExtractionCache(ttl_sec=100, db_path=db).put(post(NOTE_A), "t", CANDIDATES)
+    cache = extract_cache.ExtractionCache(ttl_sec=100, db_path=db)
+    assert cache.get(post(NOTE_A))["title"] == "t" and cache.stats()["disk_hits"] == 1
+    cache.invalidate(post(NOTE_A))
+    assert extract_cache.ExtractionCache(ttl_sec=100, db_path=db).get(post(NOTE_A)) is None
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from extract_state import ExtractionState
+
+MEDIAS = {"data": {"title": "A note", "medias": [{"url": "https://cdn.example/v_720p.mp4", "quality": "720p"},
+                                                   {"url": "https://cdn.example/v.m3u8"}]}}
+
+
+@pytest.mark.parametrize("criteria,feed,complete", [
+    ("any_candidate", lambda s: s.add_candidate("https://cdn.example/v.m3u8"), True),
+    ("any_candidate", lambda s: s.set_title("t"), False),
+    ("mp4", lambda s: s.add_candidate("https://cdn.example/v.m3u8"), False),
+    ("mp4", lambda s: s.add_candidate("https://cdn.example/v.mp4?sign=1"), True),
+    ("title_and_medias", lambda s: s.set_title("t"), False),
+    ("title_and_medias", lambda s: s.feed_json({"data": {"title": "t", "medias": []}}), False),  # empty medias is a schema miss
+    ("title_and_medias", lambda s: s.feed_json(MEDIAS), True),
+    ("title_or_candidate", lambda s: s.set_title("t"), True),
+])
+def test_completion_criteria(criteria, feed, complete):
+    state = ExtractionState(criteria=criteria, settle_sec=0)
+    feed(state)
+    assert state.is_complete() is complete
+    assert (state.completed_at is not None) is complete
+
+
+def test_feed_json_collects_candidates_and_hints():
+    state = ExtractionState(settle_sec=0)
+    assert state.feed_json(MEDIAS)
+    assert state.candidates == ["https://cdn.example/v_720p.mp4", "https://cdn.example/v.m3u8"]
+    assert state.hints == {"https://cdn.example/v_720p.mp4": {"quality": "720p"}}
+    assert state.medias_seen and state.title == "A note"
+    assert not state.feed_json({"code": 0}) and not state.feed_json([1])
+
+
+def test_json_title_replaces_text_title():
+    state = ExtractionState()
+    state.set_title("scraped")
+    state.set_title("scraped later")
+    assert state.title == "scraped"
+    state.feed_json({"data": {"title": "from api", "medias": []}})
+    state.set_title("scraped again")
+    assert (state.title, state.title_source) == ("from api", "json")
+
+
+def test_note_status_keeps_errors_until_data_arrives():
+    state = ExtractionState()
+    state.note_status(200)
+    state.note_status(503)
+    state.note_status(200)
+    assert state.api_status == 503
+    state.note_status(200, delivered=True)
+    assert state.api_status == 200
+
+
+def test_wait_returns_on_completion_not_deadline():
+    async def main():
+        state = ExtractionState(settle_sec=0)
+        asyncio.get_running_loop().call_later(0.05, state.add_candidate, "https://cdn.example/v.mp4")
+        started = asyncio.get_running_loop().time()
+        assert await state.wait_async(5)
+        assert asyncio.get_running_loop().time() - started < 1 and not state.timed_out
+
+    asyncio.run(main())
+
+
+def test_wait_times_out():
+    async def main():
+        state = ExtractionState(settle_sec=0)
+        assert not await state.wait_async(0.05)
+        assert state.timed_out
+
+    asyncio.run(main())
+
+
+def test_wait_after_completion_returns_at_once():
+    async def main():
+        state = ExtractionState(settle_sec=0)
+        state.add_candidate("https://cdn.example/v.mp4")
+        assert await state.wait_async(0)
+
+    asyncio.run(main())
@@ -0,0 +1,62 @@
+import pytest
+
+import hls
+
+MASTER = """#EXTM3U
+#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360,CODECS="avc1.4d401e,mp4a.40.2"
+low/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=3000000,RESOLUTION=1920x1080
+https://cdn.example/high/index.m3u8
+#EXT-X-STREAM-INF:BANDWIDTH=1500000,RESOLUTION=1280x720
+mid/index.m3u8
+"""
+
+MEDIA = """#EXTM3U
+#EXT-X-TARGETDURATION:4
+#EXT-X-MAP:URI="init.mp4",BYTERANGE="720@0"
+#EXTINF:4.0,
+#EXT-X-BYTERANGE:1000@720
+video.mp4
+#EXTINF:3.5,
+#EXT-X-BYTERANGE:500
+video.mp4
+#EXT-X-ENDLIST
+"""
+
+
+def test_master_playlist():
+    pl = hls.parse_playlist(MASTER, "https://cdn.example/v/master.m3u8")
+    assert pl["type"] == "master"
+    low, high, mid = pl["variants"]
+    assert low == {"bandwidth": 800000, "width": 640, "height": 360, "codecs": "avc1.4d401e,mp4a.40.2",
+                   "uri": "https://cdn.example/v/low/index.m3u8"}
+    assert high["uri"] == "https://cdn.example/high/index.m3u8"
+    assert hls.select_variant(pl["variants"], "highest") is high
+    assert hls.select_variant(pl["variants"], "lowest") is low
+    assert hls.select_variant(pl["variants"], "max_height:720") is mid
+
+
+def test_media_playlist_byteranges_and_map():
+    pl = hls.parse_playlist(MEDIA, "https://cdn.example/v/index.m3u8")
+    assert pl["type"] == "media" and pl["endlist"] and pl["target_duration"] == 4.0
+    assert pl["init"] == {"uri": "https://cdn.example/v/init.mp4", "byterange": (0, 720)}
+    assert [s["byterange"] for s in pl["segments"]] == [(720, 1000), (1720, 500)]  # second offset follows the first
+    assert [s["duration"] for s in pl["segments"]] == [4.0, 3.5]
+    assert hls.estimate_size(pl, None) == 1500
+
+
+def test_estimate_size_from_bandwidth():
+    pl = hls.parse_playlist("#EXTM3U\n#EXTINF:4,\n0.ts\n#EXTINF:4,\n1.ts\n", "https://cdn.example/")
+    assert hls.estimate_size(pl, 1000000) == 1000000
+    assert hls.estimate_size(pl, None) is None
+
+
+@pytest.mark.parametrize("method,encrypted", [("AES-128", True), ("NONE", False)])
+def test_encryption_flag(method, encrypted):
+    text = f'#EXTM3U\n#EXT-X-KEY:METHOD={method},URI="k"\n#EXTINF:4,\n0.ts\n'
+    assert hls.parse_playlist(text, "https://cdn.example/")["encrypted"] is encrypted
+
+
+def test_rejects_non_playlist():
+    with pytest.raises(hls.HLSError):
+        hls.parse_playlist("<html></html>", "https://cdn.example/")
@@ -0,0 +1,95 @@
+import asyncio
+
+import jobs
+import work_queue
+
+
+class FakeEngine:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.running = self.peak = 0
+
+    async def process(self, url, index):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.running -= 1
+        if url.endswith("bad"):
+            raise RuntimeError("boom")
+        return {"postUrl": url, "index": index, "saved_to": f"/tmp/{index}.mp4"}
+
+
+def manager(tmp_path, engine, concurrency=2):
+    queue = work_queue.SQLiteQueue(str(tmp_path / "jobs.sqlite"), max_attempts=1)
+    return jobs.JobManager(engine, queue=queue, concurrency=concurrency)
+
+
+async def wait_status(mgr, job_id, status, timeout=5.0):
+    for _ in range(int(timeout / 0.02)):
+        job = await mgr.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.02)
+    raise AssertionError(f"job stayed {job['status']}")
+
+
+def test_job_runs_bounded_and_is_visible_to_other_processes(tmp_path):
+    async def main():
+        engine = FakeEngine(delay=0.05)
+        worker = manager(tmp_path, engine, concurrency=2).start()
+        other = manager(tmp_path, FakeEngine())  # another server process: answers, does not run
+        try:
+            job = await worker.submit([(i, f"https://x/{i}") for i in range(1, 7)] + [(7, "https://x/bad")])
+            assert job["total"] == 7 and job["status"] in ("queued", "running")
+            done = await wait_status(other, job["id"], "done")
+        finally:
+            await worker.close()
+        assert engine.peak <= 2
+        assert done["counts"] == {"succeeded": 6, "failed": 1}
+        assert done["items"][-1]["result"]["error"] == "boom"
+        assert done["finished_at"] >= done["started_at"] >= done["created_at"]
+        assert await other.get("missing") is None
+
+    asyncio.run(main())
+
+
+def test_cancel_reports_cancelled_and_stops_running_items(tmp_path):
+    async def main():
+        engine = FakeEngine(delay=30)
+        worker = manager(tmp_path, engine, concurrency=1).start()
+        other = manager(tmp_path, FakeEngine())
+        try:
+            job = await worker.submit([(1, "https://x/1"), (2, "https://x/2")])
+            await wait_status(worker, job["id"], "running")
+            while not engine.running:
+                await asyncio.sleep(0.01)
+            cancelled = await other.cancel(job["id"])  # from a process that does not run the item
+            assert cancelled["status"] == "cancelled"
+            assert cancelled["counts"] == {"cancelled": 2}
+            for _ in range(int(2 * jobs.JOB_POLL_SEC / 0.02)):
+                if not engine.running:
+                    break
+                await asyncio.sleep(0.02)
+            assert engine.running == 0
+        finally:
+            await worker.close()
+        assert (await other.get(job["id"]))["status"] == "cancelled"
+        assert await other.cancel("missing") is None
+
+    asyncio.run(main())
+
+
+def test_close_releases_held_items(tmp_path):
+    async def main():
+        engine = FakeEngine(delay=30)
+        worker = manager(tmp_path, engine, concurrency=1).start()
+        job = await worker.submit([(1, "https://x/1")])
+        while not engine.running:
+            await asyncio.sleep(0.01)
+        await worker.close()
+        snap = await worker.get(job["id"])
+        assert snap["items"][0]["status"] == "queued"  # handed back for another process
+
+    asyncio.run(main())
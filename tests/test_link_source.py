@@ -0,0 +1,38 @@
+import io
+
+import pytest
+
+import link_source
+
+
+@pytest.fixture(autouse=True)
+def tiny_chunks(monkeypatch):
+    monkeypatch.setattr(link_source, "READ_CHUNK", 3)  # every element spans several reads
+
+
+def test_json_array_streams_strings_and_objects():
+    text = '[ "https://a", {"index": 7, "postUrl": "https://b"},\n {"postUrl": "https://c"} ]'
+    assert list(link_source.iter_json_array(io.StringIO(text))) == [(1, "https://a"), (7, "https://b"), (3, "https://c")]
+
+
+def test_json_array_number_split_across_reads():
+    assert list(link_source.iter_json_array(io.StringIO("[12345, \"u\"]"))) == [(1, "12345"), (2, "u")]
+
+
+def test_json_array_empty():
+    assert list(link_source.iter_json_array(io.StringIO("  [ ]  "))) == []
+
+
+@pytest.mark.parametrize("text", ['{"postUrl": "x"}', '["https://a", "https://b"'])
+def test_json_array_rejects_bad_input(text):
+    with pytest.raises(ValueError):
+        list(link_source.iter_json_array(io.StringIO(text)))
+
+
+def test_stream_detects_jsonl():
+    text = '\nhttps://a\n{"index": 5, "postUrl": "https://b"}\n'
+    assert list(link_source.iter_stream(io.StringIO(text))) == [(1, "https://a"), (5, "https://b")]
+
+
+def test_stream_detects_json_array():
+    assert list(link_source.iter_stream(io.StringIO(' ["https://a"]'))) == [(1, "https://a")]
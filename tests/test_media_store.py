@@ -0,0 +1,90 @@
+import hashlib
+import os
+
+import pytest
+
+from media_store import MediaStore, StreamHash
+
+
+@pytest.fixture
+def store(tmp_path):
+    return MediaStore(root=tmp_path / "downloads")
+
+
+def download(store, media_url, data, ext=".mp4", post_url="https://www.xiaohongshu.com/explore/aaa", hashed=True):
+    staging = store.staging_path(media_url, ext)
+    staging.write_bytes(data)
+    hasher = StreamHash()
+    if hashed:
+        hasher.update(data)
+    return store.commit(staging, post_url, media_url, "title", hasher)
+
+
+def test_same_content_is_stored_once_and_hardlinked(store):
+    a = download(store, "https://cdn-a.example/v/1.mp4?sign=x", b"video", post_url="https://www.xiaohongshu.com/explore/aaa")
+    b = download(store, "https://cdn-b.example/v/2.mp4?sign=y", b"video", post_url="https://www.xiaohongshu.com/explore/bbb")
+    assert a["digest"] == b["digest"] == hashlib.sha256(b"video").hexdigest()
+    assert store.stats()["blobs"] == 1 and store.stats()["duplicate_blobs"] == 1
+    assert not any(store.staging.iterdir())  # staging files and lock files are gone
+
+    first = store.link(a, store.root / "1 - title.mp4")
+    again = store.link(b, store.root / "1 - title.mp4")
+    assert first == again and os.path.samefile(first, a["blob"]) and first.read_bytes() == b"video"
+
+
+def test_a_taken_name_gets_a_digest_suffix(store):
+    other = store.root / "1 - title.mp4"
+    other.write_bytes(b"someone else's video")
+    found = download(store, "https://cdn.example/v/1.mp4", b"video")
+    linked = store.link(found, other)
+    assert linked.name == f"1 - title [{found['digest'][:8]}].mp4"
+    assert other.read_bytes() == b"someone else's video"
+
+
+def test_lookups_ignore_the_signed_query(store):
+    found = download(store, "https://cdn.example/v/1.mp4?sign=a", b"video", post_url="https://www.xiaohongshu.com/explore/abc?x=1")
+    assert store.lookup_url("https://cdn.example/v/1.mp4?sign=b")["digest"] == found["digest"]
+    note = store.lookup_note("https://www.xiaohongshu.com/explore/abc")
+    assert note["digest"] == found["digest"] and note["title"] == "title"
+    assert store.lookup_url("https://cdn.example/v/2.mp4") is None
+
+
+def test_a_deleted_blob_is_forgotten(store):
+    found = download(store, "https://cdn.example/v/1.mp4", b"video")
+    found["blob"].unlink()
+    assert store.lookup_url("https://cdn.example/v/1.mp4") is None
+
+
+def test_staging_is_locked_across_store_instances(store):
+    other = MediaStore(root=store.root)  # another process on the same volume
+    url = "https://cdn.example/v/1.mp4"
+    mine = store.staging_path(url, ".mp4")
+    theirs = other.staging_path(url, ".mp4")
+    assert mine != theirs and theirs.stem.startswith(mine.stem)
+    other.release(theirs)
+    store.release(mine)
+    assert other.staging_path(url, ".mp4") == mine  # free again: the stable name, so a ranged download resumes
+
+
+def test_stream_hash_is_only_trusted_by_the_lock_holder(store):
+    url = "https://cdn.example/v/1.mp4"
+    streamed = StreamHash()
+    streamed.update(b"x" * len(b"on disk"))  # what the hasher saw; same length as the file
+    held = store.staging_path(url, ".mp4")
+    held.write_bytes(b"on disk")
+    assert store.commit(held, "https://www.xiaohongshu.com/explore/aaa", url, None, streamed)["digest"] == streamed.hexdigest()
+
+    lost = store.staging_path("https://cdn.example/v/2.mp4", ".mp4")
+    lost.write_bytes(b"on disk")
+    store.release(lost)  # lock gone: another writer may have touched the file
+    assert store.commit(lost, "https://www.xiaohongshu.com/explore/bbb", url, None, streamed)["digest"] == \
+        hashlib.sha256(b"on disk").hexdigest()
+
+
+def test_unhashed_download_is_hashed_at_commit(store):
+    found = download(store, "https://cdn.example/v/1.mp4", b"ranged", hashed=False)
+    assert found["digest"] == hashlib.sha256(b"ranged").hexdigest()
+
+
+def test_index_uses_the_rollback_journal(store):
+    assert store._db.execute("PRAGMA journal_mode").fetchone()[0] == "delete"
@@ -0,0 +1,53 @@
+import metrics
+from metrics import Counter, GaugeFn, Histogram, Registry
+
+
+def render(*metrics_):
+    reg = Registry()
+    for m in metrics_:
+        reg.register(m)
+    return reg.render().splitlines()
+
+
+def test_label_values_and_help_are_escaped():
+    c = Counter("t_total", "Line one\nback\\slash", labels=("reason",))
+    c.inc(reason='say "hi"\\\nbye')
+    assert render(c) == [
+        "# HELP t_total Line one\\nback\\\\slash",
+        "# TYPE t_total counter",
+        't_total{reason="say \\"hi\\"\\\\\\nbye"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    h = Histogram("t_seconds", "Latency.", buckets=(1, 0.5), labels=("stage",))
+    for v in (0.2, 0.5, 0.7, 3.0):
+        h.observe(v, stage="wait")
+    lines = render(h)
+    assert lines[2:] == [
+        't_seconds_bucket{stage="wait",le="0.5"} 2',
+        't_seconds_bucket{stage="wait",le="1"} 3',
+        't_seconds_bucket{stage="wait",le="+Inf"} 4',
+        't_seconds_sum{stage="wait"} 4.4',
+        't_seconds_count{stage="wait"} 4',
+    ]
+
+
+def test_float_values_keep_full_precision():
+    c = Counter("t_bytes_total", "Bytes.")
+    c.inc(1234567.125)
+    assert render(c)[-1] == "t_bytes_total 1234567.125"
+
+
+def test_failing_gauge_renders_no_samples():
+    def boom():
+        raise RuntimeError("pool gone")
+    lines = render(GaugeFn("t_gauge", "Gauge.", boom), GaugeFn("t_ok", "Ok.", lambda: {("a",): 2}, labels=("pool",)))
+    assert lines == ["# HELP t_gauge Gauge.", "# TYPE t_gauge gauge", "# HELP t_ok Ok.", "# TYPE t_ok gauge", 't_ok{pool="a"} 2']
+
+
+def test_failure_reason():
+    assert metrics.failure_reason({"saved_to": "/x.mp4", "error": "late"}) is None
+    assert metrics.failure_reason({}) == "no_candidates"
+    assert metrics.failure_reason({"error": "download_failed: 403"}) == "download_failed"
+    assert metrics.failure_reason({"error": "Timeout 30000ms exceeded."}) == "extract_error"
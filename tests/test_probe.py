@@ -0,0 +1,90 @@
+import time
+
+import pytest
+
+import probe
+from probe import ProbeCache, choose_candidate, height_hint, rank_candidates, signed_expiry
+
+MIB = 1 << 20
+
+
+def cand(url, size=None, ct="video/mp4", **extra):
+    return dict({"url": url, "size_bytes": size, "content_type": ct}, **extra)
+
+
+def urls(ranked):
+    return [c["url"] for c in ranked]
+
+
+def test_sized_video_then_unsized_then_the_rest():
+    ranked = rank_candidates([
+        cand("https://cdn.example/error", 900, ct="text/html"),
+        cand("https://cdn.example/unsized.mp4"),
+        cand("https://cdn.example/big.mp4", 9 * MIB),
+        cand("https://cdn.example/enc.m3u8", 2 * MIB, ct="application/vnd.apple.mpegurl", hls={"encrypted": True}),
+        cand("https://cdn.example/blob", 5 * MIB, ct="application/octet-stream"),  # untyped, no video path
+        cand("https://cdn.example/small.mp4", 3 * MIB, ct="application/octet-stream"),  # untyped, video path
+    ], "smallest")
+    assert urls(ranked) == [
+        "https://cdn.example/small.mp4", "https://cdn.example/big.mp4",
+        "https://cdn.example/unsized.mp4", "https://cdn.example/blob",
+        "https://cdn.example/error", "https://cdn.example/enc.m3u8",
+    ]
+
+
+@pytest.mark.parametrize("policy,expected", [
+    ("smallest", ["480.mp4", "720.mp4", "1080.mp4"]),
+    ("best", ["1080.mp4", "720.mp4", "480.mp4"]),
+    ("max_height:720", ["720.mp4", "480.mp4", "1080.mp4"]),
+    ("max_height:junk", ["480.mp4", "720.mp4", "1080.mp4"]),
+])
+def test_policies(policy, expected):
+    cands = [cand("https://cdn.example/1080.mp4", 30 * MIB, height=1080),
+             cand("https://cdn.example/480.mp4", 8 * MIB, height=480),
+             cand("https://cdn.example/720.mp4", 15 * MIB, height=720)]
+    assert [u.rsplit("/", 1)[1] for u in urls(rank_candidates(cands, policy))] == expected
+
+
+def test_progressive_beats_hls_on_ties_and_order_is_stable():
+    hls = cand("https://cdn.example/v.m3u8", 5 * MIB, ct="application/vnd.apple.mpegurl", hls={"encrypted": False})
+    first, second = cand("https://cdn.example/a.mp4", 5 * MIB), cand("https://cdn.example/b.mp4", 5 * MIB)
+    assert urls(rank_candidates([hls, first, second], "smallest")) == [first["url"], second["url"], hls["url"]]
+
+
+def test_choose_candidate():
+    assert choose_candidate([]) is None
+    assert choose_candidate([cand("https://cdn.example/error", 10, ct="text/html")])["url"] == "https://cdn.example/error"
+
+
+@pytest.mark.parametrize("url,hint,hls_info,expected", [
+    ("https://cdn.example/v.mp4", None, {"height": 720}, 720),
+    ("https://cdn.example/v.mp4", {"height": "1080"}, None, 1080),
+    ("https://cdn.example/v.mp4", {"resolution": "1280x720"}, None, 720),
+    ("https://cdn.example/v.mp4", {"quality": "HD"}, None, 720),
+    ("https://cdn.example/v_480p.mp4", None, None, 480),
+    ("https://cdn.example/1920x1080/v.mp4", None, None, 1080),
+    ("https://cdn.example/v.mp4", {"quality": "original"}, None, None),
+])
+def test_height_hint(url, hint, hls_info, expected):
+    assert height_hint(url, hint, hls_info) == expected
+
+
+def test_signed_expiry():
+    assert signed_expiry("https://cdn.example/v.mp4?x-expires=1900000000") == 1900000000
+    assert signed_expiry("https://cdn.example/v.mp4?e=1900000000000") == 1900000000
+    assert signed_expiry("https://s3.example/v.mp4?X-Amz-Date=20300101T000000Z&X-Amz-Expires=60") == 1893456060
+    assert signed_expiry("https://cdn.example/v.mp4?e=12") is None
+
+
+def test_probe_cache_stops_before_the_signature_expires(monkeypatch):
+    now = [1_900_000_000.0]
+    monkeypatch.setattr(probe.time, "time", lambda: now[0])
+    cache = ProbeCache(ttl_sec=1800)
+    soon = f"https://cdn.example/v.mp4?x-expires={int(now[0]) + 300}"
+    cache.put(soon, {"size_bytes": 1})
+    cache.put(f"https://cdn.example/v.mp4?x-expires={int(now[0]) + 30}", {"size_bytes": 1})  # inside the margin
+    assert cache.stats()["entries"] == 1
+    now[0] += 300 - probe.EXPIRY_MARGIN_SEC - 1
+    assert cache.get(soon) == {"size_bytes": 1}
+    now[0] += 2
+    assert cache.get(soon) is None and cache.stats()["expired"] == 1
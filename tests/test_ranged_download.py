@@ -0,0 +1,188 @@
+import asyncio
+import hashlib
+import re
+import threading
+
+import aiohttp
+import pytest
+from aiohttp import web
+
+import ranged_download
+from media_store import StreamHash
+
+MIB = 1 << 20
+RANGE_RE = re.compile(r"^bytes=(\d+)-(\d*)$")
+
+
+def body(size):
+    block = bytes(range(251))  # a prime period, so a misplaced range never lines up by accident
+    return (block * (size // len(block) + 1))[:size]
+
+
+def serve(data, check, mode="range"):
+    """Serve data at /v.mp4 and await check(url, session, stats).
+
+    mode: "range" honours Range, "ignore" always sends 200, "shift" sends 206 from a
+    start 100 bytes early (with a truthful Content-Range), "bare" omits Content-Range.
+    """
+    stats = {"bytes_sent": 0}
+
+    async def video(request):
+        m = RANGE_RE.match(request.headers.get("Range", ""))
+        if not m or mode == "ignore":
+            stats["bytes_sent"] += len(data)
+            return web.Response(body=data, content_type="video/mp4")
+        start = int(m.group(1))
+        end = min(int(m.group(2)), len(data) - 1) if m.group(2) else len(data) - 1
+        if mode == "shift":
+            start = max(0, start - 100)
+        stats["bytes_sent"] += end - start + 1
+        headers = {} if mode == "bare" else {"Content-Range": f"bytes {start}-{end}/{len(data)}"}
+        return web.Response(status=206, body=data[start:end + 1], content_type="video/mp4", headers=headers)
+
+    async def main():
+        app = web.Application()
+        app.router.add_get("/v.mp4", video)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", 0).start()
+        try:
+            async with aiohttp.ClientSession() as session:
+                await check(f"http://127.0.0.1:{runner.addresses[0][1]}/v.mp4", session, stats)
+        finally:
+            await runner.cleanup()
+    asyncio.run(main())
+
+
+def test_plan_ranges_covers_the_file():
+    size = 10 * MIB + 3
+    ranges = ranged_download.plan_ranges(size, 4)
+    assert len(ranges) == 4 and ranges[0][0] == 0 and ranges[-1][1] == size - 1
+    assert all(a[1] + 1 == b[0] for a, b in zip(ranges, ranges[1:]))
+    assert all(done == 0 for _, _, done in ranges)
+
+
+def test_plan_ranges_keeps_small_files_whole():
+    assert ranged_download.plan_ranges(MIB, 8) == [[0, MIB - 1, 0]]
+
+
+def test_manifest_matches_object_not_signature(tmp_path):
+    out = tmp_path / "v.mp4"
+    url = "https://cdn.example/v/1.mp4?sign=a&t=1"
+    _, manifest_path, manifest = ranged_download._prepare(out, url, 4 * MIB, 2)
+    assert ranged_download.load_manifest(manifest_path, "https://cdn.example/v/1.mp4?sign=b&t=2", 4 * MIB) == manifest
+    assert ranged_download.load_manifest(manifest_path, url, 4 * MIB + 1) is None
+    assert ranged_download.load_manifest(manifest_path, "https://cdn.example/v/2.mp4", 4 * MIB) is None
+    assert ranged_download.load_manifest(tmp_path / "missing.json", url, 4 * MIB) is None
+
+
+def test_resume_fetches_only_missing_bytes(tmp_path):
+    size = 8 * MIB
+    expected = body(size)
+    out = tmp_path / "v.mp4"
+
+    async def check(url, session, stats):
+        part, manifest_path, manifest = ranged_download._prepare(out, url, size, 4)
+        first, last = manifest["ranges"][0], manifest["ranges"][-1]
+        with part.open("r+b") as fh:  # an interrupted run: half of the first range and all of the last on disk
+            fh.write(expected[:MIB])
+            fh.seek(last[0]); fh.write(expected[last[0]:])
+        first[2], last[2] = MIB, last[1] - last[0] + 1
+        ranged_download.save_manifest(manifest_path, manifest)
+
+        assert await ranged_download.ranged_download(session, url, out, size, connections=4) == (True, None)
+        assert stats["bytes_sent"] == size - MIB - (last[1] - last[0] + 1)
+
+    serve(expected, check)
+    assert out.read_bytes() == expected
+    assert not any(p.exists() for p in ranged_download.part_paths(out))
+
+
+def test_stale_manifest_restarts(tmp_path):
+    size = 2 * MIB
+    out = tmp_path / "v.mp4"
+    part, manifest_path = ranged_download.part_paths(out)
+    part.write_bytes(b"x" * 10)
+    ranged_download.save_manifest(manifest_path, {"url_key": "other", "size": size, "ranges": [[0, size - 1, size]]})
+
+    async def check(url, session, stats):
+        assert await ranged_download.ranged_download(session, url, out, size) == (True, None)
+
+    serve(body(size), check)
+    assert out.read_bytes() == body(size)
+
+
+def test_range_ignored_falls_back_to_one_stream(tmp_path):
+    size = 8 * MIB
+    out = tmp_path / "v.mp4"
+
+    async def check(url, session, stats):
+        assert await ranged_download.ranged_download(session, url, out, size, connections=4) == (True, None)
+
+    serve(body(size), check, mode="ignore")
+    assert out.read_bytes() == body(size)
+
+
+@pytest.mark.parametrize("mode", ["shift", "bare"])
+def test_unexpected_content_range_falls_back_to_one_stream(tmp_path, mode):
+    size = 8 * MIB
+    out = tmp_path / "v.mp4"
+
+    async def check(url, session, stats):
+        assert await ranged_download.ranged_download(session, url, out, size, connections=4) == (True, None)
+
+    serve(body(size), check, mode=mode)
+    assert out.read_bytes() == body(size)
+
+
+def test_checkpoints_run_off_the_event_loop(tmp_path, monkeypatch):
+    size = 4 * MIB
+    out = tmp_path / "v.mp4"
+    threads = []
+    real = ranged_download._checkpoint_sync
+
+    def record(*args):
+        threads.append(threading.get_ident())
+        real(*args)
+
+    monkeypatch.setattr(ranged_download, "_checkpoint_sync", record)
+    monkeypatch.setattr(ranged_download, "MANIFEST_EVERY_SEC", 0)
+
+    async def check(url, session, stats):
+        assert await ranged_download.ranged_download(session, url, out, size, connections=2) == (True, None)
+
+    serve(body(size), check)
+    assert threads and threading.get_ident() not in threads
+    assert out.read_bytes() == body(size)
+
+
+@pytest.mark.parametrize("mode", ["range", "shift", "ignore"])
+def test_hasher_sees_every_byte_in_order(tmp_path, mode):
+    size = 8 * MIB + 5
+    out = tmp_path / "v.mp4"
+    hasher = StreamHash()
+
+    async def check(url, session, stats):
+        assert await ranged_download.ranged_download(session, url, out, size, connections=4, hasher=hasher) == (True, None)
+
+    serve(body(size), check, mode=mode)
+    assert hasher.bytes == size and hasher.hexdigest() == hashlib.sha256(body(size)).hexdigest()
+
+
+def test_resumed_bytes_are_hashed_from_disk(tmp_path):
+    size = 8 * MIB
+    expected = body(size)
+    out = tmp_path / "v.mp4"
+    hasher = StreamHash()
+
+    async def check(url, session, stats):
+        part, manifest_path, manifest = ranged_download._prepare(out, url, size, 4)
+        last = manifest["ranges"][-1]
+        with part.open("r+b") as fh:
+            fh.seek(last[0]); fh.write(expected[last[0]:])
+        last[2] = last[1] - last[0] + 1
+        ranged_download.save_manifest(manifest_path, manifest)
+        assert await ranged_download.ranged_download(session, url, out, size, connections=4, hasher=hasher) == (True, None)
+
+    serve(expected, check)
+    assert hasher.bytes == size and hasher.hexdigest() == hashlib.sha256(expected).hexdigest()
@@ -0,0 +1,94 @@
+import asyncio
+import json
+
+import pytest
+
+import response_inspect
+from extract_state import ExtractionState
+
+
+class FakeRequest:
+    def __init__(self, resource_type, body_size=None):
+        self.resource_type = resource_type
+        self.body_size = body_size
+
+    async def sizes(self):
+        return {"responseBodySize": self.body_size}
+
+
+class FakeResponse:
+    def __init__(self, url, headers, body="", status=200, resource_type="xhr", body_size=None):
+        self.url, self.headers, self.status = url, headers, status
+        self.body = body
+        self.reads = 0
+        self.request = FakeRequest(resource_type, body_size)
+
+    async def text(self):
+        self.reads += 1
+        return self.body
+
+
+def inspect(resp, state=None):
+    state = state or ExtractionState(settle_sec=0)
+    stats = response_inspect.new_stats()
+    asyncio.run(response_inspect.inspect_async(resp, state, stats, lambda text: "title from text"))
+    return state, stats
+
+
+@pytest.mark.parametrize("url,headers,resource_type,kind", [
+    ("https://cdn.example/v.mp4?sign=1", {}, "media", "video"),
+    ("https://cdn.example/play", {"content-type": "application/vnd.apple.mpegurl"}, "xhr", "video"),
+    ("https://seekin.example/logo.png", {"content-type": "image/png"}, "image", "skip"),
+    ("https://seekin.example/api/parse", {"content-type": "application/json; charset=utf-8"}, "xhr", "json"),
+    ("https://seekin.example/config.json", {}, "fetch", "json"),
+    ("https://seekin.example/", {"content-type": "text/html"}, "document", "text"),
+    ("https://seekin.example/app.js", {"content-type": "application/javascript"}, "script", "text"),
+    ("https://seekin.example/api/parse", {"content-type": "application/json", "content-length": str(64 << 20)}, "xhr", "oversize"),
+    ("https://seekin.example/blob", {"content-type": "application/octet-stream"}, "other", "skip"),
+])
+def test_classify(url, headers, resource_type, kind):
+    assert response_inspect.classify(url, headers, resource_type) == kind
+
+
+def test_video_is_recorded_without_reading_the_body():
+    resp = FakeResponse("https://cdn.example/v.mp4", {"content-length": "1000"}, resource_type="media")
+    state, stats = inspect(resp)
+    assert resp.reads == 0 and state.candidates == ["https://cdn.example/v.mp4"]
+    assert stats["videos"] == 1 and stats["bytes_skipped"] == 1000
+
+
+def test_api_json_feeds_the_state():
+    payload = {"data": {"title": "API title", "medias": [{"url": "https://cdn.example/v.mp4"}]}}
+    resp = FakeResponse("https://seekin.example/api/parse", {"content-type": "application/json"}, json.dumps(payload))
+    state, stats = inspect(resp)
+    assert state.title == "API title" and state.candidates == ["https://cdn.example/v.mp4"]
+    assert state.api_request is resp.request and state.api_status == 200
+    assert stats["inspected"] == 1
+
+
+def test_unsized_body_over_the_cap_is_not_read(monkeypatch):
+    monkeypatch.setattr(response_inspect, "INSPECT_MAX_BYTES", 100)
+    resp = FakeResponse("https://seekin.example/", {"content-type": "text/html"}, "x" * 1000, resource_type="document",
+                        body_size=1000)
+    state, stats = inspect(resp)
+    assert resp.reads == 0 and state.title is None
+    assert stats["oversize"] == 1 and stats["bytes_skipped"] == 1000
+
+
+def test_decoded_body_over_the_cap_is_dropped(monkeypatch):
+    monkeypatch.setattr(response_inspect, "INSPECT_MAX_BYTES", 100)
+    resp = FakeResponse("https://seekin.example/", {"content-type": "text/html"}, "x" * 1000, resource_type="document")
+    state, stats = inspect(resp)
+    assert resp.reads == 1 and state.title is None and stats["oversize"] == 1
+
+
+def test_only_seekin_statuses_are_recorded():
+    state = ExtractionState(settle_sec=0)
+    for url in ("https://analytics.tracker.example/collect", "https://seekin.example.evil.example/api"):
+        asyncio.run(response_inspect.inspect_async(FakeResponse(url, {}, status=503), state, response_inspect.new_stats(),
+                                                   lambda text: None, api_url="https://www.seekin.example/page/"))
+    assert state.api_status is None
+    asyncio.run(response_inspect.inspect_async(FakeResponse("https://api.seekin.example/parse", {}, status=429), state,
+                                               response_inspect.new_stats(), lambda text: None,
+                                               api_url="https://www.seekin.example/page/"))
+    assert state.api_status == 429
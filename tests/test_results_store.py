@@ -0,0 +1,61 @@
+import json
+
+import results_store
+
+
+def write_log(path, records):
+    with results_store.ResultsWriter(path) as writer:
+        for res in records:
+            writer.write(res)
+    with path.open("a", encoding="utf-8") as fh:
+        fh.write('{"index": 9, "saved_')  # torn last line after a crash
+
+
+def test_saved_record_survives_a_later_failure(tmp_path):
+    video = tmp_path / "3.mp4"
+    video.write_bytes(b"v")
+    log = tmp_path / "results.jsonl"
+    write_log(log, [
+        {"index": 3, "saved_to": str(video)},
+        {"index": 3, "error": "later"},
+        {"index": 1, "error": "first"},
+        {"index": 1, "error": "second"},
+        {"index": 2, "saved_to": str(tmp_path / "deleted.mp4")},
+        {"postUrl": "no index"},
+    ])
+    assert results_store.load_completed(log) == {3}
+
+    out = tmp_path / "results.json"
+    assert results_store.compact(log, out) == 4
+    assert json.loads(out.read_text(encoding="utf-8")) == [
+        {"index": 1, "error": "second"},
+        {"index": 2, "saved_to": str(tmp_path / "deleted.mp4")},
+        {"index": 3, "saved_to": str(video)},
+        {"postUrl": "no index"},
+    ]
+
+
+def test_latest_saved_record_wins(tmp_path):
+    old, new = tmp_path / "old.mp4", tmp_path / "new.mp4"
+    old.write_bytes(b"o"); new.write_bytes(b"n")
+    log = tmp_path / "results.jsonl"
+    write_log(log, [{"index": 1, "saved_to": str(old)}, {"index": 1, "saved_to": str(new)}, {"index": 1, "error": "x"}])
+    out = tmp_path / "results.json"
+    results_store.compact(log, out)
+    assert json.loads(out.read_text(encoding="utf-8")) == [{"index": 1, "saved_to": str(new)}]
+
+
+def test_missing_log_means_nothing_done(tmp_path):
+    assert results_store.load_completed(tmp_path / "none.jsonl") == set()
+
+
+def test_writer_modes(tmp_path):
+    log = tmp_path / "results.jsonl"
+    with results_store.ResultsWriter(log) as writer:
+        writer.write({"index": 1})
+    with results_store.ResultsWriter(log) as writer:
+        writer.write({"index": 2})
+    assert len(log.read_text(encoding="utf-8").splitlines()) == 2
+    with results_store.ResultsWriter(log, mode="w") as writer:
+        writer.write({"index": 3})
+    assert log.read_text(encoding="utf-8").splitlines() == ['{"index": 3}']
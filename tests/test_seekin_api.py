@@ -0,0 +1,74 @@
+import json
+
+import pytest
+
+import bench_servers
+import seekin_api
+
+NOTE = "64ab0000000000000000aaaa"
+POST_URL = f"https://www.xiaohongshu.com/explore/{NOTE}?xsec_token=abc"
+
+
+def stand_in_config(**overrides):
+    return bench_servers.default_config(latency_ms=0, jitter_ms=0, **overrides)
+
+
+def template_store(tmp_path, base):
+    path = tmp_path / "seekin_api.json"
+    path.write_text(json.dumps(bench_servers.api_template(base)), encoding="utf-8")
+    return seekin_api.ApiTemplateStore(path=path, mode="auto")
+
+
+def test_replay_against_stand_in(tmp_path, stand_in):
+    async def check(base, session):
+        store, outcome = template_store(tmp_path, base), {}
+        state = await seekin_api.replay_async(session, store, POST_URL, outcome)
+        assert state is not None
+        assert state.title == f"Benchmark note {NOTE}"
+        assert state.candidates == [f"{base}/cdn/{NOTE}/720p.mp4", f"{base}/cdn/{NOTE}/1080p.mp4"]
+        assert state.hints[f"{base}/cdn/{NOTE}/720p.mp4"] == {"quality": "720p"}
+        assert outcome == {"status": 200}
+        assert store.stats()["api_hits"] == 1
+
+    stand_in(stand_in_config(), check)
+
+
+def test_empty_medias_falls_back(tmp_path, stand_in):
+    async def check(base, session):
+        store, outcome = template_store(tmp_path, base), {}
+        assert await seekin_api.replay_async(session, store, POST_URL, outcome) is None
+        assert outcome["status"] == 200
+        assert "data.medias" in outcome["error"]
+        assert store.get() is not None  # one schema miss keeps the template
+        assert store.stats()["api_failures"] == 1
+
+    stand_in(stand_in_config(fail_rate=1.0, fail_kinds=["empty"]), check)
+
+
+def test_parse_payload_rejects_empty_medias():
+    with pytest.raises(seekin_api.ApiSchemaError):
+        seekin_api.parse_payload({"code": 0, "data": {"title": "", "medias": []}})
+
+
+def test_template_dropped_after_max_failures(tmp_path, stand_in):
+    async def check(base, session):
+        store = template_store(tmp_path, base)
+        for _ in range(seekin_api.API_MAX_FAILURES):
+            outcome = {}
+            assert await seekin_api.replay_async(session, store, POST_URL, outcome) is None
+            assert outcome["status"] == 500
+        assert store.get() is None
+        assert not store.path.exists()
+        assert store.stats()["dropped"] == 1
+
+    stand_in(stand_in_config(fail_rate=1.0, fail_kinds=["500"]), check)
+
+
+def test_build_template_round_trips():
+    body = json.dumps({"url": POST_URL})
+    tpl = seekin_api.build_template("https://seekin.example/api/parse", "post", {"Content-Type": "application/json", "Cookie": "x"},
+                                    body, POST_URL)
+    assert tpl["method"] == "POST" and tpl["encoding"] == "json"
+    assert "Cookie" not in tpl["headers"]
+    other = "https://www.xiaohongshu.com/explore/64ab0000000000000000bbbb"
+    assert json.loads(seekin_api.render(tpl, other)["data"]) == {"url": other}
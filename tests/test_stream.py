@@ -0,0 +1,124 @@
+import asyncio
+import hashlib
+
+import aiohttp
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+import app_playwright_update
+import metrics
+import streaming
+from concurrency import ConcurrencyController
+
+DATA = bytes(range(256)) * 4000
+NOTE = "64a1b2c3d4e5f60718293a4b"
+POST = f"https://www.xiaohongshu.com/explore/{NOTE}?xsec_token=t"
+
+
+def run(check, monkeypatch, tmp_path):
+    """Serve the API with a fake engine whose only candidate is a local CDN; await check(client, cdn_log, engine)."""
+    monkeypatch.chdir(tmp_path)  # the jobs queue file
+    cdn_log = []
+
+    async def video(request):
+        cdn_log.append(request.headers.get("Range"))
+        rng = request.headers.get("Range")
+        if not rng:
+            return web.Response(body=DATA, content_type="video/mp4", headers={"Accept-Ranges": "bytes"})
+        a, b = rng.split("=")[1].split("-")
+        a, b = int(a), int(b) if b else len(DATA) - 1
+        if a >= len(DATA):
+            return web.Response(status=416, headers={"Content-Range": f"bytes */{len(DATA)}"})
+        return web.Response(status=206, body=DATA[a:b + 1], content_type="video/mp4",
+                            headers={"Content-Range": f"bytes {a}-{b}/{len(DATA)}", "Accept-Ranges": "bytes"})
+
+    async def main():
+        cdn_app = web.Application()
+        cdn_app.router.add_get("/v.mp4", video)
+        cdn = TestServer(cdn_app)
+        await cdn.start_server()
+        video_url = str(cdn.make_url("/v.mp4"))
+
+        class FakeEngine:
+            def __init__(self):
+                self.limits, self.pool, self.calls = ConcurrencyController(), None, []
+
+            async def start(self):
+                self.session = aiohttp.ClientSession()
+                return self
+
+            async def close(self):
+                await self.session.close()
+
+            async def resolve(self, result, **kwargs):
+                self.calls.append(kwargs)
+                return [{"url": video_url, "size_bytes": len(DATA)}], "A title"
+
+        monkeypatch.setattr(app_playwright_update, "Engine", FakeEngine)
+        client = TestClient(TestServer(app_playwright_update.create_app()))
+        await client.start_server()
+        try:
+            await check(client, cdn_log, client.app[app_playwright_update.ENGINE])
+        finally:
+            await client.close()
+            await cdn.close()
+    asyncio.run(main())
+
+
+def streamed_bytes(to):
+    return dict(((name, labels), v) for name, labels, v in metrics.STREAMED_BYTES.samples()).get(
+        ("xhs_streamed_bytes_total", f'{{to="{to}"}}'), 0)
+
+
+def test_range_is_passed_through(monkeypatch, tmp_path):
+    async def check(client, cdn_log, engine):
+        r = await client.get("/stream", params={"url": POST}, headers={"Range": "bytes=10-19"})
+        assert r.status == 206 and await r.read() == DATA[10:20]
+        assert r.headers["Content-Range"] == f"bytes 10-19/{len(DATA)}" and r.headers["Accept-Ranges"] == "bytes"
+        assert r.headers["Content-Disposition"] == "inline; filename*=UTF-8''A%20title.mp4"
+        assert cdn_log == ["bytes=10-19"]
+    run(check, monkeypatch, tmp_path)
+
+
+def test_full_stream_writes_no_local_files(monkeypatch, tmp_path):
+    before, disk = streamed_bytes("client"), dict(metrics.DOWNLOAD_BYTES._values)
+
+    async def check(client, cdn_log, engine):
+        r = await client.get("/stream", params={"url": POST})
+        assert r.status == 200 and await r.read() == DATA
+        assert cdn_log == [None]
+        assert engine.calls[0]["use_store"] is False and engine.calls[0]["capture_debug"] is False
+    run(check, monkeypatch, tmp_path)
+    assert streamed_bytes("client") - before == len(DATA)
+    assert dict(metrics.DOWNLOAD_BYTES._values) == disk
+
+
+def test_unsatisfiable_range_is_416(monkeypatch, tmp_path):
+    async def check(client, cdn_log, engine):
+        r = await client.get("/stream", params={"url": POST}, headers={"Range": f"bytes={len(DATA)}-"})
+        assert r.status == 416 and (await r.json())["error"] == "upstream_status: 416"
+    run(check, monkeypatch, tmp_path)
+
+
+def test_sink_gets_the_whole_video(monkeypatch, tmp_path):
+    monkeypatch.setattr(streaming, "_sinks", {})
+    before = streamed_bytes("memory")
+
+    async def check(client, cdn_log, engine):
+        r = await client.post("/extract", json={"url": POST, "mode": "sink", "sink": "memory"},
+                              headers={"Range": "bytes=0-9"})
+        body = await r.json()
+        assert r.status == 200 and body["streamed_to"] == f"memory://{NOTE}.mp4"
+        assert body["digest"] == hashlib.sha256(DATA).hexdigest() and body["streamed_bytes"] == len(DATA)
+        assert streaming.get_sink("memory").objects[f"{NOTE}.mp4"] == DATA
+        assert cdn_log == [None]  # a client's Range is never applied to an upload
+    run(check, monkeypatch, tmp_path)
+    assert streamed_bytes("memory") - before == len(DATA)
+
+
+def test_unknown_sink_is_rejected_before_any_fetch(monkeypatch, tmp_path):
+    async def check(client, cdn_log, engine):
+        r = await client.get("/stream", params={"url": POST, "sink": "nope"})
+        assert r.status == 400 and (await r.json())["error"] == "unknown_sink"
+        assert cdn_log == [] and engine.calls == []
+    run(check, monkeypatch, tmp_path)
@@ -0,0 +1,83 @@
+import asyncio
+
+from ua_hedge import UAStats, run_hedged
+
+KEYS = ["mobile", "desktop"]
+
+
+def fake_attempts(plan):
+    """plan: key -> (seconds, ok, value); returns (attempt, log of (event, key, loop time))."""
+    log = []
+
+    async def attempt(key):
+        loop = asyncio.get_running_loop()
+        log.append(("start", key, loop.time()))
+        seconds, ok, value = plan[key]
+        try:
+            await asyncio.sleep(seconds)
+        except asyncio.CancelledError:
+            log.append(("cancelled", key, loop.time()))
+            raise
+        if isinstance(value, Exception):
+            raise value
+        return ok, value
+
+    return attempt, log
+
+
+def run(plan, delay, stats=None):
+    attempt, log = fake_attempts(plan)
+    stats = stats or UAStats()
+
+    async def main():
+        started = asyncio.get_running_loop().time()
+        out = await run_hedged(KEYS, attempt, delay=delay, stats=stats)
+        return out, [(event, key, round(t - started, 2)) for event, key, t in log]
+
+    out, log = asyncio.run(main())
+    return out, log, stats
+
+
+def test_fast_first_attempt_never_hedges():
+    out, log, stats = run({"mobile": (0.01, True, "m"), "desktop": (0.01, True, "d")}, delay=0.5)
+    assert out == ("mobile", "m")
+    assert [e[:2] for e in log] == [("start", "mobile")]
+    assert stats.snapshot()["mobile"]["wins"] == 1
+
+
+def test_slow_attempt_is_hedged_and_the_loser_cancelled():
+    out, log, stats = run({"mobile": (5, True, "m"), "desktop": (0.05, True, "d")}, delay=0.1)
+    assert out == ("desktop", "d")
+    starts = {key: t for event, key, t in log if event == "start"}
+    assert 0.08 <= starts["desktop"] < 0.5
+    assert ("cancelled", "mobile") in [e[:2] for e in log]
+    snap = stats.snapshot()
+    assert snap["mobile"]["cancelled"] == 1 and snap["mobile"]["attempts"] == 0
+
+
+def test_failure_starts_the_next_attempt_at_once():
+    out, log, _ = run({"mobile": (0.01, False, "no candidates"), "desktop": (0.01, True, "d")}, delay=5)
+    assert out == ("desktop", "d")
+    assert max(t for _, _, t in log) < 1
+
+
+def test_all_failed_returns_the_last_value():
+    out, _, stats = run({"mobile": (0.01, False, "no candidates"), "desktop": (0.02, False, RuntimeError("boom"))}, delay=0)
+    assert out[0] is None and str(out[1]) == "boom"
+    assert stats.snapshot()["desktop"]["attempts"] == 1
+
+
+def test_negative_delay_is_sequential():
+    out, log, _ = run({"mobile": (0.1, False, None), "desktop": (0.01, True, "d")}, delay=-1)
+    assert out == ("desktop", "d")
+    starts = {key: t for event, key, t in log if event == "start"}
+    assert starts["desktop"] >= 0.09
+
+
+def test_order_prefers_the_winning_ua():
+    stats = UAStats()
+    assert stats.order(KEYS) == KEYS
+    for _ in range(3):
+        stats.record("mobile", False, 1.0)
+        stats.record("desktop", True, 1.0, won=True)
+    assert stats.order(KEYS) == ["desktop", "mobile"]
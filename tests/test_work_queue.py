@@ -0,0 +1,75 @@
+import time
+
+import pytest
+
+import work_queue
+
+BATCH = "b"
+
+
+@pytest.fixture
+def queue(tmp_path):
+    q = work_queue.SQLiteQueue(str(tmp_path / "queue.sqlite"), visibility_sec=60, max_attempts=2)
+    q.add(BATCH, [(1, "u1"), (2, "u2"), (3, "u3")])
+    yield q
+    q.close()
+
+
+def test_add_is_idempotent(queue):
+    assert queue.add(BATCH, [(1, "u1"), (4, "u4")]) == 1
+    assert queue.progress(BATCH)["total"] == 4
+
+
+def test_each_item_leased_once(queue):
+    first = queue.lease(BATCH, "w1", 2)
+    second = queue.lease(BATCH, "w2", 2)
+    assert [i["index"] for i in first] == [1, 2]
+    assert [i["index"] for i in second] == [3]
+    assert queue.lease(BATCH, "w3", 1) == []
+    prog = queue.progress(BATCH)
+    assert prog["leased"] == 3 and prog["workers"] == 2
+
+
+def test_failed_attempt_is_retried_then_failed(queue, monkeypatch):
+    monkeypatch.setattr(work_queue, "RETRY_BACKOFF_SEC", 0)
+    item = queue.lease(BATCH, "w1", 1)[0]
+    assert queue.complete(BATCH, "w1", item["index"], {"error": "boom"}, ok=False) == "pending"
+    again = queue.lease(BATCH, "w1", 1)[0]
+    assert again["index"] == item["index"] and again["attempts"] == 2
+    assert queue.complete(BATCH, "w1", again["index"], {"error": "boom"}, ok=False) == "failed"
+    assert queue.progress(BATCH)["failed"] == 1
+
+
+def test_retry_waits_for_backoff(queue):
+    item = queue.lease(BATCH, "w1", 1)[0]
+    queue.complete(BATCH, "w1", item["index"], {"error": "boom"}, ok=False)
+    assert [i["index"] for i in queue.lease(BATCH, "w1", 3)] == [2, 3]
+
+
+def test_lost_lease_cannot_complete(tmp_path):
+    q = work_queue.SQLiteQueue(str(tmp_path / "q.sqlite"), visibility_sec=0.05, max_attempts=3)
+    q.add(BATCH, [(1, "u1")])
+    q.lease(BATCH, "slow", 1)
+    time.sleep(0.1)
+    taken = q.lease(BATCH, "fast", 1)
+    assert taken[0]["attempts"] == 2
+    assert q.heartbeat(BATCH, "slow", [1]) == 0
+    assert q.complete(BATCH, "slow", 1, {"saved_to": "x"}, ok=True) is None
+    assert q.complete(BATCH, "fast", 1, {"saved_to": "y"}, ok=True) == "done"
+    assert list(q.results(BATCH)) == [{"saved_to": "y"}]
+    q.close()
+
+
+def test_release_does_not_count_the_attempt(queue):
+    queue.lease(BATCH, "w1", 1)
+    queue.release(BATCH, "w1", [1])
+    item = queue.lease(BATCH, "w2", 1)[0]
+    assert item["index"] == 1 and item["attempts"] == 1
+
+
+def test_open_queue_schemes(tmp_path):
+    q = work_queue.open_queue(f"sqlite://{tmp_path / 'x.sqlite'}")
+    assert isinstance(q, work_queue.SQLiteQueue)
+    q.close()
+    with pytest.raises(ValueError):
+        work_queue.open_queue("redis://localhost")
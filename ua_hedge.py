@@ -0,0 +1,110 @@
+"""
+ua_hedge.py
+Hedged mobile/desktop user-agent attempts.
+
+Instead of giving the desktop UA a chance only after the mobile attempt has
+used its whole timeout, the second attempt is started HEDGE_DELAY_SEC after
+the first one (0 = both at once), or immediately once the first attempt
+fails. The first attempt that yields candidates wins and the other one is
+cancelled. UAStats keeps per-UA success rates and latencies so the UA that
+has been winning lately is started first.
+
+  XHS_HEDGE_DELAY   seconds before the hedge starts (default 6, -1 = sequential)
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+# --- Configuration ---
+HEDGE_DELAY_SEC = float(os.environ.get("XHS_HEDGE_DELAY", "6"))
+EWMA_ALPHA = 0.2
+
+
+class UAStats:
+    def __init__(self, keys=("mobile", "desktop")):
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict] = {k: self._blank() for k in keys}
+
+    @staticmethod
+    def _blank() -> Dict:
+        return {"attempts": 0, "successes": 0, "wins": 0, "cancelled": 0, "latency_ewma": None}
+
+    def record(self, key: str, ok: Optional[bool], latency: float, won: bool = False):
+        """ok=None records a cancelled attempt, which says nothing about the UA."""
+        with self._lock:
+            s = self._stats.setdefault(key, self._blank())
+            if ok is None:
+                s["cancelled"] += 1
+                return
+            s["attempts"] += 1
+            s["successes"] += bool(ok)
+            s["wins"] += bool(won)
+            if ok:
+                prev = s["latency_ewma"]
+                s["latency_ewma"] = latency if prev is None else prev + EWMA_ALPHA * (latency - prev)
+
+    def success_rate(self, key: str) -> float:
+        s = self._stats.get(key) or self._blank()
+        return (s["successes"] + 1) / (s["attempts"] + 2)  # Laplace prior keeps unseen UAs at 0.5
+
+    def order(self, keys: List[str]) -> List[str]:
+        """Most successful UA first; ties keep the given order (mobile first by default)."""
+        with self._lock:
+            return sorted(keys, key=lambda k: (-round(self.success_rate(k), 2), keys.index(k)))
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {k: dict(v, success_rate=round(self.success_rate(k), 4)) for k, v in self._stats.items()}
+
+
+_default_stats = UAStats()
+
+
+def get_default_stats() -> UAStats:
+    return _default_stats
+
+
+# --- hedging ---
+async def run_hedged(keys: List[str], attempt: Callable[[str], Awaitable[Tuple[bool, object]]],
+                     delay: float = HEDGE_DELAY_SEC, stats: Optional[UAStats] = None) -> Tuple[Optional[str], object]:
+    """Run attempt(key) for keys with hedging; return (winning key, value) or (None, last value)."""
+    stats = stats or _default_stats
+    pending = list(keys)
+    running: Dict[asyncio.Task, Tuple[str, float]] = {}
+    last_value = None
+
+    def launch():
+        key = pending.pop(0)
+        running[asyncio.ensure_future(attempt(key))] = (key, time.monotonic())
+
+    launch()
+    try:
+        while running:
+            timeout = delay if (pending and delay >= 0) else None
+            done, _ = await asyncio.wait(running.keys(), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                launch()  # hedge: the current attempt is taking too long
+                continue
+            for task in done:
+                key, started = running.pop(task)
+                try:
+                    ok, value = task.result()
+                except Exception as e:
+                    ok, value = False, e
+                stats.record(key, ok, time.monotonic() - started, won=ok)
+                if ok:
+                    return key, value
+                last_value = value
+            if pending and not running:
+                launch()  # the only attempt failed: start the next one right away
+        return None, last_value
+    finally:
+        for task, (key, started) in running.items():
+            task.cancel()
+            stats.record(key, None, time.monotonic() - started)
+        if running:
+            await asyncio.gather(*running.keys(), return_exceptions=True)
+
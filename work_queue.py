@@ -0,0 +1,247 @@
+"""
+work_queue.py
+Shared work queue for batches sharded across processes and machines.
+
+A coordinator (coordinator.py) loads {index, postUrl} items into a named
+batch; any number of workers (xhs_batch_download.py --worker) lease items,
+keep their leases alive with heartbeats and publish one result per item.
+
+  lease       an item is handed to one worker for visibility_sec; a lease
+              that is not extended by a heartbeat expires and the item is
+              handed out again (the crashed worker's attempt counts)
+  retries     a failed attempt goes back to pending after an exponential
+              backoff until max_attempts, then the item is failed
+  completion  only the worker holding the lease can complete an item, so a
+              worker that lost its lease cannot overwrite the new owner
+  cancel      pending and leased items of a batch become cancelled; a
+              worker still running one finds its lease gone
+  batches     optional per-batch metadata (created/started/cancelled), used
+              by the API's /jobs (jobs.py) so any server process can answer
+
+Backends are picked by URL scheme (QUEUE_BACKENDS); "sqlite" is the first.
+On a shared volume the SQLite file uses the rollback journal, not WAL,
+because WAL needs shared memory that network filesystems do not provide.
+
+  XHS_QUEUE                  queue URL (default sqlite://queue.sqlite; sqlite:///shared/queue.sqlite is absolute)
+  XHS_QUEUE_BATCH            batch name shared by coordinator and workers (default "default")
+  XHS_QUEUE_VISIBILITY_SEC   lease length (default 300)
+  XHS_QUEUE_HEARTBEAT_SEC    how often workers extend their leases (default 60)
+  XHS_QUEUE_MAX_ATTEMPTS     attempts per item before it is failed (default 3)
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# --- Configuration ---
+QUEUE_URL = os.environ.get("XHS_QUEUE", "sqlite://queue.sqlite")
+QUEUE_BATCH = os.environ.get("XHS_QUEUE_BATCH", "default")
+VISIBILITY_SEC = float(os.environ.get("XHS_QUEUE_VISIBILITY_SEC", "300"))
+HEARTBEAT_SEC = float(os.environ.get("XHS_QUEUE_HEARTBEAT_SEC", "60"))
+MAX_ATTEMPTS = int(os.environ.get("XHS_QUEUE_MAX_ATTEMPTS", "3"))
+RETRY_BACKOFF_SEC = 30
+RETRY_BACKOFF_MAX_SEC = 600
+INSERT_CHUNK = 1000
+
+STATUSES = ("pending", "leased", "done", "failed", "cancelled")
+
+
+class SQLiteQueue:
+    def __init__(self, path: str, visibility_sec: float = VISIBILITY_SEC, heartbeat_sec: float = HEARTBEAT_SEC,
+                 max_attempts: int = MAX_ATTEMPTS):
+        self.path = path
+        self.visibility_sec = visibility_sec
+        self.heartbeat_sec = heartbeat_sec
+        self.max_attempts = max(1, max_attempts)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, timeout=30, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=DELETE")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS items (
+            batch TEXT NOT NULL, idx INTEGER NOT NULL, post_url TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending', attempts INTEGER NOT NULL DEFAULT 0,
+            available_at REAL NOT NULL DEFAULT 0, lease_owner TEXT, lease_until REAL,
+            result TEXT, error TEXT, updated_at REAL,
+            PRIMARY KEY (batch, idx))""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS items_status ON items (batch, status, available_at)")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS batches (
+            batch TEXT PRIMARY KEY, created_at REAL NOT NULL, started_at REAL, cancelled_at REAL)""")
+
+    def _write(self, fn):
+        """Run fn(cursor) in one IMMEDIATE transaction, so concurrent workers never claim the same item."""
+        with self._lock:
+            cur = self._db.cursor()
+            cur.execute("BEGIN IMMEDIATE")
+            try:
+                out = fn(cur)
+            except BaseException:
+                cur.execute("ROLLBACK")
+                raise
+            cur.execute("COMMIT")
+            return out
+
+    # --- coordinator ---
+    def add(self, batch: str, items: Iterable[Tuple[int, str]]) -> int:
+        """Enqueue (index, postUrl) pairs; indices already in the batch are left alone. Returns the number added."""
+        added, chunk = 0, []
+
+        def flush(cur):
+            before = cur.execute("SELECT total_changes()").fetchone()[0]
+            cur.executemany("INSERT OR IGNORE INTO items (batch, idx, post_url, updated_at) VALUES (?, ?, ?, ?)", chunk)
+            return cur.execute("SELECT total_changes()").fetchone()[0] - before
+
+        for index, url in items:
+            chunk.append((batch, index, url, time.time()))
+            if len(chunk) >= INSERT_CHUNK:
+                added += self._write(flush); chunk = []
+        if chunk:
+            added += self._write(flush)
+        return added
+
+    def open_batch(self, batch: str):
+        """Record the batch's metadata row (lists it in active_batches while it has work)."""
+        self._write(lambda cur: cur.execute("INSERT OR IGNORE INTO batches (batch, created_at) VALUES (?, ?)", (batch, time.time())))
+
+    def batch_info(self, batch: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._db.execute("SELECT created_at, started_at, cancelled_at FROM batches WHERE batch = ?", (batch,)).fetchone()
+        return None if row is None else dict(zip(("created_at", "started_at", "cancelled_at"), row))
+
+    def active_batches(self, prefix: str = "") -> List[str]:
+        """Opened, uncancelled batches with pending or leased items, oldest first."""
+        with self._lock:
+            rows = self._db.execute("SELECT batch FROM batches b WHERE batch LIKE ? AND cancelled_at IS NULL AND EXISTS "
+                                    "(SELECT 1 FROM items i WHERE i.batch = b.batch AND i.status IN ('pending', 'leased')) "
+                                    "ORDER BY created_at", (prefix + "%",)).fetchall()
+        return [r[0] for r in rows]
+
+    def cancel(self, batch: str) -> Optional[int]:
+        """Cancel the batch's pending and leased items. Returns how many, or None for an unknown batch."""
+        def stop(cur):
+            now = time.time()
+            cur.execute("UPDATE batches SET cancelled_at = COALESCE(cancelled_at, ?) WHERE batch = ?", (now, batch))
+            if not cur.rowcount and cur.execute("SELECT 1 FROM items WHERE batch = ? LIMIT 1", (batch,)).fetchone() is None:
+                return None
+            cur.execute("UPDATE items SET status = 'cancelled', lease_owner = NULL, lease_until = NULL, updated_at = ? "
+                        "WHERE batch = ? AND status IN ('pending', 'leased')", (now, batch))
+            return cur.rowcount
+        return self._write(stop)
+
+    def purge(self, prefix: str, finished_before: float) -> int:
+        """Delete opened batches whose items all finished before finished_before. Returns the number deleted."""
+        def drop(cur):
+            rows = cur.execute("SELECT batch FROM batches b WHERE batch LIKE ? AND NOT EXISTS "
+                               "(SELECT 1 FROM items i WHERE i.batch = b.batch AND (i.status IN ('pending', 'leased') OR i.updated_at >= ?))",
+                               (prefix + "%", finished_before)).fetchall()
+            for (batch,) in rows:
+                cur.execute("DELETE FROM items WHERE batch = ?", (batch,))
+                cur.execute("DELETE FROM batches WHERE batch = ?", (batch,))
+            return len(rows)
+        return self._write(drop)
+
+    def progress(self, batch: str) -> Dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*), COALESCE(SUM(attempts), 0) FROM items WHERE batch = ? GROUP BY status",
+                                    (batch,)).fetchall()
+            workers = self._db.execute("SELECT COUNT(DISTINCT lease_owner) FROM items WHERE batch = ? AND status = 'leased' AND lease_until >= ?",
+                                       (batch, time.time())).fetchone()[0]
+        out = dict.fromkeys(STATUSES, 0)
+        attempts = 0
+        for status, count, tries in rows:
+            out[status] = count
+            attempts += tries
+        out.update(total=sum(out[s] for s in STATUSES), attempts=attempts, workers=workers)
+        return out
+
+    def results(self, batch: str) -> Iterator[Dict]:
+        """Latest result of every finished item, in index order."""
+        with self._lock:
+            rows = self._db.execute("SELECT idx, post_url, result, error FROM items WHERE batch = ? AND status IN ('done', 'failed') ORDER BY idx",
+                                    (batch,)).fetchall()
+        for index, url, result, error in rows:
+            yield json.loads(result) if result else {"postUrl": url, "index": index, "error": error}
+
+    def items(self, batch: str) -> List[Dict]:
+        """Every item of the batch with its status, attempts, last update and latest result, in index order."""
+        with self._lock:
+            rows = self._db.execute("SELECT idx, post_url, status, attempts, updated_at, result FROM items WHERE batch = ? ORDER BY idx",
+                                    (batch,)).fetchall()
+        return [{"index": index, "postUrl": url, "status": status, "attempts": tries, "updated_at": updated,
+                 "result": json.loads(result) if result else None} for index, url, status, tries, updated, result in rows]
+
+    # --- workers ---
+    def lease(self, batch: str, owner: str, n: int = 1) -> List[Dict]:
+        """Claim up to n ready items (pending and due, or leased with an expired lease)."""
+        def claim(cur):
+            now = time.time()
+            cur.execute("UPDATE items SET status = 'failed', error = 'lease_expired', lease_owner = NULL, updated_at = ? "
+                        "WHERE batch = ? AND status = 'leased' AND lease_until < ? AND attempts >= ?",
+                        (now, batch, now, self.max_attempts))
+            rows = cur.execute("SELECT idx, post_url, attempts FROM items WHERE batch = ? AND "
+                               "((status = 'pending' AND available_at <= ?) OR (status = 'leased' AND lease_until < ?)) "
+                               "ORDER BY idx LIMIT ?", (batch, now, now, n)).fetchall()
+            cur.executemany("UPDATE items SET status = 'leased', attempts = attempts + 1, lease_owner = ?, lease_until = ?, updated_at = ? "
+                            "WHERE batch = ? AND idx = ?", [(owner, now + self.visibility_sec, now, batch, idx) for idx, _, _ in rows])
+            if rows:
+                cur.execute("UPDATE batches SET started_at = ? WHERE batch = ? AND started_at IS NULL", (now, batch))
+            return [{"index": idx, "postUrl": url, "attempts": tries + 1} for idx, url, tries in rows]
+        return self._write(claim)
+
+    def heartbeat(self, batch: str, owner: str, indices: List[int]) -> int:
+        """Extend the owner's leases; returns how many are still held."""
+        if not indices:
+            return 0
+        def extend(cur):
+            until = time.time() + self.visibility_sec
+            marks = ",".join("?" * len(indices))
+            cur.execute(f"UPDATE items SET lease_until = ? WHERE batch = ? AND lease_owner = ? AND status = 'leased' AND idx IN ({marks})",
+                        [until, batch, owner] + list(indices))
+            return cur.rowcount
+        return self._write(extend)
+
+    def complete(self, batch: str, owner: str, index: int, result: Dict, ok: bool) -> Optional[str]:
+        """Publish an attempt's result. Returns the item's new status, or None if the lease was lost."""
+        def finish(cur):
+            row = cur.execute("SELECT attempts FROM items WHERE batch = ? AND idx = ? AND lease_owner = ? AND status = 'leased'",
+                              (batch, index, owner)).fetchone()
+            if row is None:
+                return None
+            now, attempts = time.time(), row[0]
+            status = "done" if ok else ("failed" if attempts >= self.max_attempts else "pending")
+            backoff = min(RETRY_BACKOFF_SEC * 2 ** (attempts - 1), RETRY_BACKOFF_MAX_SEC)
+            cur.execute("UPDATE items SET status = ?, available_at = ?, lease_owner = NULL, lease_until = NULL, result = ?, error = ?, updated_at = ? "
+                        "WHERE batch = ? AND idx = ?",
+                        (status, now + backoff if status == "pending" else now, json.dumps(result, ensure_ascii=False),
+                         result.get("error"), now, batch, index))
+            return status
+        return self._write(finish)
+
+    def release(self, batch: str, owner: str, indices: List[int]):
+        """Hand unfinished leases back without counting the attempt (clean worker shutdown)."""
+        if not indices:
+            return
+        def give_back(cur):
+            marks = ",".join("?" * len(indices))
+            cur.execute(f"UPDATE items SET status = 'pending', attempts = MAX(attempts - 1, 0), lease_owner = NULL, lease_until = NULL, "
+                        f"available_at = 0 WHERE batch = ? AND lease_owner = ? AND status = 'leased' AND idx IN ({marks})",
+                        [batch, owner] + list(indices))
+        self._write(give_back)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+QUEUE_BACKENDS = {"sqlite": SQLiteQueue}
+
+
+def open_queue(url: str = QUEUE_URL, **kwargs):
+    """Queue backend for a URL like sqlite:///abs/path.sqlite; a bare path means SQLite."""
+    scheme, sep, location = url.partition("://")
+    if not sep:
+        scheme, location = "sqlite", url
+    if scheme not in QUEUE_BACKENDS:
+        raise ValueError(f"unknown queue backend: {scheme}")
+    return QUEUE_BACKENDS[scheme](location, **kwargs)
@@ -5,268 +5,181 @@ Usage:
   python xhs_batch_download.py links.json
 Or:
   python xhs_batch_download.py --inline "['https://...','https://...']"
+Or, as one of many workers of a batch loaded by coordinator.py:
+  python xhs_batch_download.py --worker
+
+Links can also come from a JSONL file (one URL or {index, postUrl} per line)
+or from stdin with "-"; they are streamed, never loaded all at once.
+
+Extraction and downloads run on the shared engine (engine.py) that also
+serves the API. Results are appended to results.jsonl as they complete; a
+re-run skips indices that already have a saved file. Options:
+  --no-resume     process every link again
+  --compact       also write results.json at the end
+  --compact-only  only turn results.jsonl into results.json
+
+Workers lease items from the shared queue (work_queue.py, XHS_QUEUE /
+XHS_QUEUE_BATCH), heartbeat their leases and publish results to the queue
+until the batch is drained.
 """
 
 import asyncio
 import json
-import re
+import os
+import socket
 import sys
 import uuid
-import html
 from pathlib import Path
-from typing import List, Dict, Optional, Tuple
-
-import aiohttp
-from aiohttp import ClientTimeout
-from tqdm.asyncio import tqdm_asyncio
-from playwright.async_api import async_playwright, Page, Response
+from typing import Dict, Iterable, Iterator, Tuple
+
+from tqdm import tqdm
+
+from concurrency import EXTRACT_MAX, DOWNLOAD_MAX
+from debug_store import get_debug_store
+from engine import Engine, LIMITS
+from extract_cache import get_default_cache
+from media_store import get_media_store
+from probe import get_probe_cache
+from results_store import ResultsWriter, compact, is_done, load_completed
+from link_source import iter_items, open_source
+from ua_hedge import get_default_stats as get_ua_stats
+from seekin_api import get_default_store
+from work_queue import QUEUE_BATCH, open_queue
 
 # --- Configuration ---
-CONCURRENCY = 4
-DOWNLOAD_CONCURRENCY = 4
-SEEKIN_URL = "https://www.seekin.ai/xiaohongshu-video-downloader/"
-TIMEOUT_SEC = 90
-DOWNLOAD_FOLDER = Path("./downloads")
-DEBUG_FOLDER = Path("./debug")
+CONCURRENCY = 4  # browsers in the pool; stage limits adapt below EXTRACT_MAX / DOWNLOAD_MAX
+WORKERS = EXTRACT_MAX + DOWNLOAD_MAX  # links in flight across both stages
+QUEUE_FACTOR = 4  # links buffered ahead of the workers: WORKERS * QUEUE_FACTOR
 RESULTS_FILE = Path("./results.json")
-USER_AGENTS = {
-    "mobile": "Mozilla/5.0 (iPhone; CPU iPhone OS 15_0 like Mac OS X) AppleWebKit/605.1.15 (KHTML, like Gecko) Version/15.0 Mobile/15E148 Safari/604.1",
-    "desktop": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/115 Safari/537.36",
-}
-
-DOWNLOAD_FOLDER.mkdir(parents=True, exist_ok=True)
-DEBUG_FOLDER.mkdir(parents=True, exist_ok=True)
-
-VIDEO_EXT_RE = re.compile(r"\.(mp4|webm|m3u8|ts)(?:\?|$)", flags=re.I)
-SANITIZE_FILENAME_RE = re.compile(r'[^A-Za-z0-9 _\-\.\(\)\[\]]+')
-JS_TITLE_RE = re.compile(r"""title\s*:\s*(['"])(.*?)\1""", flags=re.IGNORECASE | re.DOTALL)
-
-
-# --- Helpers ---
-async def head_size(session: aiohttp.ClientSession, url: str, timeout: int = 8) -> Optional[int]:
-    headers = {"User-Agent": USER_AGENTS["desktop"], "Referer": "https://www.xiaohongshu.com/"}
-    try:
-        async with session.head(url, headers=headers, timeout=ClientTimeout(total=timeout), allow_redirects=True) as resp:
-            cl = resp.headers.get("Content-Length")
-            if cl and cl.isdigit(): return int(cl)
-    except: pass
-    try:
-        hdrs = headers.copy(); hdrs["Range"] = "bytes=0-0"
-        async with session.get(url, headers=hdrs, timeout=ClientTimeout(total=timeout), allow_redirects=True) as resp:
-            cr = resp.headers.get("Content-Range")
-            if cr and "/" in cr:
-                total = cr.split("/")[-1]
-                if total.isdigit(): return int(total)
-            cl2 = resp.headers.get("Content-Length")
-            if cl2 and cl2.isdigit() and int(cl2) > 1: return int(cl2)
-    except: pass
-    return None
-
-
-async def download_file(session: aiohttp.ClientSession, url: str, out_path: Path) -> Tuple[bool, Optional[str]]:
-    try:
-        timeout = ClientTimeout(total=0)
-        headers = {"User-Agent": USER_AGENTS["desktop"], "Referer": "https://www.xiaohongshu.com/"}
-        async with session.get(url, headers=headers, timeout=timeout) as resp:
-            resp.raise_for_status()
-            with out_path.open("wb") as fh:
-                async for chunk in resp.content.iter_chunked(1 << 14):
-                    fh.write(chunk)
-        return True, None
-    except Exception as e:
-        return False, str(e)
-
-
-def sanitize_filename(s: str, fallback: str = "video") -> str:
-    if not s: return fallback
-    s = html.unescape(s).strip()
-    s = SANITIZE_FILENAME_RE.sub("_", s)
-    return s[:180].rstrip("_")
-
-
-def extract_title_from_text(text: str) -> Optional[str]:
-    if not text: return None
-    m = JS_TITLE_RE.search(text)
-    if m: return m.group(2).strip()
-    return None
-
-
-def unique_path_for(path: Path) -> Path:
-    base, ext, parent = path.stem, path.suffix, path.parent
-    candidate, i = path, 1
-    while candidate.exists():
-        candidate = parent / f"{base}-{i}{ext}"; i += 1
-    return candidate
-
-
-# --- Seekin extraction ---
-async def try_extract_from_seekin(page: Page, post_url: str, collector: List[str], meta_out: Dict):
-    async def on_response(resp: Response):
-        try:
-            ct = (resp.headers.get("content-type") or "").lower()
-            text = await resp.text()
-            if not text: return
-            if "application/json" in ct or resp.url.lower().endswith(".json"):
-                try: j = json.loads(text)
-                except: 
-                    title_fallback = extract_title_from_text(text)
-                    if title_fallback and not meta_out.get("title"): meta_out["title"] = title_fallback
-                    return
-                data = j.get("data") or j.get("result") or j.get("payload")
-                if data and isinstance(data, dict):
-                    title = data.get("title") or data.get("name") or data.get("desc")
-                    if title and not meta_out.get("title"): meta_out["title"] = title
-                    medias = data.get("medias") or data.get("media") or data.get("urls")
-                    if medias and isinstance(medias, list):
-                        for m in medias:
-                            candidate_url = None
-                            if isinstance(m, dict):
-                                candidate_url = m.get("url") or m.get("uri") or m.get("src") or m.get("playUrl")
-                                if not candidate_url:
-                                    for v in m.values():
-                                        if isinstance(v, str) and VIDEO_EXT_RE.search(v):
-                                            candidate_url = v; break
-                            elif isinstance(m, str) and VIDEO_EXT_RE.search(m):
-                                candidate_url = m
-                            if candidate_url and candidate_url not in collector: collector.append(candidate_url)
-            else:
-                if VIDEO_EXT_RE.search(resp.url) and resp.url not in collector:
-                    collector.append(resp.url)
-        except: pass
-
-    page.on("response", on_response)
-    try: await page.goto(SEEKIN_URL, wait_until="networkidle")
-    except: await page.goto(SEEKIN_URL)
-    try:
-        inp = await page.query_selector('input[type="text"], input[placeholder], textarea')
-        if inp:
-            await inp.fill(post_url)
-            btn = await page.query_selector('button[type="submit"], button:has-text("解析"), button:has-text("Download"), button[class*="btn"]')
-            if btn:
-                try: await btn.click()
-                except: await page.keyboard.press("Enter")
-            else: await page.keyboard.press("Enter")
-        else:
-            await page.goto(SEEKIN_URL + "?q=" + post_url)
-    except: pass
-
-    waited, poll = 0.0, 0.5
-    while waited < TIMEOUT_SEC:
-        if collector or meta_out.get("title"): break
-        await page.wait_for_timeout(int(poll*1000)); waited += poll
-
-    if not collector:
-        try:
-            vids = await page.query_selector_all("video")
-            for v in vids:
-                src = await v.get_attribute("src")
-                if src and src not in collector: collector.append(src)
-                for s in await v.query_selector_all("source"):
-                    s2 = await s.get_attribute("src")
-                    if s2 and s2 not in collector: collector.append(s2)
-        except: pass
-    return collector, meta_out
-
-
-# --- worker ---
-async def worker(playwright, session: aiohttp.ClientSession, url: str, index: int, semaphore: asyncio.Semaphore) -> Dict:
-    result = {"postUrl": url, "index": index, "found": False, "video_url": None, "error": None, "candidates": [], "caption": None, "saved_to": None}
-    async with semaphore:
-        browser = await playwright.chromium.launch(headless=True, args=["--no-sandbox", "--disable-setuid-sandbox"])
-        try:
-            for ua in (USER_AGENTS["mobile"], USER_AGENTS["desktop"]):
-                context = await browser.new_context(user_agent=ua, viewport={"width":390,"height":844} if ua==USER_AGENTS["mobile"] else {"width":1280,"height":800})
-                page = await context.new_page()
-                try:
-                    candidates, meta = [], {}
-                    await try_extract_from_seekin(page, url, candidates, meta)
-
-                    uid = uuid.uuid4().hex
-                    try:
-                        html_file = DEBUG_FOLDER / f"{uid}.html"
-                        html_file.write_text(await page.content(), encoding="utf-8")
-                        png_file = DEBUG_FOLDER / f"{uid}.png"
-                        await page.screenshot(path=str(png_file), full_page=True)
-                    except: pass
-
-                    normalized = list(dict.fromkeys(candidates))
-                    if meta.get("medias") and isinstance(meta["medias"], list):
-                        for m in meta["medias"]:
-                            if isinstance(m, str) and m not in normalized and VIDEO_EXT_RE.search(m): normalized.append(m)
-                            elif isinstance(m, dict):
-                                candidate_url = m.get("url") or m.get("src") or m.get("playUrl")
-                                if candidate_url and candidate_url not in normalized: normalized.append(candidate_url)
-                    if not normalized: await context.close(); continue
-
-                    sizes = {}
-                    async def measure(u):
-                        if u.lower().endswith(".m3u8"): sizes[u] = None; return
-                        try: sizes[u] = await head_size(session, u, timeout=6)
-                        except: sizes[u] = None
-                    await asyncio.gather(*(measure(u) for u in normalized))
-
-                    cand_info = [{"url": u, "size_bytes": sizes.get(u)} for u in normalized]
-                    result["candidates"] = cand_info
-
-                    sized = [c for c in cand_info if c["size_bytes"] and re.search(r"\.(mp4|webm)$", c["url"], flags=re.I)]
-                    chosen = min(sized, key=lambda x:x["size_bytes"]) if sized else (cand_info[0] if cand_info else None)
-                    if not chosen: result["error"]="no_candidate_chosen"; await context.close(); break
-
-                    chosen_url = chosen["url"]
-                    result["video_url"] = chosen_url; result["found"]=True
-                    caption = meta.get("title") or meta.get("name")
-                    result["caption"] = caption
-
-                    base_name = sanitize_filename(caption or f"xhs_{index}")
-                    ext = Path(chosen_url.split("?")[0]).suffix or ".mp4"
-                    out_path = unique_path_for(DOWNLOAD_FOLDER / f"{index} - {base_name}{ext}")
-
-                    ok, err = await download_file(session, chosen_url, out_path)
-                    if not ok: result["error"]=f"download_failed: {err}"
-                    else: result["saved_to"]=str(out_path.resolve())
-
-                    await context.close(); break
-                except Exception as e: result["error"]=str(e); await context.close()
-        finally:
-            try: await browser.close()
-            except: pass
-    return result
+RESULTS_JSONL = Path("./results.jsonl")
+QUEUE_POLL_SEC = 5  # idle workers re-check the queue for retries and expired leases
 
 
 # --- main ---
-async def main(urls: List[str]):
-    timeout = aiohttp.ClientTimeout(total=0)
-    conn = aiohttp.TCPConnector(limit=DOWNLOAD_CONCURRENCY, ssl=False)
-    results = []
-    async with aiohttp.ClientSession(timeout=timeout, connector=conn) as session:
-        async with async_playwright() as p:
-            sem = asyncio.Semaphore(CONCURRENCY)
-            tasks = [worker(p, session, url, i+1, sem) for i, url in enumerate(urls)]
-            for coro in tqdm_asyncio.as_completed(tasks, total=len(tasks)):
-                res = await coro
-                results.append(res)
-                print(json.dumps(res, ensure_ascii=False))
-    try: RESULTS_FILE.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
-    except Exception as e: print("Failed to write results.json:", e)
-    print(f"✅ Wrote results to {RESULTS_FILE.resolve()}")
-    return results
+async def main(urls: Iterable, resume: bool = True, compact_results: bool = False) -> Dict:
+    """urls: URL strings (indexed by position) or (index, url) pairs, e.g. from link_source."""
+    done = load_completed(RESULTS_JSONL) if resume else set()
+    total = len(urls) if hasattr(urls, "__len__") else None
+    summary = {"total": 0, "skipped": 0, "succeeded": 0, "failed": 0}
+    if done: print(f"Resuming: {len(done)} indices already done in {RESULTS_JSONL}")
+    queue: asyncio.Queue = asyncio.Queue(maxsize=WORKERS * QUEUE_FACTOR)
+
+    async def producer():
+        it, pos, end = iter(urls), 0, object()
+        while True:
+            # stdin, a slow pipe or a big JSON file may block: read in a thread, not on the loop
+            item = await asyncio.to_thread(next, it, end)
+            if item is end: break
+            pos += 1
+            index, url = item if isinstance(item, tuple) else (pos, str(item))
+            summary["total"] += 1
+            if index in done: summary["skipped"] += 1; pbar.update(1); continue
+            await queue.put((index, url))
+        for _ in range(WORKERS): await queue.put(None)
+
+    async def consumer():
+        while True:
+            item = await queue.get()
+            if item is None: return
+            res = await engine.process(item[1], item[0])
+            writer.write(res)
+            summary["succeeded" if res.get("saved_to") else "failed"] += 1
+            pbar.set_postfix_str(LIMITS.describe(), refresh=False)
+            pbar.update(1)
+            print(json.dumps(res, ensure_ascii=False))
+
+    with ResultsWriter(RESULTS_JSONL) as writer:
+        async with Engine(pool_size=CONCURRENCY) as engine:
+            with tqdm(total=total, unit="url") as pbar:
+                tasks = [asyncio.ensure_future(producer())] + [asyncio.ensure_future(consumer()) for _ in range(WORKERS)]
+                try: await asyncio.gather(*tasks)
+                finally:
+                    for t in tasks: t.cancel()
+    print("Extraction cache:", json.dumps(get_default_cache().stats()))
+    print("Probe cache:", json.dumps(get_probe_cache().stats()))
+    print("Seekin API replay:", json.dumps(get_default_store().stats()))
+    print("User agents:", json.dumps(get_ua_stats().snapshot()))
+    print("Concurrency limits:", json.dumps(LIMITS.snapshot()))
+    print("Debug artifacts:", json.dumps(get_debug_store().stats()))
+    print("Media store:", json.dumps(get_media_store().stats()))
+    print(f"✅ Appended {writer.count} results to {RESULTS_JSONL.resolve()}")
+    if compact_results:
+        try:
+            n = compact(RESULTS_JSONL, RESULTS_FILE)
+            print(f"✅ Wrote {n} results to {RESULTS_FILE.resolve()}")
+        except Exception as e: print("Failed to write results.json:", e)
+    return summary
+
+
+# --- queue worker ---
+async def run_queue_worker(queue, batch: str = QUEUE_BATCH) -> Dict:
+    """Lease items of a shared batch until nothing is pending or leased, publishing every result to the queue."""
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+    held = set()
+    summary = {"worker": worker_id, "processed": 0, "succeeded": 0, "retried": 0, "failed": 0, "lease_lost": 0}
+    print(f"Worker {worker_id} on batch {batch!r}:", json.dumps(queue.progress(batch)))
+
+    async def heartbeat():
+        while True:
+            await asyncio.sleep(queue.heartbeat_sec)
+            if held:
+                try: await asyncio.to_thread(queue.heartbeat, batch, worker_id, list(held))
+                except Exception as e: print("Heartbeat failed:", e)
+
+    async def consumer():
+        while True:
+            items = await asyncio.to_thread(queue.lease, batch, worker_id, 1)
+            if not items:
+                prog = await asyncio.to_thread(queue.progress, batch)
+                if not prog["pending"] and not prog["leased"]: return
+                await asyncio.sleep(QUEUE_POLL_SEC); continue
+            item = items[0]
+            held.add(item["index"])
+            try:
+                res = await engine.process(item["postUrl"], item["index"])
+            except Exception as e:
+                res = {"postUrl": item["postUrl"], "index": item["index"], "error": str(e)}
+            res.update(worker=worker_id, attempt=item["attempts"])
+            status = await asyncio.to_thread(queue.complete, batch, worker_id, item["index"], res, is_done(res))
+            held.discard(item["index"])
+            summary["processed"] += 1
+            summary[{None: "lease_lost", "done": "succeeded", "pending": "retried"}.get(status, "failed")] += 1
+            pbar.set_postfix_str(LIMITS.describe(), refresh=False)
+            pbar.update(1)
+            print(json.dumps(res, ensure_ascii=False))
+
+    async with Engine(pool_size=CONCURRENCY) as engine:
+        with tqdm(unit="url") as pbar:
+            beat = asyncio.ensure_future(heartbeat())
+            tasks = [asyncio.ensure_future(consumer()) for _ in range(WORKERS)]
+            try: await asyncio.gather(*tasks)
+            finally:
+                for t in tasks + [beat]: t.cancel()
+                queue.release(batch, worker_id, list(held))  # hand unfinished items to the other workers
+    print("Concurrency limits:", json.dumps(LIMITS.snapshot()))
+    print("Media store:", json.dumps(get_media_store().stats()))
+    print(f"✅ Worker {worker_id} done:", json.dumps(summary))
+    return summary
 
 
 # --- CLI ---
-def load_urls_from_arg(argv) -> List[str]:
-    if len(argv)<2: sys.exit("Usage: python xhs_batch_download.py links.json or --inline [...]")
+def load_urls_from_arg(argv) -> Iterator[Tuple[int, str]]:
+    """Stream (index, url) pairs from a links file (JSON array or JSONL), stdin ("-") or --inline."""
+    if len(argv)<2: sys.exit("Usage: python xhs_batch_download.py [--no-resume] [--compact] links.json|links.jsonl|- or --inline [...]")
     arg = argv[1]
-    if arg=="--inline": return [str(x) for x in json.loads(argv[2])]
-    else:
-        j = json.loads(Path(arg).read_text(encoding="utf-8"))
-        out = []
-        for it in j:
-            if isinstance(it,str): out.append(it)
-            elif isinstance(it,dict) and "postUrl" in it: out.append(it["postUrl"])
-            else: out.append(str(it))
-        return out
+    if arg=="--inline": return iter_items(json.loads(argv[2]))
+    return open_source(arg)
 
 
 if __name__=="__main__":
-    urls = load_urls_from_arg(sys.argv)
-    asyncio.run(main(urls))
+    flags = {"--no-resume", "--compact", "--compact-only", "--worker"}
+    opts = {a for a in sys.argv[1:] if a in flags}
+    argv = [a for a in sys.argv if a not in flags]
+    if "--compact-only" in opts:
+        print(f"✅ Wrote {compact(RESULTS_JSONL, RESULTS_FILE)} results to {RESULTS_FILE.resolve()}")
+        sys.exit(0)
+    if "--worker" in opts:
+        asyncio.run(run_queue_worker(open_queue()))
+        sys.exit(0)
+    urls = load_urls_from_arg(argv)
+    asyncio.run(main(urls, resume="--no-resume" not in opts, compact_results="--compact" in opts))